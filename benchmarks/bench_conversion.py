@@ -0,0 +1,169 @@
+# Conversion benchmark: generates a synthetic report and times the pbix <-> src conversions.
+#
+#   python -m benchmarks.bench_conversion run --sections 50 --visuals-per-section 40 --datamodel-mb 50
+#   python -m benchmarks.bench_conversion compare benchmarks/results/a.json benchmarks/results/b.json
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import typer
+from typing_extensions import Annotated
+
+from benchmarks.synthetic_report import generate_src_report
+from powercicd.powerbi.build_cache import PbixBuildCache
+from powercicd.powerbi.powerbi_utils import convert_pbix_to_src_code, convert_src_code_to_pbix
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+log = logging.getLogger(__name__)
+
+_FILE_DIR    = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT    = os.path.normpath(f"{_FILE_DIR}/..")
+RESULTS_DIR  = f"{_FILE_DIR}/results"
+CASES        = ["export", "export_version_bump_cached", "import"]
+
+POWERAPPS_ID_BY_NAME = {
+    "my_powerapps_app": "b944ef36-81f7-482c-a6d6-f29c9f89eabc"
+}
+
+bench_cli = typer.Typer()
+
+
+def get_peak_rss_bytes(who) -> int | None:
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def run_case(case: str, work_dir: str, layout_format: str, layout_workers: int) -> dict:
+    # executed in a fresh process, so that the peak RSS only covers this case
+    logging.disable(logging.INFO)
+    src_folder  = f"{work_dir}/src"
+    pbix_file   = f"{work_dir}/report.pbix"
+    case_folder = f"{work_dir}/{case}"
+    shutil.rmtree(case_folder, ignore_errors=True)
+    os.makedirs(case_folder)
+
+    if case == "export":
+        start = time.perf_counter()
+        convert_src_code_to_pbix(src_folder, f"{case_folder}/report.pbix", f"{case_folder}/tmp", POWERAPPS_ID_BY_NAME, "1.0.0", workers=layout_workers)
+    elif case == "export_version_bump_cached":
+        build_cache = PbixBuildCache(f"{case_folder}/build_cache")
+        convert_src_code_to_pbix(src_folder, f"{case_folder}/warmup.pbix", f"{case_folder}/tmp", POWERAPPS_ID_BY_NAME, "1.0.0", build_cache, workers=layout_workers)
+        start = time.perf_counter()
+        convert_src_code_to_pbix(src_folder, f"{case_folder}/report.pbix", f"{case_folder}/tmp", POWERAPPS_ID_BY_NAME, "1.0.1", build_cache, workers=layout_workers)
+    elif case == "import":
+        start = time.perf_counter()
+        convert_pbix_to_src_code(pbix_file, f"{case_folder}/src", f"{case_folder}/tmp", layout_format=layout_format, workers=layout_workers)
+    else:
+        raise ValueError(f"Unknown benchmark case '{case}'. Available cases: {CASES}")
+    seconds = time.perf_counter() - start
+
+    return {
+        "case"                    : case,
+        "seconds"                 : seconds,
+        "peak_rss_bytes"          : get_peak_rss_bytes(resource.RUSAGE_SELF) if resource else None,
+        "peak_children_rss_bytes" : get_peak_rss_bytes(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+def get_git_commit() -> str | None:
+    result = subprocess.run(["git", "-C", REPO_ROOT, "rev-parse", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+@bench_cli.command()
+def run(
+    sections: Annotated[int, typer.Option(help="Number of report pages")] = 20,
+    visuals_per_section: Annotated[int, typer.Option(help="Number of visual containers per page")] = 50,
+    datamodel_mb: Annotated[float, typer.Option(help="Size of the synthetic DataModel blob in MB")] = 10,
+    repeat: Annotated[int, typer.Option(help="Number of measurements per case")] = 3,
+    layout_format: Annotated[str, typer.Option(help="The src layout format used by the import case: single or sharded")] = "single",
+    layout_workers: Annotated[int, typer.Option(help="Number of worker processes for the embedded JSONs")] = 1,
+    cases: Annotated[list[str], typer.Option(help=f"The cases to run. Available: {CASES}")] = None,
+    work_dir: Annotated[str, typer.Option(help="Folder for the generated report and conversion outputs")] = f"{_FILE_DIR}/work",
+    output: Annotated[str, typer.Option(help="Result file. Default: benchmarks/results/<timestamp>-<commit>.json")] = None,
+):
+    cases = cases or CASES
+    parameters = {
+        "sections"            : sections,
+        "visuals_per_section" : visuals_per_section,
+        "datamodel_mb"        : datamodel_mb,
+        "repeat"              : repeat,
+        "layout_format"       : layout_format,
+        "layout_workers"      : layout_workers,
+    }
+    log.info(f"Generating synthetic report in '{work_dir}': {parameters}")
+    generate_src_report(f"{work_dir}/src", sections, visuals_per_section, int(datamodel_mb * 1024 * 1024))
+    convert_src_code_to_pbix(f"{work_dir}/src", f"{work_dir}/report.pbix", f"{work_dir}/tmp", POWERAPPS_ID_BY_NAME, "1.0.0")
+
+    results = []
+    for case in cases:
+        for i in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, case, work_dir, layout_format, layout_workers).result()
+            log.info(f"{case} #{i + 1}: {result['seconds']:.3f}s, peak RSS {result['peak_rss_bytes']}")
+            results.append(result)
+
+    summary = {}
+    for case in cases:
+        seconds = [r["seconds"] for r in results if r["case"] == case]
+        summary[case] = {"min": min(seconds), "median": statistics.median(seconds), "max": max(seconds)}
+
+    commit = get_git_commit()
+    report = {
+        "commit"     : commit,
+        "timestamp"  : datetime.now().isoformat(),
+        "python"     : sys.version,
+        "platform"   : platform.platform(),
+        "parameters" : parameters,
+        "results"    : results,
+        "summary"    : summary,
+    }
+    if output is None:
+        output = f"{RESULTS_DIR}/{datetime.now().strftime('%Y%m%d-%H%M%S')}-{(commit or 'nogit')[:10]}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    log.info(f"Results written to '{output}'")
+    for case, stats in summary.items():
+        typer.echo(f"{case:30} median {stats['median']:.3f}s (min {stats['min']:.3f}s, max {stats['max']:.3f}s)")
+
+
+@bench_cli.command()
+def compare(
+    baseline: Annotated[str, typer.Argument(help="The result file of the baseline run")],
+    candidate: Annotated[str, typer.Argument(help="The result file of the candidate run")],
+):
+    with open(baseline, 'r', encoding='utf-8') as f:
+        baseline_report = json.load(f)
+    with open(candidate, 'r', encoding='utf-8') as f:
+        candidate_report = json.load(f)
+    if baseline_report["parameters"] != candidate_report["parameters"]:
+        typer.echo(f"Warning: the runs have different parameters: {baseline_report['parameters']} vs {candidate_report['parameters']}")
+
+    for case, candidate_stats in candidate_report["summary"].items():
+        baseline_stats = baseline_report["summary"].get(case)
+        if baseline_stats is None:
+            typer.echo(f"{case:30} {candidate_stats['median']:.3f}s (no baseline)")
+            continue
+        change = (candidate_stats["median"] / baseline_stats["median"] - 1) * 100
+        typer.echo(f"{case:30} {baseline_stats['median']:.3f}s -> {candidate_stats['median']:.3f}s ({change:+.1f}%)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    bench_cli()
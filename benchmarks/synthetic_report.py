@@ -0,0 +1,76 @@
+import copy
+import json
+import os
+import random
+import shutil
+
+from powercicd.powerbi.file_utils import iter_files_sorted
+
+_FILE_DIR       = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_FOLDER = os.path.normpath(f"{_FILE_DIR}/../doc/examples/my_project/my_report/src")
+
+LAYOUT_CODE_ENTRY = "Report/Layout.json"
+DATAMODEL_ENTRY   = "DataModel"
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def write_random_blob(file_path: str, size_bytes: int, rng: random.Random):
+    # the data model is an opaque, already compressed blob: random bytes are a realistic stand-in
+    with open(file_path, 'wb') as f:
+        remaining = size_bytes
+        while remaining > 0:
+            chunk_size = min(remaining, WRITE_BUFFER_SIZE)
+            f.write(rng.randbytes(chunk_size))
+            remaining -= chunk_size
+
+
+def generate_layout(template_layout: dict, sections: int, visuals_per_section: int, rng: random.Random) -> dict:
+    template_section  = template_layout["sections"][0]
+    template_visuals  = template_section["visualContainers"]
+    layout            = {key: value for key, value in template_layout.items() if key != "sections"}
+    layout["sections"] = []
+    for section_idx in range(sections):
+        section = {key: copy.deepcopy(value) for key, value in template_section.items() if key != "visualContainers"}
+        section["id"]          = section_idx
+        section["name"]        = f"ReportSection{section_idx:08x}"
+        section["displayName"] = f"Page {section_idx + 1}"
+        section["ordinal"]     = section_idx
+        section["visualContainers"] = []
+        for visual_idx in range(visuals_per_section):
+            # cycling through the template visuals keeps the textboxes and the placeholder alt-texts
+            # ([[[report_version]]], [[[powerapps:...]]]) of the example report
+            visual_container = copy.deepcopy(template_visuals[visual_idx % len(template_visuals)])
+            visual_container["config"]["name"] = f"{section_idx:08x}{visual_idx:012x}"
+            visual_container["x"] = rng.uniform(0, section["width"])
+            visual_container["y"] = rng.uniform(0, section["height"])
+            visual_container["z"] = visual_idx
+            section["visualContainers"].append(visual_container)
+        layout["sections"].append(section)
+    return layout
+
+
+def generate_src_report(
+    target_folder        : str,
+    sections             : int,
+    visuals_per_section  : int,
+    datamodel_size_bytes : int,
+    template_folder      : str = TEMPLATE_FOLDER,
+    seed                 : int = 0,
+):
+    rng = random.Random(seed)
+    if os.path.exists(target_folder):
+        shutil.rmtree(target_folder)
+
+    for abs_path, rel_path in iter_files_sorted(template_folder):
+        target_path = f"{target_folder}/{rel_path}"
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if rel_path == LAYOUT_CODE_ENTRY:
+            with open(abs_path, 'r', encoding='utf-8') as f:
+                template_layout = json.load(f)
+            layout = generate_layout(template_layout, sections, visuals_per_section, rng)
+            with open(target_path, 'w', encoding='utf-8') as f:
+                json.dump(layout, f, indent=2, ensure_ascii=False)
+        elif rel_path == DATAMODEL_ENTRY:
+            write_random_blob(target_path, datamodel_size_bytes, rng)
+        else:
+            shutil.copyfile(abs_path, target_path)
@@ -1,17 +1,28 @@
 # %%
+import functools
+import hashlib
+import json
 import logging
 import os
 import re
-from datetime import datetime
+import sys
+from typing import TYPE_CHECKING, Callable
 
 import typer
 from typing_extensions import Annotated
 
-import powercicd.powerbi.powerbi_utils as powerbi_utils
+# the cloud (requests, azure, selenium) and conversion modules are imported by the commands needing them: the local
+# commands start without them. unit_tests/test_cli_import_time.py guards it
 from powercicd.config import get_project_config
+from powercicd.powerbi.api_defaults import DEFAULT_CLEANUP_WORKERS, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE
 from powercicd.powerbi.config import PowerBiComponentConfig
-from powercicd.powerbi.powerbi_client import PowerBiWebClient
+from powercicd.powerbi.gateway_datasources import DEFAULT_GATEWAY_CACHE_TTL_SECONDS
 from powercicd.shared.config import ProjectConfig
+from powercicd.shared.project_dirs import get_build_cache, get_gateway_cache_dir, get_tmp_dir
+import powercicd.daemon as daemon
+
+if TYPE_CHECKING:
+    from powercicd.powerbi.powerbi_client import PowerBiWebClient
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -20,13 +31,39 @@ log = logging.getLogger(__name__)
 main_cli = typer.Typer()
 powerbi_cli = typer.Typer()
 main_cli.add_typer(powerbi_cli, name="powerbi")
+serve_cli = typer.Typer()
+
+# clients kept warm between the commands by the `pow serve` daemon (None: a new client per command)
+powerbi_clients : dict[tuple, "PowerBiWebClient"] | None = None
+
 
+def get_credential_env_hash() -> str:
+    # a client is only reused by the commands with the same identity
+    credential_env = sorted((key, value) for key, value in os.environ.items() if key.startswith(daemon.CREDENTIAL_ENV_VAR_PREFIXES))
+    return hashlib.sha256(json.dumps(credential_env).encode("utf-8")).hexdigest()
 
-def get_tmp_dir(project_root, suffix):
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
-    tmp_dir = f"{project_root}/temp/{timestamp}-{suffix}"
-    os.makedirs(tmp_dir, exist_ok=True)
-    return tmp_dir
+
+def get_powerbi_client(
+    tenant            : str,
+    keep_browser_open : bool,
+    http_pool_size    : int = DEFAULT_POOL_SIZE,
+    http_max_retries  : int = DEFAULT_MAX_RETRIES,
+) -> "PowerBiWebClient":
+    from powercicd.powerbi.powerbi_client import PowerBiWebClient
+
+    key = (tenant, keep_browser_open, http_pool_size, http_max_retries, get_credential_env_hash())
+    if powerbi_clients is not None and key in powerbi_clients:
+        # token, connection pool, metadata caches and (kept open) browser of the previous commands
+        return powerbi_clients[key]
+    pbi = PowerBiWebClient(
+        tenant            = tenant,
+        keep_browser_open = keep_browser_open,
+        http_pool_size    = http_pool_size,
+        http_max_retries  = http_max_retries,
+    )
+    if powerbi_clients is not None:
+        powerbi_clients[key] = pbi
+    return pbi
 
 
 @main_cli.callback(no_args_is_help=True)
@@ -38,9 +75,13 @@ def shared_to_all_commands(
     project_dir : Annotated[str, typer.Option(
         help="The project directory to work on",
         prompt=False
-    )] = None
+    )] = None,
+    config_snapshot : Annotated[bool, typer.Option(
+        help="Reuse the validated configuration of the previous run, as long as no configuration file changed",
+        prompt=False, envvar="CONFIG_SNAPSHOT"
+    )] = True,
 ):
-    ctx.obj = get_project_config(stage, lookup_path=project_dir)
+    ctx.obj = get_project_config(stage, lookup_path=project_dir, use_snapshot=config_snapshot)
     ctx.ensure_object(ProjectConfig)
 
 
@@ -54,7 +95,7 @@ def login(
     )]
 ):
     project_config: ProjectConfig = ctx.obj
-    pbi = PowerBiWebClient(tenant=project_config.tenant, keep_browser_open=keep_browser_open)
+    pbi = get_powerbi_client(tenant=project_config.tenant, keep_browser_open=keep_browser_open)
     pbi.login_in_browser()
     pbi.close_browser()
 
@@ -74,8 +115,51 @@ def deploy(
     keep_browser_open: Annotated[bool, typer.Option(
         help="Keep the browser open after deployment (for debugging purposes)",
         prompt=False, envvar="KEEP_BROWSER_OPEN"
-    )] = False
+    )] = False,
+    build_cache: Annotated[bool, typer.Option(
+        help="Reuse the pbix files built from an unchanged src folder",
+        prompt=False, envvar="BUILD_CACHE"
+    )] = True,
+    layout_trace: Annotated[bool, typer.Option(
+        help="Record the changes of each layout transformation step in the temp folder (for debugging purposes)",
+        prompt=False, envvar="LAYOUT_TRACE"
+    )] = False,
+    layout_trace_gzip: Annotated[bool, typer.Option(
+        help="Compress the recorded layout transformation steps with gzip",
+        prompt=False, envvar="LAYOUT_TRACE_GZIP"
+    )] = False,
+    layout_workers: Annotated[int, typer.Option(
+        help="Number of worker processes decoding/encoding the JSON strings embedded in the report layout (1: serial)",
+        prompt=False, envvar="LAYOUT_WORKERS"
+    )] = 1,
+    http_pool_size: Annotated[int, typer.Option(
+        help="Maximum number of kept-alive connections to the Power BI API",
+        prompt=False, envvar="HTTP_POOL_SIZE"
+    )] = DEFAULT_POOL_SIZE,
+    http_max_retries: Annotated[int, typer.Option(
+        help="Maximum number of retries of a Power BI API call failing with a throttling (429) or server (5xx) error",
+        prompt=False, envvar="HTTP_MAX_RETRIES"
+    )] = DEFAULT_MAX_RETRIES,
+    concurrency: Annotated[int, typer.Option(
+        help="Number of reports deployed at once",
+        prompt=False, envvar="DEPLOY_CONCURRENCY", min=1
+    )] = 1,
+    prefetch: Annotated[int, typer.Option(
+        help="Number of built pbix files waiting for their deployment: the next reports are built while the previous ones are deployed",
+        prompt=False, envvar="DEPLOY_PREFETCH", min=1
+    )] = 1,
+    force: Annotated[bool, typer.Option(
+        help="Deploy the reports even when the deployed dataset has the same fingerprint (src code and settings)",
+        prompt=False, envvar="DEPLOY_FORCE"
+    )] = False,
+    gateway_cache_ttl: Annotated[int, typer.Option(
+        help="Seconds during which the gateway datasources are reused from the disk cache of the previous runs (0: no disk cache)",
+        prompt=False, envvar="GATEWAY_CACHE_TTL"
+    )] = DEFAULT_GATEWAY_CACHE_TTL_SECONDS,
 ):
+    import asyncio
+    from powercicd.powerbi.deploy_pipeline import deploy_reports
+
     if not deploy_report and not deploy_app:
         log.error("Nothing to deploy: neither report nor app is selected. Exiting...")
         return
@@ -86,7 +170,15 @@ def deploy(
     else:
         component_configs = [project_config.get_component(component) for component in components]
 
-    pbi = PowerBiWebClient(tenant=project_config.tenant, keep_browser_open=keep_browser_open)
+    pbi = get_powerbi_client(
+        tenant            = project_config.tenant,
+        keep_browser_open = keep_browser_open,
+        # each concurrent deployment runs up to two api calls at once
+        http_pool_size    = max(http_pool_size, 2 * concurrency),
+        http_max_retries  = http_max_retries,
+    )
+    pbi.gateway_cache_dir         = get_gateway_cache_dir(project_config.project_root)
+    pbi.gateway_cache_ttl_seconds = gateway_cache_ttl
 
     # first the app login, because it is definitively the most expensive with the browser, and
     # it ensures that the correct browser is active for the api login, where the user has already logged in
@@ -95,93 +187,297 @@ def deploy(
     pbi.login_in_api()
 
     if deploy_report:
-        component_config: PowerBiComponentConfig
-        for component_config in component_configs:
-            group = pbi.get_group_by_name(component_config.group)
-            upload_report_name = f"{component_config.report_name} {project_config.version.resulting_version}"
-
-            tmp_folder = get_tmp_dir(project_config.project_root, "deploy")
-            src_code_folder = f"{component_config.component_root}/src"
-            pbix_filepath = f"{tmp_folder}/{upload_report_name}.pbix"
-
-            dataset_parameters = component_config.dataset_parameters.copy()
-            dataset_parameters["DATASET_VERSION"] = project_config.version.resulting_version
-
-            # convert src code to pbix
-            powerbi_utils.convert_src_code_to_pbix(
-                src_code_folder=src_code_folder,
-                pbix_filepath=pbix_filepath,
-                tmp_folder=tmp_folder,
-                powerapps_id_by_name=component_config.powerapps_id_by_name,
-                version=project_config.version.resulting_version,
-            )
-
-            # deploy report
-            log.info(f"Deploying report '{upload_report_name}' to group '{group['Name']}'")
-            pbi.deploy_report(
-                group_id=group["Id"],
-                upload_report_name=upload_report_name,
-                final_report_name=component_config.report_name,
-                pbix_file_path=pbix_filepath,
-                dataset_parameters=dataset_parameters,
-                refresh_schedule=component_config.refresh_schedule,
-                cleanup_regex=rf"{re.escape(upload_report_name)}.+"
-            )
+        results = asyncio.run(deploy_reports(
+            pbi                   = pbi,
+            project_config        = project_config,
+            component_configs     = component_configs,
+            build_cache           = build_cache,
+            concurrency           = concurrency,
+            prefetch              = prefetch,
+            layout_trace          = layout_trace,
+            layout_trace_gzip     = layout_trace_gzip,
+            layout_workers        = layout_workers,
+            force                 = force,
+        ))
+        failed_component_names = [
+            component_config.name
+            for component_config, result
+            in zip(component_configs, results)
+            if isinstance(result, BaseException)
+        ]
+        if len(failed_component_names) > 0:
+            log.error(f"Deployment of the reports failed for the components: {failed_component_names}")
+            raise typer.Exit(code=1)
 
     if deploy_app:
-        group_names = sorted(set(component_config.name for component_config in component_configs))
+        group_names = sorted(set(component_config.group_name for component_config in component_configs))
         for group_name in group_names:
             group = pbi.get_group_by_name(group_name)
             log.info(f"Deploying app for group '{group_name}'")
-            pbi.deploy_app(group["Id"])
+            pbi.deploy_app(group["Id"], log_dir=get_tmp_dir(project_config.project_root, f"deploy_app-{group_name}"))
         log.info("All apps deployed")
         pbi.close_browser()
 
 
+def resolve_powerbi_components(project_config: ProjectConfig, components: list[str] | None, all_components: bool) -> list[PowerBiComponentConfig]:
+    if all_components:
+        if components:
+            raise typer.BadParameter("Pass either component names or --all, not both")
+        return [component for component in project_config.components if component.type == "powerbi"]
+    if not components:
+        raise typer.BadParameter("No component given. Pass component names or --all")
+    return [project_config.get_component(component) for component in components]
+
+
+def get_pbix_file_by_component(component_configs: list[PowerBiComponentConfig], pbix_file: str | None, pbix_dir: str | None) -> dict[str, str]:
+    if pbix_file is not None:
+        if len(component_configs) != 1:
+            raise typer.BadParameter("--pbix-file only supports a single component. Use --pbix-dir for several components")
+        return {component_configs[0].name: pbix_file}
+    if pbix_dir is None:
+        raise typer.BadParameter("Either --pbix-file or --pbix-dir is required")
+    return {component_config.name: f"{pbix_dir}/{component_config.name}.pbix" for component_config in component_configs}
+
+
+def run_component_tasks(tasks: dict[str, Callable], workers: int | None):
+    from powercicd.shared.parallel import log_task_summary, run_in_process_pool
+
+    results = run_in_process_pool(tasks, workers)
+    log_task_summary(results)
+    if any(result.error is not None for result in results):
+        raise typer.Exit(code=1)
+
+
 @powerbi_cli.command("import")
 def import_from_pbix(
     ctx: typer.Context,
-    pbix_file: Annotated[str, typer.Option(...,
-        help="The pbix file to import from"
-    )],
-    component: Annotated[str, typer.Argument(...,
-        help="The component to import to"
-    )],
+    components: Annotated[list[str], typer.Argument(
+        help="The components to import to"
+    )] = None,
+    all_components: Annotated[bool, typer.Option("--all",
+        help="Import all powerbi components of the project"
+    )] = False,
+    pbix_file: Annotated[str, typer.Option(
+        help="The pbix file to import from (single component)"
+    )] = None,
+    pbix_dir: Annotated[str, typer.Option(
+        help="The folder containing the '<component>.pbix' files to import from"
+    )] = None,
+    layout_trace: Annotated[bool, typer.Option(
+        help="Record the changes of each layout transformation step in the temp folder (for debugging purposes)",
+        prompt=False, envvar="LAYOUT_TRACE"
+    )] = False,
+    layout_trace_gzip: Annotated[bool, typer.Option(
+        help="Compress the recorded layout transformation steps with gzip",
+        prompt=False, envvar="LAYOUT_TRACE_GZIP"
+    )] = False,
+    layout_workers: Annotated[int, typer.Option(
+        help="Number of worker processes decoding/encoding the JSON strings embedded in the report layout (1: serial)",
+        prompt=False, envvar="LAYOUT_WORKERS"
+    )] = 1,
+    workers: Annotated[int, typer.Option(
+        help="Number of components converted in parallel (default: number of CPUs)",
+        prompt=False, envvar="WORKERS"
+    )] = None,
 ):
-    project_config   : ProjectConfig = ctx.obj
-    component_config = project_config.get_component(component)
-    src_code_folder  = f"{component_config.component_root}/src"
-    tmp_folder       = get_tmp_dir(project_config.project_root, "import_from_pbix")
-    powerbi_utils.convert_pbix_to_src_code(pbix_file, src_code_folder, tmp_folder)
+    import powercicd.powerbi.powerbi_utils as powerbi_utils
+
+    project_config     : ProjectConfig = ctx.obj
+    component_configs  = resolve_powerbi_components(project_config, components, all_components)
+    pbix_by_component  = get_pbix_file_by_component(component_configs, pbix_file, pbix_dir)
+
+    tasks = {
+        component_config.name: functools.partial(
+            powerbi_utils.convert_pbix_to_src_code,
+            pbix_file         = pbix_by_component[component_config.name],
+            src_code_folder   = f"{component_config.component_root}/src",
+            tmp_folder        = get_tmp_dir(project_config.project_root, f"import_from_pbix-{component_config.name}"),
+            layout_trace      = layout_trace,
+            layout_trace_gzip = layout_trace_gzip,
+            layout_format     = component_config.layout_format,
+            workers           = layout_workers,
+        )
+        for component_config in component_configs
+    }
+    run_component_tasks(tasks, workers)
 
 
 @powerbi_cli.command("export")
 def export_to_pbix(
     ctx: typer.Context,
-    pbix_file: Annotated[str, typer.Option(...,
-        help="The pbix file to export to"
-    )],
-    component: Annotated[str, typer.Argument(...,
-        help="The component to import to"
-    )],
+    components: Annotated[list[str], typer.Argument(
+        help="The components to export"
+    )] = None,
+    all_components: Annotated[bool, typer.Option("--all",
+        help="Export all powerbi components of the project"
+    )] = False,
+    pbix_file: Annotated[str, typer.Option(
+        help="The pbix file to export to (single component)"
+    )] = None,
+    pbix_dir: Annotated[str, typer.Option(
+        help="The folder to export the '<component>.pbix' files to"
+    )] = None,
+    build_cache: Annotated[bool, typer.Option(
+        help="Reuse the pbix files built from an unchanged src folder",
+        prompt=False, envvar="BUILD_CACHE"
+    )] = True,
+    layout_trace: Annotated[bool, typer.Option(
+        help="Record the changes of each layout transformation step in the temp folder (for debugging purposes)",
+        prompt=False, envvar="LAYOUT_TRACE"
+    )] = False,
+    layout_trace_gzip: Annotated[bool, typer.Option(
+        help="Compress the recorded layout transformation steps with gzip",
+        prompt=False, envvar="LAYOUT_TRACE_GZIP"
+    )] = False,
+    layout_workers: Annotated[int, typer.Option(
+        help="Number of worker processes decoding/encoding the JSON strings embedded in the report layout (1: serial)",
+        prompt=False, envvar="LAYOUT_WORKERS"
+    )] = 1,
+    workers: Annotated[int, typer.Option(
+        help="Number of components converted in parallel (default: number of CPUs)",
+        prompt=False, envvar="WORKERS"
+    )] = None,
 ):
-    project_config   : ProjectConfig = ctx.obj
-    component_config = project_config.get_component(component)
-    src_code_folder  = f"{component_config.component_root}/src"
-    tmp_folder       = get_tmp_dir(project_config.project_root, "export_to_pbix")
-
-    powerbi_utils.convert_src_code_to_pbix(
-        src_code_folder      = src_code_folder,
-        pbix_filepath        = pbix_file,
-        tmp_folder           = tmp_folder,
-        powerapps_id_by_name = component_config.powerapps_id_by_name,
-        version              = project_config.version.resulting_version
+    import powercicd.powerbi.powerbi_utils as powerbi_utils
+
+    project_config     : ProjectConfig = ctx.obj
+    component_configs  = resolve_powerbi_components(project_config, components, all_components)
+    pbix_by_component  = get_pbix_file_by_component(component_configs, pbix_file, pbix_dir)
+    pbix_build_cache   = get_build_cache(project_config.project_root, build_cache)
+
+    # the project config is loaded once: the workers only receive the resolved values
+    tasks = {
+        component_config.name: functools.partial(
+            powerbi_utils.convert_src_code_to_pbix,
+            src_code_folder      = f"{component_config.component_root}/src",
+            pbix_filepath        = pbix_by_component[component_config.name],
+            tmp_folder           = get_tmp_dir(project_config.project_root, f"export_to_pbix-{component_config.name}"),
+            powerapps_id_by_name = component_config.powerapps_id_by_name,
+            version              = project_config.version.resulting_version,
+            build_cache          = pbix_build_cache,
+            layout_trace         = layout_trace,
+            layout_trace_gzip    = layout_trace_gzip,
+            workers              = layout_workers,
+        )
+        for component_config in component_configs
+    }
+    run_component_tasks(tasks, workers)
+
+
+
+def get_upload_report_regex(report_name: str) -> str:
+    # only the uploaded versions "<report name> <major>.<minor>.<build>[M]" of the report
+    return rf"{re.escape(report_name)} \d+\.\d+\.\d+M?$"
+
+
+@powerbi_cli.command()
+def cleanup(
+    ctx: typer.Context,
+    components: Annotated[list[str], typer.Argument(
+        help="The components whose stale uploaded reports are deleted"
+    )] = None,
+    all_components: Annotated[bool, typer.Option("--all",
+        help="Clean up all powerbi components of the project"
+    )] = False,
+    cleanup_regex: Annotated[str, typer.Option(
+        help="Regex of the report names to delete (default: the uploaded versions '<report name> <version>' of each component)",
+        prompt=False
+    )] = None,
+    dry_run: Annotated[bool, typer.Option(
+        help="Only list the reports and orphan datasets that would be deleted",
+        prompt=False, envvar="CLEANUP_DRY_RUN"
+    )] = False,
+    workers: Annotated[int, typer.Option(
+        help="Number of deletions running at once",
+        prompt=False, envvar="CLEANUP_WORKERS"
+    )] = DEFAULT_CLEANUP_WORKERS,
+    http_max_retries: Annotated[int, typer.Option(
+        help="Maximum number of retries of a Power BI API call failing with a throttling (429) or server (5xx) error",
+        prompt=False, envvar="HTTP_MAX_RETRIES"
+    )] = DEFAULT_MAX_RETRIES,
+):
+    project_config    : ProjectConfig = ctx.obj
+    component_configs = resolve_powerbi_components(project_config, components, all_components)
+
+    pbi = get_powerbi_client(
+        tenant            = project_config.tenant,
+        keep_browser_open = False,
+        http_pool_size    = max(DEFAULT_POOL_SIZE, workers),
+        http_max_retries  = http_max_retries,
     )
+    pbi.login_in_api()
 
+    # the final reports of all the components deployed to a group are kept, even if the name of another report starts
+    # with them (e.g. "Sales" and "Sales Dashboard")
+    final_report_names_by_group = {}
+    for project_component in project_config.components:
+        if project_component.type == "powerbi":
+            final_report_names_by_group.setdefault(project_component.group_name, []).append(project_component.report_name)
 
-if __name__ == '__main__':
+    failed = []
+    for component_config in component_configs:
+        group = pbi.get_group_by_name(component_config.group_name)
+        # the upload of the current version is kept as well
+        upload_report_name = f"{component_config.report_name} {project_config.version.resulting_version}"
+        result = pbi.cleanup_reports(
+            group_id             = group["Id"],
+            cleanup_regex        = cleanup_regex or get_upload_report_regex(component_config.report_name),
+            exclude_report_names = [*final_report_names_by_group[component_config.group_name], upload_report_name],
+            workers              = workers,
+            dry_run              = dry_run,
+        )
+        failed.extend(result.failed)
+    if len(failed) > 0:
+        log.error(f"Failed to delete {len(failed)} reports or datasets: {[item['Name'] for item in failed]}")
+        raise typer.Exit(code=1)
+
+
+
+@serve_cli.command()
+def serve(
+    socket_path: Annotated[str, typer.Option(
+        help="The unix socket of the daemon",
+        prompt=False, envvar=daemon.SOCKET_PATH_ENV_VAR
+    )] = None,
+    idle_timeout: Annotated[int, typer.Option(
+        help="Seconds without command after which the daemon exits",
+        prompt=False, envvar="POW_DAEMON_IDLE_TIMEOUT"
+    )] = daemon.DEFAULT_IDLE_TIMEOUT_SECONDS,
+    stop: Annotated[bool, typer.Option(
+        help="Stop the running daemon",
+        prompt=False
+    )] = False,
+):
+    global powerbi_clients
+    import powercicd.config as config
+
+    if stop:
+        if not daemon.stop_daemon(socket_path):
+            log.info("No pow daemon running")
+        return
+
+    # the daemon keeps the clients, the loaded configs and the imported modules warm between the commands
+    powerbi_clients       = {}
+    config.loaded_configs = {}
+    try:
+        daemon.serve(run_cli, socket_path, idle_timeout)
+    finally:
+        for pbi in powerbi_clients.values():
+            pbi.close_browser()
+        powerbi_clients       = None
+        config.loaded_configs = None
+
+
+def run_cli(argv: list[str]) -> int:
     try:
-        main_cli()
+        main_cli(args=argv, prog_name="pow")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
     except typer.BadParameter as e:
         typer.echo(f"Error: {e}")
-        raise typer.Exit(code=1)
\ No newline at end of file
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_cli(sys.argv[1:]))
\ No newline at end of file
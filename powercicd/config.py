@@ -1,14 +1,22 @@
+import functools
 import glob
+import pickle
 import yaml
 import os
-from typing import Any, Union
+from typing import Any, Callable, Union
 import logging
 
 from pydantic import BaseModel, Field
 
+import powercicd.powerapps.config
+import powercicd.powerbi.config
+import powercicd.shared.config
+import powercicd.sharepoint.config
 from powercicd.powerbi.config import PowerBiComponentConfig
 from powercicd.powerbi.file_utils import find_parent_dir_where_exists_file
 from powercicd.shared.config import ProjectConfig, ComponentConfig
+from powercicd.shared.project_dirs import get_config_cache_dir, get_version_cache_dir, make_ignored_dir
+from powercicd.shared.versioning import compute_version
 from powercicd.sharepoint.config import SharepointComponentConfig
 from powercicd.powerapps.config import PowerAppsComponentConfig
 
@@ -16,12 +24,26 @@ from powercicd.powerapps.config import PowerAppsComponentConfig
 AnyComponent = Union[PowerBiComponentConfig, PowerAppsComponentConfig, SharepointComponentConfig]
 
 
-PROJECT_CONFIG_FILENAME_FMT   : str = "power-project-{env}.yaml"
-COMPONENT_CONFIG_FILENAME_FMT : str = "power-component-{env}.yaml"
+PROJECT_CONFIG_FILENAME_FMT     : str = "power-project-{env}.yaml"
+COMPONENT_CONFIG_FILENAME_FMT   : str = "power-component-{env}.yaml"
+CONFIG_SNAPSHOT_FORMAT_VERSION  : int = 2
+PROJECT_SNAPSHOT_FILENAME       : str = "project.pickle"
+COMPONENT_SNAPSHOT_FILENAME_FMT : str = "{name}.component.pickle"
+# a change of the config models invalidates the config snapshots
+CONFIG_MODEL_FILES              : list[str] = [
+    __file__,
+    powercicd.shared.config.__file__,
+    powercicd.powerbi.config.__file__,
+    powercicd.powerapps.config.__file__,
+    powercicd.sharepoint.config.__file__,
+]
 
 
 log = logging.getLogger(__name__)
 
+# configs kept in memory between the commands by the `pow serve` daemon, keyed by snapshot path (None: disabled)
+loaded_configs: dict[str, tuple[list, Any]] | None = None
+
 
 class AllComponentsDeserializer(BaseModel):
     component: AnyComponent = Field(..., description="The component configuration", discriminator="type")
@@ -35,50 +57,93 @@ class AllComponentsDeserializer(BaseModel):
         return cls.model_validate(containing_config_json).component
 
 
+# resolves the forward reference of ComponentConfig.parent_project to ProjectConfig
+AllComponentsDeserializer.model_rebuild()
+
+
 def get_current_version(project_root: str, project_config: ProjectConfig):
-    major_version = project_config.version.major
-    minor_version = project_config.version.minor
-    build_ground  = project_config.version.build_ground
-
-    # Case 1: project folder is outside git work tree
-    cmd = f"git -C {project_root} rev-parse --is-inside-work-tree"
-    log.info(f"Executing command: {cmd}")
-    response = os.popen(cmd).read()
-    log.info(f"Response: '{response}'")
-    if response.strip() != "true":
-        log.info(f"Project folder is outside git work tree, then keep version '{major_version}.{minor_version}.{build_ground}' unchanged")
-        return f"{major_version}.{minor_version}.{build_ground}"
-    
-    # Case 2: project folder is inside git work tree but no commits at all (not even HEAD)
-    cmd = f"git -C {project_root} rev-list --all"
-    log.info(f"Executing command: {cmd}")
-    response = os.popen(cmd).read()
-    log.info(f"Response: '{response}'")
-    if response.strip() == "":
-        log.info(f"No commits found in '{project_root}', then keep version '{major_version}.{minor_version}.{build_ground}' unchanged")
-        return f"{major_version}.{minor_version}.{build_ground}"
-
-    # Case 3: project folder is inside git work tree and there are commits
-    cmd = f"git -C {project_root} rev-list HEAD --count"
-    log.info(f"Executing command: {cmd}")
-    response = os.popen(cmd).read()
-    log.info(f"Response: '{response}'")
-    count_commits = int(response.strip())
-    build_number = count_commits - build_ground
-    
-    cmd = f"git -C {project_root} status --porcelain"
-    log.info(f"Executing command: {cmd}")
-    response = os.popen(cmd).read()
-    log.info(f"Response: '{response}'")
-    modified_flag = "M" if response.strip() != "" else ""
-    version = f"{major_version}.{minor_version}.{build_number}{modified_flag}"
-    log.info(f"Version: {version}")
-    return version
-
-
-def get_project_config(stage: str, lookup_path: str = None) -> ProjectConfig:
+    return compute_version(
+        project_root         = project_root,
+        major                = project_config.version.major,
+        minor                = project_config.version.minor,
+        build_ground         = project_config.version.build_ground,
+        build_number_env_var = project_config.version.build_number_env_var,
+        cache_dir            = get_version_cache_dir(project_root),
+    )
+
+
+def get_config_file_stamps(file_paths: list[str]) -> list[tuple[str, int, int]]:
+    stamps = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        stamps.append((os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size))
+    return stamps
+
+
+def load_config_snapshot(snapshot_path: str, stamps: list) -> Any | None:
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # e.g. a snapshot of incompatible model classes
+        log.info(f"Ignoring the unreadable config snapshot '{snapshot_path}': {e}")
+        return None
+    if snapshot.get("format") != CONFIG_SNAPSHOT_FORMAT_VERSION or snapshot.get("stamps") != stamps:
+        log.info(f"Config snapshot '{snapshot_path}' is outdated")
+        return None
+    log.debug(f"Using the config snapshot '{snapshot_path}'")
+    return snapshot["config"]
+
+
+def save_config_snapshot(snapshot_path: str, stamps: list, config: Any):
+    make_ignored_dir(os.path.dirname(snapshot_path))
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"format": CONFIG_SNAPSHOT_FORMAT_VERSION, "stamps": stamps, "config": config}, f)
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_snapshotted(config_file: str, snapshot_path: str | None, load: Callable[[], Any]) -> Any:
+    # the validated config is snapshotted, keyed by its file and by the modules defining the config models:
+    # the yaml parsing and the validation are skipped as long as none of them changes
+    if snapshot_path is None:
+        return load()
+    stamps = get_config_file_stamps([config_file, *CONFIG_MODEL_FILES])
+    if loaded_configs is not None and loaded_configs.get(snapshot_path, (None, None))[0] == stamps:
+        return loaded_configs[snapshot_path][1]
+    config = load_config_snapshot(snapshot_path, stamps)
+    if config is None:
+        config = load()
+        save_config_snapshot(snapshot_path, stamps, config)
+    if loaded_configs is not None:
+        loaded_configs[snapshot_path] = (stamps, config)
+    return config
+
+
+def load_project_config_file(project_root: str, project_config_file: str) -> ProjectConfig:
+    # Load project_config.json
+    with open(project_config_file, 'r', encoding='utf-8') as f:
+        project_json_config = yaml.safe_load(f)
+
+    project_config = ProjectConfig(**project_json_config)
+
+    # Enrich project_config
+    project_config.project_root = project_root
+    return project_config
+
+
+def load_component_config(component_config_file: str, snapshot_dir: str | None = None) -> ComponentConfig:
+    # loader injected into the project config: called on the first access to the component.
+    # The name of parent directory is the name of the component
+    component_name = os.path.basename(os.path.dirname(component_config_file))
+    snapshot_path  = f"{snapshot_dir}/{COMPONENT_SNAPSHOT_FILENAME_FMT.format(name=component_name)}" if snapshot_dir is not None else None
+    return load_snapshotted(component_config_file, snapshot_path, lambda: AllComponentsDeserializer.deserialize_file(component_config_file))
+
+
+def get_project_config(stage: str, lookup_path: str = None, use_snapshot: bool = True) -> ProjectConfig:
     project_config_filename = PROJECT_CONFIG_FILENAME_FMT.format(env=stage)
-    component_config_all_stage_filename_blob = COMPONENT_CONFIG_FILENAME_FMT.format(env="*")
     component_config_stage_filename = COMPONENT_CONFIG_FILENAME_FMT.format(env=stage)
 
     if lookup_path is None:
@@ -88,31 +153,26 @@ def get_project_config(stage: str, lookup_path: str = None) -> ProjectConfig:
     project_root = find_parent_dir_where_exists_file(lookup_path, project_config_filename)
     log.info(f"Project root: {project_root}")
 
-    # Load project_config.json
-    with open(os.path.join(project_root, project_config_filename), 'r', encoding='utf-8') as f:
-        project_json_config = yaml.safe_load(f)
-
-    project_config = ProjectConfig(**project_json_config)
-
-    # Enrich project_config
-    project_config.project_root = project_root
-    project_config.version.resulting_version = get_current_version(project_root, project_config)
+    project_config_file = os.path.join(project_root, project_config_filename)
+    snapshot_dir        = f"{get_config_cache_dir(project_root)}/{stage}" if use_snapshot else None
+    project_config      = load_snapshotted(
+        project_config_file,
+        f"{snapshot_dir}/{PROJECT_SNAPSHOT_FILENAME}" if snapshot_dir is not None else None,
+        lambda: load_project_config_file(project_root, project_config_file),
+    )
 
-    # load component configs
-    project_config.components = []
-    component_config_files = [f for f in glob.glob(f"{project_root}/*/{component_config_stage_filename}")]
-    for component_config_file in component_config_files:
+    # only the component files are discovered here: each component is loaded on its first access
+    component_config_files = {
         # name of parent directory is the name of the component
-        component_name = os.path.basename(os.path.dirname(component_config_file))
-
-        log.info(f"Reading component '{component_name}' config from '{component_config_file}'")
-        component_config = AllComponentsDeserializer.deserialize_file(component_config_file)
-        component_config.parent_project = project_config
-        component_config.name = component_name
-        project_config.components.append(component_config)
+        os.path.basename(os.path.dirname(component_config_file)): component_config_file
+        for component_config_file in glob.glob(f"{project_root}/*/{component_config_stage_filename}")
+    }
+    project_config.set_component_files(component_config_files, functools.partial(load_component_config, snapshot_dir=snapshot_dir))
 
     # TODO: validate that all component implement a config for all stages
 
+    # the version depends on the git state: it is never snapshotted
+    project_config.version.resulting_version = get_current_version(project_root, project_config)
     return project_config
 
 
@@ -129,5 +189,5 @@ def get_component_config(stage: str, lookup_path: str = None) -> ComponentConfig
     if not os.path.exists(f"{project_dir}/{project_config_filename}"):
         raise ValueError(f"{project_config_filename} not found in the folder '{project_dir}' (parent directory of component folder '{component_dir}')")
     name = os.path.relpath(component_dir, project_dir)
-    project_config = get_project_config(component_dir)
+    project_config = get_project_config(stage, project_dir)
     return project_config.get_component(name)
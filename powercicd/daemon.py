@@ -0,0 +1,361 @@
+import glob
+import io
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import traceback
+from typing import Callable
+
+# kept light: the client side of this module is imported by `pow` before anything else
+
+log = logging.getLogger(__name__)
+
+
+DAEMON_ENV_VAR               = "POW_DAEMON"  # "0": never forward the commands to a daemon
+SOCKET_PATH_ENV_VAR          = "POW_DAEMON_SOCKET"
+FORWARD_ENV_ENV_VAR          = "POW_DAEMON_FORWARD_ENV"  # comma separated names of additional variables to forward
+DEFAULT_IDLE_TIMEOUT_SECONDS = 60 * 60
+CONNECT_TIMEOUT_SECONDS      = 2
+SOCKET_DIR_MODE              = 0o700
+
+# only the environment read by the commands is forwarded to the daemon: the envvars of the cli options, and the
+# variables read by DefaultAzureCredential. unit_tests/test_daemon.py checks that the cli options are all listed
+FORWARDED_ENV_VARS = (
+    "BUILD_CACHE", "CLEANUP_DRY_RUN", "CLEANUP_WORKERS", "CONFIG_SNAPSHOT", "DEPLOY_CONCURRENCY", "DEPLOY_FORCE",
+    "DEPLOY_PREFETCH", "GATEWAY_CACHE_TTL", "HTTP_MAX_RETRIES", "HTTP_POOL_SIZE", "KEEP_BROWSER_OPEN", "LAYOUT_TRACE",
+    "LAYOUT_TRACE_GZIP", "LAYOUT_WORKERS", "WORKERS", FORWARD_ENV_ENV_VAR,
+)
+CREDENTIAL_ENV_VAR_PREFIXES = ("AZURE_", "IDENTITY_", "MSI_")
+
+
+class UnsafeSocketError(RuntimeError):
+    pass
+
+
+class StdinRequiredError(RuntimeError):
+    pass
+
+
+def is_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def get_socket_path() -> str:
+    if os.environ.get(SOCKET_PATH_ENV_VAR):
+        return os.environ[SOCKET_PATH_ENV_VAR]
+    # the runtime dir of the user is private. The fallback dir in the shared tmp dir is checked before any use
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return f"{os.environ['XDG_RUNTIME_DIR']}/powercicd/pow.sock"
+    return f"{tempfile.gettempdir()}/powercicd-{os.getuid()}/pow.sock"
+
+
+def check_socket_dir(socket_dir: str):
+    # another local user could have created the dir first, to receive the forwarded credentials
+    st = os.lstat(socket_dir)
+    if not stat.S_ISDIR(st.st_mode):
+        raise UnsafeSocketError(f"'{socket_dir}' is not a directory (or is a symlink)")
+    if st.st_uid != os.getuid():
+        raise UnsafeSocketError(f"'{socket_dir}' is owned by the user id {st.st_uid}, not by the current user")
+    if stat.S_IMODE(st.st_mode) != SOCKET_DIR_MODE:
+        raise UnsafeSocketError(f"'{socket_dir}' has the mode {stat.S_IMODE(st.st_mode):o}, expected {SOCKET_DIR_MODE:o}")
+
+
+def check_socket(socket_path: str):
+    check_socket_dir(os.path.dirname(os.path.abspath(socket_path)))
+    st = os.lstat(socket_path)
+    if not stat.S_ISSOCK(st.st_mode):
+        raise UnsafeSocketError(f"'{socket_path}' is not a unix socket")
+    if st.st_uid != os.getuid():
+        raise UnsafeSocketError(f"'{socket_path}' is owned by the user id {st.st_uid}, not by the current user")
+
+
+def get_peer_uid(sock: socket.socket) -> int | None:
+    # None: not supported on this platform (e.g. macOS), the permissions of the socket dir protect the socket
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return uid
+
+
+def is_forwarded_env_var(name: str, additional_names: str) -> bool:
+    return name in FORWARDED_ENV_VARS or name.startswith(CREDENTIAL_ENV_VAR_PREFIXES) or name in additional_names.split(",")
+
+
+def get_forwarded_env() -> dict[str, str]:
+    additional_names = os.environ.get(FORWARD_ENV_ENV_VAR, "")
+    return {name: value for name, value in os.environ.items() if is_forwarded_env_var(name, additional_names)}
+
+
+def get_code_stamp() -> int:
+    # a daemon started before a change of the powercicd code must not run the commands with the old code
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return max(os.stat(path).st_mtime_ns for path in glob.glob(f"{package_dir}/**/*.py", recursive=True))
+
+
+# ---- protocol: one json message per line ----
+
+def send_message(sock_file, message: dict):
+    sock_file.write(json.dumps(message).encode("utf-8") + b"\n")
+    sock_file.flush()
+
+
+def receive_message(sock_file) -> dict | None:
+    line = sock_file.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class SocketStream(io.TextIOBase):
+    # stdout / stderr of a command running in the daemon, forwarded to the client
+    def __init__(self, sock_file, stream_name: str, lock: threading.Lock):
+        self.sock_file        = sock_file
+        self.stream_name      = stream_name
+        self.lock             = lock
+        self.closed_by_client = False
+
+    @property
+    def encoding(self) -> str:
+        return "utf-8"
+
+    def isatty(self) -> bool:
+        return False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: str) -> int:
+        # worker threads of the command (e.g. the deployments) write concurrently
+        with self.lock:
+            if data and not self.closed_by_client:
+                try:
+                    send_message(self.sock_file, {"stream": self.stream_name, "data": data})
+                except OSError:
+                    # the client is gone (e.g. ctrl-c): the command still runs to its end
+                    self.closed_by_client = True
+        return len(data)
+
+
+class NoStdin(io.TextIOBase):
+    # the stdin of the client is not forwarded: a command reading it is stopped, and `pow` runs it again in-process.
+    # The commands read stdin before any change (e.g. the browser login of deploy), so that they can run again
+    def __init__(self):
+        self.requested = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        self.requested = True
+        raise StdinRequiredError("The commands running in the pow daemon can't read the standard input")
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+# ---- client ----
+
+def forward_command(argv: list[str], socket_path: str | None = None) -> int | None:
+    # runs the command in the daemon and returns its exit code. None: the command must run in-process (no daemon,
+    # outdated daemon, or command reading stdin)
+    if not is_supported():
+        return None
+    socket_path = socket_path or get_socket_path()
+    if not os.path.lexists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        check_socket(socket_path)
+        sock.settimeout(CONNECT_TIMEOUT_SECONDS)
+        sock.connect(socket_path)
+        sock.settimeout(None)
+        peer_uid = get_peer_uid(sock)
+        if peer_uid is not None and peer_uid != os.getuid():
+            raise UnsafeSocketError(f"The daemon on '{socket_path}' runs as the user id {peer_uid}, not as the current user")
+    except UnsafeSocketError as e:
+        sock.close()
+        print(f"Ignoring the pow daemon: {e}", file=sys.stderr)
+        return None
+    except OSError:
+        sock.close()
+        return None
+
+    with sock, sock.makefile("rwb") as sock_file:
+        send_message(sock_file, {"argv": argv, "cwd": os.getcwd(), "env": get_forwarded_env(), "code_stamp": get_code_stamp()})
+        while (message := receive_message(sock_file)) is not None:
+            if "stream" in message:
+                stream = sys.stdout if message["stream"] == "stdout" else sys.stderr
+                stream.write(message["data"])
+                stream.flush()
+            elif message.get("stale"):
+                print("The pow daemon runs an outdated version of powercicd: it stops, the command runs without it", file=sys.stderr)
+                return None
+            elif message.get("needs_stdin"):
+                print("The command reads the standard input, not available in the pow daemon: it runs again without it", file=sys.stderr)
+                return None
+            elif "exit_code" in message:
+                return message["exit_code"]
+    print("The connection to the pow daemon was lost before the end of the command", file=sys.stderr)
+    return 1
+
+
+def is_daemon_running(socket_path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT_SECONDS)
+            sock.connect(socket_path)
+            return True
+    except OSError:
+        return False
+
+
+def stop_daemon(socket_path: str | None = None) -> bool:
+    if not is_supported():
+        return False
+    socket_path = socket_path or get_socket_path()
+    if not os.path.lexists(socket_path):
+        return False
+    try:
+        check_socket(socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            with sock.makefile("rwb") as sock_file:
+                send_message(sock_file, {"stop": True})
+                return receive_message(sock_file) is not None
+    except OSError:
+        return False
+
+
+# ---- server ----
+
+class _RedirectedCommand:
+    # the commands run one at a time: the process wide state (streams, log handlers, env, cwd) is swapped during the
+    # command and restored afterwards
+    def __init__(self, sock_file, request: dict):
+        self.lock    = threading.Lock()
+        self.stdout  = SocketStream(sock_file, "stdout", self.lock)
+        self.stderr  = SocketStream(sock_file, "stderr", self.lock)
+        self.stdin   = NoStdin()
+        self.request = request
+
+    def __enter__(self):
+        self.saved_streams  = sys.stdin, sys.stdout, sys.stderr
+        self.saved_env      = dict(os.environ)
+        self.saved_cwd      = os.getcwd()
+        self.saved_handlers = [(handler, handler.stream) for handler in logging.root.handlers if isinstance(handler, logging.StreamHandler)]
+        sys.stdin, sys.stdout, sys.stderr = self.stdin, self.stdout, self.stderr
+        for handler, _ in self.saved_handlers:
+            handler.setStream(self.stderr)
+        # the forwarded variables of the client replace the ones of the daemon, the others are kept (e.g. PATH, HOME)
+        forwarded_env    = self.request.get("env", {})
+        additional_names = forwarded_env.get(FORWARD_ENV_ENV_VAR, "")
+        for name in [name for name in os.environ if is_forwarded_env_var(name, additional_names)]:
+            del os.environ[name]
+        os.environ.update(forwarded_env)
+        os.chdir(self.request.get("cwd", self.saved_cwd))
+        return self
+
+    def __exit__(self, *exc_info):
+        os.chdir(self.saved_cwd)
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        for handler, stream in self.saved_handlers:
+            handler.setStream(stream)
+        sys.stdin, sys.stdout, sys.stderr = self.saved_streams
+
+
+def prepare_socket_path(socket_path: str):
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(os.path.dirname(socket_dir), exist_ok=True)
+    try:
+        os.mkdir(socket_dir, SOCKET_DIR_MODE)
+        # the mode given to mkdir is reduced by the umask
+        os.chmod(socket_dir, SOCKET_DIR_MODE)
+    except FileExistsError:
+        pass
+    check_socket_dir(socket_dir)
+    if os.path.lexists(socket_path):
+        check_socket(socket_path)
+        if is_daemon_running(socket_path):
+            raise RuntimeError(f"A pow daemon is already running on '{socket_path}'")
+        # stale socket of a daemon which has not exited cleanly
+        os.remove(socket_path)
+
+
+def handle_connection(conn: socket.socket, run_command: Callable[[list[str]], int], code_stamp: int) -> bool:
+    # returns False when the daemon must stop
+    with conn, conn.makefile("rwb") as sock_file:
+        request = receive_message(sock_file)
+        if request is None:
+            return True
+        if request.get("stop"):
+            log.info("Stop requested")
+            send_message(sock_file, {"exit_code": 0})
+            return False
+        if request.get("code_stamp") != code_stamp:
+            log.info("The powercicd code has changed since the start of the daemon: stopping")
+            send_message(sock_file, {"stale": True})
+            return False
+
+        log.info(f"Running command: {request['argv']}")
+        with _RedirectedCommand(sock_file, request) as command:
+            try:
+                exit_code = run_command(request["argv"])
+            except StdinRequiredError:
+                exit_code = 1
+            except Exception:
+                command.stderr.write(traceback.format_exc())
+                exit_code = 1
+        # also when the command has caught the error itself
+        result = {"needs_stdin": True} if command.stdin.requested else {"exit_code": exit_code}
+        try:
+            send_message(sock_file, result)
+        except OSError:
+            pass
+        log.info(f"Command finished: {result}")
+        return True
+
+
+def serve(run_command: Callable[[list[str]], int], socket_path: str | None = None, idle_timeout_seconds: float = DEFAULT_IDLE_TIMEOUT_SECONDS):
+    if not is_supported():
+        raise RuntimeError("The pow daemon requires unix domain sockets, not supported on this platform")
+    socket_path = socket_path or get_socket_path()
+    prepare_socket_path(socket_path)
+    code_stamp = get_code_stamp()
+
+    # started in the background (`pow serve &`), a read of the terminal would suspend the daemon (SIGTTIN)
+    devnull_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull_fd, 0)
+    os.close(devnull_fd)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socket_path)
+        os.chmod(socket_path, 0o600)
+        server.listen()
+        server.settimeout(idle_timeout_seconds)
+        log.info(f"pow daemon listening on '{socket_path}' (exits after {idle_timeout_seconds} seconds without command)")
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                log.info("No command received for a while: stopping")
+                break
+            conn.settimeout(None)
+            peer_uid = get_peer_uid(conn)
+            if peer_uid is not None and peer_uid != os.getuid():
+                log.warning(f"Refusing a connection of the user id {peer_uid}")
+                conn.close()
+                continue
+            if not handle_connection(conn, run_command, code_stamp):
+                break
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
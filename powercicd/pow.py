@@ -0,0 +1,35 @@
+import os
+import sys
+
+import powercicd.daemon as daemon
+
+# entry point of `pow`: only the daemon client is imported before knowing whether the command runs in the `pow serve`
+# daemon or in this process
+
+# commands waiting for the user on stdin, which is not forwarded to the daemon: they always run in this process
+INTERACTIVE_COMMANDS = {("powerbi", "login")}
+
+
+def is_interactive_command(argv: list[str]) -> bool:
+    # the options of the main command come before the command group, followed by the command
+    return any((group, command) in INTERACTIVE_COMMANDS for group, command in zip(argv, argv[1:]))
+
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        from powercicd.cli import serve_cli
+        serve_cli(args=argv[1:], prog_name="pow serve")
+        return
+
+    if os.environ.get(daemon.DAEMON_ENV_VAR, "1") != "0" and not is_interactive_command(argv):
+        exit_code = daemon.forward_command(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    from powercicd.cli import run_cli
+    sys.exit(run_cli(argv))
+
+
+if __name__ == '__main__':
+    main()
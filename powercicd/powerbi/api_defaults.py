@@ -0,0 +1,6 @@
+# defaults of the Power BI API clients, kept apart from the clients so that the CLI can declare its options without
+# importing the http, azure and selenium stack
+DEFAULT_API_BASE_URL    = "https://api.powerbi.com"
+DEFAULT_POOL_SIZE       = 10
+DEFAULT_MAX_RETRIES     = 5
+DEFAULT_CLEANUP_WORKERS = 4
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from typing import Callable
+
+from powercicd.powerbi.file_utils import iter_files_sorted
+
+log = logging.getLogger(__name__)
+
+
+# bump when the content of the cached artifacts changes for the same inputs
+CACHE_FORMAT_VERSION   = 1
+DEFAULT_MAX_SIZE_BYTES = 2 * 1024 * 1024 * 1024
+HASH_BUFFER_SIZE       = 1024 * 1024
+
+
+def hash_json(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def hash_file_content(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(HASH_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_src_tree(src_code_folder: str, hash_file: Callable[[str], str] = hash_file_content) -> str:
+    # without build cache, every file is read: nothing is memoized in the cache dir
+    digest = hashlib.sha256()
+    for abs_path, rel_path in iter_files_sorted(src_code_folder):
+        digest.update(rel_path.encode('utf-8'))
+        digest.update(b"\0")
+        digest.update(hash_file(abs_path).encode('ascii'))
+        digest.update(b"\0")
+    tree_hash = digest.hexdigest()
+    log.info(f"Hash of src tree '{src_code_folder}': {tree_hash}")
+    return tree_hash
+
+
+class PbixBuildCache:
+    def __init__(self, cache_dir: str, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES):
+        self.cache_dir        = cache_dir
+        self.max_size_bytes   = max_size_bytes
+        self.pbix_dir         = f"{cache_dir}/pbix"
+        self.layout_dir       = f"{cache_dir}/layout"
+        self.trees_dir        = f"{cache_dir}/trees"
+        self.file_hashes_path = f"{cache_dir}/file_hashes.json"
+        self._file_hashes     : dict[str, list] | None = None
+        self._file_hashes_dirty = False
+
+    # ---- content hashing ----
+
+    def _load_file_hashes(self) -> dict[str, list]:
+        if self._file_hashes is None:
+            try:
+                with open(self.file_hashes_path, 'r', encoding='utf-8') as f:
+                    self._file_hashes = json.load(f)
+            except (OSError, ValueError):
+                self._file_hashes = {}
+        return self._file_hashes
+
+    def _save_file_hashes(self):
+        if not self._file_hashes_dirty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.file_hashes_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._file_hashes, f)
+        os.replace(tmp_path, self.file_hashes_path)
+        self._file_hashes_dirty = False
+
+    def hash_file(self, file_path: str) -> str:
+        # file content hashes are memoized by path, size and mtime, so unchanged files are not re-read
+        file_hashes = self._load_file_hashes()
+        abs_path    = os.path.abspath(file_path)
+        stat        = os.stat(abs_path)
+        memo        = file_hashes.get(abs_path)
+        if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+
+        file_hash = hash_file_content(abs_path)
+        file_hashes[abs_path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+        self._file_hashes_dirty = True
+        return file_hash
+
+    def hash_src_tree(self, src_code_folder: str) -> str:
+        tree_hash = hash_src_tree(src_code_folder, self.hash_file)
+        self._save_file_hashes()
+        return tree_hash
+
+    @staticmethod
+    def build_key(tree_hash: str, powerapps_id_by_name: dict | None, version: str) -> str:
+        return hash_json({
+            "format"               : CACHE_FORMAT_VERSION,
+            "tree"                 : tree_hash,
+            "powerapps_id_by_name" : powerapps_id_by_name or {},
+            "version"              : version,
+        })
+
+    @staticmethod
+    def layout_key(layout_code_hash: str, kind: str = "layout") -> str:
+        return hash_json({
+            "format" : CACHE_FORMAT_VERSION,
+            "kind"   : kind,
+            "layout" : layout_code_hash,
+        })
+
+    # ---- cache entries ----
+
+    def _get(self, path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+        # touch the entry, so that eviction removes the least recently used entries first
+        os.utime(path)
+        return path
+
+    def _put_file(self, path: str, write_fn):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_pbix(self, build_key: str) -> str | None:
+        path = self._get(f"{self.pbix_dir}/{build_key}.pbix")
+        log.info(f"Build cache {'hit' if path else 'miss'} for pbix '{build_key}'")
+        return path
+
+    def get_pbix_for_tree(self, tree_hash: str) -> str | None:
+        # latest pbix built from the same src tree, possibly with other substitution values
+        try:
+            with open(f"{self.trees_dir}/{tree_hash}", 'r', encoding='utf-8') as f:
+                build_key = f.read().strip()
+        except FileNotFoundError:
+            return None
+        path = self._get(f"{self.pbix_dir}/{build_key}.pbix")
+        log.info(f"Build cache {'hit' if path else 'miss'} for pbix of src tree '{tree_hash}'")
+        return path
+
+    def put_pbix(self, build_key: str, pbix_filepath: str, tree_hash: str | None = None):
+        log.info(f"Storing pbix '{pbix_filepath}' in build cache as '{build_key}'")
+        self._put_file(f"{self.pbix_dir}/{build_key}.pbix", lambda tmp_path: shutil.copyfile(pbix_filepath, tmp_path))
+        if tree_hash is not None:
+            def write_fn(tmp_path):
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(build_key)
+            self._put_file(f"{self.trees_dir}/{tree_hash}", write_fn)
+        self.evict()
+
+    def get_encoded_layout(self, layout_key: str) -> dict | None:
+        path = self._get(f"{self.layout_dir}/{layout_key}.json")
+        log.debug(f"Build cache {'hit' if path else 'miss'} for encoded layout '{layout_key}'")
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put_encoded_layout(self, layout_key: str, layout: dict):
+        def write_fn(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(layout, f, ensure_ascii=False, separators=(',', ':'))
+
+        log.debug(f"Storing encoded layout in build cache as '{layout_key}'")
+        self._put_file(f"{self.layout_dir}/{layout_key}.json", write_fn)
+
+    def evict(self):
+        entries = []
+        for entry_dir in [self.pbix_dir, self.layout_dir]:
+            if not os.path.isdir(entry_dir):
+                continue
+            for entry in os.scandir(entry_dir):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            log.info(f"Evicting '{path}' from build cache ({size} bytes)")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        # drop the src tree pointers to evicted pbix files
+        if os.path.isdir(self.trees_dir):
+            for entry in os.scandir(self.trees_dir):
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        build_key = f.read().strip()
+                    if not os.path.exists(f"{self.pbix_dir}/{build_key}.pbix"):
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
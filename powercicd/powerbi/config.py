@@ -14,6 +14,7 @@ Dataset = dict
 Datasource = dict
 WeekDays = Literal["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
 NotifyOption = Literal["MailOnFailure", "NoNotification"]
+LayoutFormat = Literal["single", "sharded"]
 
 
 class DatasetRefreshSchedule(BaseModel):
@@ -31,4 +32,5 @@ class PowerBiComponentConfig(ComponentConfig):
     refresh_schedule     : Annotated[Optional[DatasetRefreshSchedule] , Field(description="The schedule for the dataset refresh")]
     dataset_parameters   : Annotated[dict[str, Any]                   , Field(description="The parameters for the dataset refresh")]
     powerapps_id_by_name : Annotated[Optional[dict[str, str]]         , Field(description="The PowerApps ID by powerapps name")] = None
+    layout_format        : Annotated[LayoutFormat                     , Field(description="The format of the report layout in the src folder: a single 'Report/Layout.json' file or one file per page and per visual container")] = "single"
 
@@ -0,0 +1,155 @@
+import asyncio
+import functools
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+
+import powercicd.powerbi.powerbi_utils as powerbi_utils
+from powercicd.powerbi.build_cache import hash_src_tree
+from powercicd.powerbi.config import PowerBiComponentConfig
+from powercicd.powerbi.deployment_fingerprint import DATASET_FINGERPRINT_PARAMETER, compute_deployment_fingerprint
+from powercicd.powerbi.powerbi_async_client import AsyncPowerBiClient
+from powercicd.powerbi.powerbi_client import PowerBiWebClient
+from powercicd.shared.config import ProjectConfig
+from powercicd.shared.parallel import new_process_pool
+from powercicd.shared.project_dirs import get_build_cache, get_tmp_dir
+
+log = logging.getLogger(__name__)
+
+
+class BuiltReport(NamedTuple):
+    component_config   : PowerBiComponentConfig
+    group_id           : str
+    upload_report_name : str
+    pbix_filepath      : str
+    dataset_parameters : dict[str, str]
+
+
+async def build_component_report(
+    pbi               : AsyncPowerBiClient,
+    project_config    : ProjectConfig,
+    component_config  : PowerBiComponentConfig,
+    build_executor    : ProcessPoolExecutor,
+    build_cache       : bool,
+    layout_trace      : bool,
+    layout_trace_gzip : bool,
+    layout_workers    : int,
+    force             : bool,
+) -> BuiltReport | None:
+    group = await pbi.get_group_by_name(component_config.group_name)
+    upload_report_name = f"{component_config.report_name} {project_config.version.resulting_version}"
+
+    tmp_folder = get_tmp_dir(project_config.project_root, f"deploy-{component_config.name}")
+    src_code_folder = f"{component_config.component_root}/src"
+    pbix_filepath = f"{tmp_folder}/{upload_report_name}.pbix"
+
+    dataset_parameters = component_config.dataset_parameters.copy()
+    dataset_parameters["DATASET_VERSION"] = project_config.version.resulting_version
+
+    # skip the deployment, when the deployed dataset was built from the same src code and settings. The file hashes
+    # are only memoized with the build cache enabled
+    pbix_build_cache = get_build_cache(project_config.project_root, build_cache)
+    tree_hash        = await asyncio.to_thread(pbix_build_cache.hash_src_tree if pbix_build_cache is not None else hash_src_tree, src_code_folder)
+    fingerprint      = compute_deployment_fingerprint(
+        tree_hash            = tree_hash,
+        powerapps_id_by_name = component_config.powerapps_id_by_name,
+        version              = project_config.version.resulting_version,
+        dataset_parameters   = dataset_parameters,
+        refresh_schedule     = component_config.refresh_schedule,
+    )
+    dataset_parameters[DATASET_FINGERPRINT_PARAMETER] = fingerprint
+    if not force and await pbi.get_deployed_fingerprint(group["Id"], component_config.report_name) == fingerprint:
+        log.info(f"Report '{component_config.report_name}' is up-to-date (fingerprint {fingerprint}): skipping its deployment")
+        return None
+
+    # convert src code to pbix, in a worker process, so that the build does not compete with the deployments for the GIL
+    await asyncio.get_running_loop().run_in_executor(build_executor, functools.partial(
+        powerbi_utils.convert_src_code_to_pbix,
+        src_code_folder=src_code_folder,
+        pbix_filepath=pbix_filepath,
+        tmp_folder=tmp_folder,
+        powerapps_id_by_name=component_config.powerapps_id_by_name,
+        version=project_config.version.resulting_version,
+        build_cache=pbix_build_cache,
+        layout_trace=layout_trace,
+        layout_trace_gzip=layout_trace_gzip,
+        workers=layout_workers,
+    ))
+    return BuiltReport(component_config, group["Id"], upload_report_name, pbix_filepath, dataset_parameters)
+
+
+async def deploy_built_report(pbi: AsyncPowerBiClient, built_report: BuiltReport):
+    log.info(f"Deploying report '{built_report.upload_report_name}' to group '{built_report.component_config.group_name}'")
+    await pbi.deploy_report(
+        group_id=built_report.group_id,
+        upload_report_name=built_report.upload_report_name,
+        final_report_name=built_report.component_config.report_name,
+        file_path=built_report.pbix_filepath,
+        dataset_parameters=built_report.dataset_parameters,
+        refresh_schedule=built_report.component_config.refresh_schedule,
+        cleanup_regex=rf"{re.escape(built_report.upload_report_name)}.+"
+    )
+
+
+async def deploy_reports(
+    pbi               : PowerBiWebClient,
+    project_config    : ProjectConfig,
+    component_configs : list[PowerBiComponentConfig],
+    build_cache       : bool,
+    concurrency       : int,
+    prefetch          : int,
+    layout_trace      : bool,
+    layout_trace_gzip : bool,
+    layout_workers    : int,
+    force             : bool,
+) -> list:
+    # pipeline: the build stage produces the pbix files ahead of the deploy stage, through a bounded queue, so that
+    # the next pbix is built while the previous ones are uploaded and refreshed
+    if concurrency < 1:
+        # no consumer: the build stage would wait forever on the queue
+        raise ValueError(f"The deploy concurrency must be at least 1, got {concurrency}")
+    if prefetch < 1:
+        # a queue of size 0 is unbounded: all the pbix files would be built before the first deployment
+        raise ValueError(f"The deploy prefetch must be at least 1, got {prefetch}")
+    # the blocking api calls run in threads: size the pool to the concurrency
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2 * concurrency + 1))
+    async_pbi = AsyncPowerBiClient(pbi)
+    queue     : asyncio.Queue[BuiltReport | None] = asyncio.Queue(maxsize=prefetch)
+    results   : dict[str, BaseException | None] = {component_config.name: None for component_config in component_configs}
+
+    async def build_stage():
+        with new_process_pool(1) as build_executor:
+            for component_config in component_configs:
+                try:
+                    built_report = await build_component_report(
+                        pbi               = async_pbi,
+                        project_config    = project_config,
+                        component_config  = component_config,
+                        build_executor    = build_executor,
+                        build_cache       = build_cache,
+                        layout_trace      = layout_trace,
+                        layout_trace_gzip = layout_trace_gzip,
+                        layout_workers    = layout_workers,
+                        force             = force,
+                    )
+                except Exception as e:
+                    log.error(f"Build of component '{component_config.name}' failed", exc_info=e)
+                    results[component_config.name] = e
+                    continue
+                if built_report is not None:
+                    await queue.put(built_report)
+        # one end marker per deploy worker
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def deploy_stage():
+        while (built_report := await queue.get()) is not None:
+            try:
+                await deploy_built_report(async_pbi, built_report)
+            except Exception as e:
+                log.error(f"Deployment of component '{built_report.component_config.name}' failed", exc_info=e)
+                results[built_report.component_config.name] = e
+
+    await asyncio.gather(build_stage(), *(deploy_stage() for _ in range(concurrency)))
+    return [results[component_config.name] for component_config in component_configs]
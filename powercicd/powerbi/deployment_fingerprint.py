@@ -0,0 +1,29 @@
+import logging
+
+from powercicd.powerbi.build_cache import CACHE_FORMAT_VERSION, hash_json
+from powercicd.powerbi.config import DatasetRefreshSchedule
+
+log = logging.getLogger(__name__)
+
+
+# text parameter of the semantic model, storing the fingerprint of the deployed src code next to DATASET_VERSION.
+# Models without this parameter are always deployed
+DATASET_FINGERPRINT_PARAMETER = "DATASET_FINGERPRINT"
+
+
+def compute_deployment_fingerprint(
+    tree_hash            : str,
+    powerapps_id_by_name : dict[str, str] | None,
+    version              : str,
+    dataset_parameters   : dict[str, str],
+    refresh_schedule     : DatasetRefreshSchedule | None,
+) -> str:
+    # everything the deployment depends on: the src tree and the resolved substitutions and settings
+    return hash_json({
+        "format"               : CACHE_FORMAT_VERSION,
+        "tree"                 : tree_hash,
+        "powerapps_id_by_name" : powerapps_id_by_name or {},
+        "version"              : version,
+        "dataset_parameters"   : {key: value for key, value in dataset_parameters.items() if key != DATASET_FINGERPRINT_PARAMETER},
+        "refresh_schedule"     : refresh_schedule.model_dump() if refresh_schedule is not None else None,
+    })
@@ -8,8 +8,20 @@ def find_parent_dir_where_exists_file(start_path: str, file: str) -> str:
         project_config_path = os.path.join(folder, file)
         if os.path.exists(project_config_path):
             break
-        folder = os.path.dirname(folder)
+        # the parent of a filesystem root is the root itself
+        parent = os.path.dirname(folder)
+        folder = parent if parent != folder else ""
 
     if not folder:
         raise Exception(f"{file} not found in any parent directory")
     return folder
+
+
+def iter_files_sorted(folder: str):
+    # sorted walk, so that the same tree is always enumerated in the same order
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file in sorted(files):
+            abs_path = os.path.join(root, file)
+            rel_path = os.path.relpath(abs_path, folder).replace(os.sep, "/")
+            yield abs_path, rel_path
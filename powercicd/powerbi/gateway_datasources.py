@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import time
+from typing import Callable
+
+from powercicd.powerbi.config import Datasource
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_GATEWAY_CACHE_TTL_SECONDS = 0  # no disk cache
+GATEWAY_CACHE_FORMAT_VERSION      = 1
+
+DatasourceKey = tuple[str, str]  # datasource type, normalized connection details
+
+
+def get_field(ds: Datasource, name: str):
+    # the gateway api answers in PascalCase, the dataset api in camelCase
+    for key, value in ds.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def normalize_connection_details(connection_details: str | dict | None) -> str:
+    # the gateway datasources have their connection details as JSON string, the dataset datasources as object
+    if isinstance(connection_details, str):
+        try:
+            connection_details = json.loads(connection_details)
+        except ValueError:
+            return connection_details.strip(" /").lower()
+    if not isinstance(connection_details, dict):
+        return ""
+    normalized = {key.lower(): str(value).strip(" /").lower() for key, value in connection_details.items() if value is not None}
+    return json.dumps(normalized, sort_keys=True)
+
+
+def build_datasource_key(ds: Datasource) -> DatasourceKey:
+    # ids, names and gateway ids differ between a gateway datasource and the datasource of a dataset: only the type
+    # and the connection details identify the same source
+    return (get_field(ds, "datasourceType") or "").lower(), normalize_connection_details(get_field(ds, "connectionDetails"))
+
+
+class GatewayDatasourceIndex:
+    # gateway cluster datasources indexed by datasource key, built once and shared by all the deployments of a run
+    def __init__(self, datasources: list[Datasource], fetched_at: float | None = None, from_disk: bool = False):
+        self.datasources = datasources
+        self.fetched_at  = fetched_at if fetched_at is not None else time.time()
+        self.from_disk   = from_disk
+        self.by_key      : dict[DatasourceKey, Datasource] = {}
+        for ds in datasources:
+            self.by_key.setdefault(build_datasource_key(ds), ds)
+
+    def get_datasource_ids_by_gateway_id(self, dataset_datasources: list[Datasource]) -> tuple[dict[str, list[str]], list[DatasourceKey]]:
+        # returns the gateway datasource ids to bind, and the keys of the datasources not managed by a gateway
+        datasource_ids_by_gateway_id = {}
+        unmanaged_keys               = []
+        for key in sorted(set(build_datasource_key(ds) for ds in dataset_datasources)):
+            gateway_datasource = self.by_key.get(key)
+            if gateway_datasource is None:
+                unmanaged_keys.append(key)
+                continue
+            datasource_ids_by_gateway_id.setdefault(get_field(gateway_datasource, "clusterId"), []).append(get_field(gateway_datasource, "id"))
+        return datasource_ids_by_gateway_id, unmanaged_keys
+
+    def save(self, cache_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": GATEWAY_CACHE_FORMAT_VERSION, "fetched_at": self.fetched_at, "datasources": self.datasources}, f)
+        os.replace(tmp_path, cache_path)
+
+    @staticmethod
+    def load(cache_path: str, ttl_seconds: float, clock: Callable[[], float] = time.time) -> "GatewayDatasourceIndex | None":
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        age = clock() - cached.get("fetched_at", 0)
+        if cached.get("format") != GATEWAY_CACHE_FORMAT_VERSION or not 0 <= age < ttl_seconds:
+            log.info(f"Gateway datasource cache '{cache_path}' is outdated")
+            return None
+        log.info(f"Using the gateway datasources cached {age:.0f} seconds ago in '{cache_path}'")
+        return GatewayDatasourceIndex(cached["datasources"], cached["fetched_at"], from_disk=True)
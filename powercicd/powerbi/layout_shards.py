@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import re
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+
+# Sharded src layout:
+#   Report/Layout.manifest.json                          layout without sections, "sections" lists the section folders
+#   Report/sections/<ordinal>_<name>/section.json        section without visual containers, "visualContainers" lists the visual ids
+#   Report/sections/<ordinal>_<name>/visuals/<id>.json   one visual container
+MANIFEST_FILENAME = "Layout.manifest.json"
+SECTIONS_DIRNAME  = "sections"
+SECTION_FILENAME  = "section.json"
+VISUALS_DIRNAME   = "visuals"
+
+_UNSAFE_FILENAME_CHARS_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def to_safe_filename(name: str) -> str:
+    return _UNSAFE_FILENAME_CHARS_RE.sub("_", name)
+
+
+def make_unique(name: str, used_names: set[str]) -> str:
+    unique_name = name
+    suffix = 1
+    while unique_name.lower() in used_names:
+        suffix += 1
+        unique_name = f"{name}_{suffix}"
+    used_names.add(unique_name.lower())
+    return unique_name
+
+
+def get_visual_id(visual_container: dict, container_idx: int) -> str:
+    config = visual_container.get("config")
+    if isinstance(config, dict) and isinstance(config.get("name"), str):
+        return config["name"]
+    return f"visual_{container_idx}"
+
+
+def write_json(file: str, value):
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump(value, f, indent=2, ensure_ascii=False)
+
+
+def read_json(file: str):
+    with open(file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_sharded_layout(report_folder: str) -> bool:
+    return os.path.exists(f"{report_folder}/{MANIFEST_FILENAME}")
+
+
+def write_sharded_layout(layout: dict, report_folder: str):
+    log.info(f"Writing sharded layout to '{report_folder}/{SECTIONS_DIRNAME}'")
+    manifest           = dict(layout)
+    section_dirnames   = []
+    used_section_names = set()
+    for section_idx, section in enumerate(layout.get("sections", [])):
+        ordinal         = section.get("ordinal")
+        ordinal         = ordinal if isinstance(ordinal, int) else section_idx
+        section_dirname = make_unique(to_safe_filename(f"{ordinal:03d}_{section.get('name', section_idx)}"), used_section_names)
+        section_dir     = f"{report_folder}/{SECTIONS_DIRNAME}/{section_dirname}"
+        os.makedirs(f"{section_dir}/{VISUALS_DIRNAME}", exist_ok=True)
+
+        section_shard     = dict(section)
+        visual_ids        = []
+        used_visual_names = set()
+        for container_idx, visual_container in enumerate(section.get("visualContainers", [])):
+            visual_id = make_unique(to_safe_filename(get_visual_id(visual_container, container_idx)), used_visual_names)
+            write_json(f"{section_dir}/{VISUALS_DIRNAME}/{visual_id}.json", visual_container)
+            visual_ids.append(visual_id)
+        section_shard["visualContainers"] = visual_ids
+        write_json(f"{section_dir}/{SECTION_FILENAME}", section_shard)
+        section_dirnames.append(section_dirname)
+
+    manifest["sections"] = section_dirnames
+    write_json(f"{report_folder}/{MANIFEST_FILENAME}", manifest)
+
+
+def read_sharded_layout(
+    report_folder         : str,
+    load_visual_container : Callable[[str, int, int], dict] | None = None,
+) -> dict:
+    if load_visual_container is None:
+        load_visual_container = lambda visual_file, section_idx, container_idx: read_json(visual_file)
+
+    log.info(f"Reading sharded layout from '{report_folder}/{SECTIONS_DIRNAME}'")
+    layout   = read_json(f"{report_folder}/{MANIFEST_FILENAME}")
+    sections = []
+    for section_idx, section_dirname in enumerate(layout.get("sections", [])):
+        section_dir = f"{report_folder}/{SECTIONS_DIRNAME}/{section_dirname}"
+        section     = read_json(f"{section_dir}/{SECTION_FILENAME}")
+        section["visualContainers"] = [
+            load_visual_container(f"{section_dir}/{VISUALS_DIRNAME}/{visual_id}.json", section_idx, container_idx)
+            for container_idx, visual_id
+            in enumerate(section.get("visualContainers", []))
+        ]
+        sections.append(section)
+    layout["sections"] = sections
+    return layout
@@ -0,0 +1,164 @@
+import functools
+import logging
+import re
+from typing import Any, Callable, Iterator
+
+log = logging.getLogger(__name__)
+
+
+# Subset of the jsonpath syntax used by the layout substitutions: `$`, `.field`, `[index]` and `[*]`
+_PATH_TOKEN_RE = re.compile(r"\.(?P<field>[A-Za-z_][A-Za-z0-9_]*)|\[(?P<index>\d+|\*)\]")
+_WILDCARD      = "*"
+
+PathStep = str | int
+
+
+class CompiledPath:
+    def __init__(self, expression: str, steps: tuple[PathStep, ...]):
+        self.expression = expression
+        self.steps      = steps
+
+    def find(self, node: Any) -> list[tuple[tuple[PathStep, ...], Any]]:
+        matches = [((), node)]
+        for step in self.steps:
+            next_matches = []
+            for path, value in matches:
+                if step == _WILDCARD:
+                    if isinstance(value, list):
+                        next_matches.extend((path + (i,), v) for i, v in enumerate(value))
+                elif isinstance(step, int):
+                    if isinstance(value, list) and step < len(value):
+                        next_matches.append((path + (step,), value[step]))
+                elif isinstance(value, dict) and step in value:
+                    next_matches.append((path + (step,), value[step]))
+            matches = next_matches
+            if not matches:
+                break
+        return matches
+
+    def __repr__(self):
+        return self.expression
+
+
+@functools.lru_cache(maxsize=None)
+def compile_jsonpath(expression: str) -> CompiledPath:
+    if not expression.startswith("$"):
+        raise ValueError(f"Unsupported jsonpath '{expression}': it must start with '$'")
+    steps = []
+    pos = 1
+    while pos < len(expression):
+        token = _PATH_TOKEN_RE.match(expression, pos)
+        if token is None:
+            raise ValueError(f"Unsupported jsonpath '{expression}': unexpected syntax at position {pos}")
+        if token["field"] is not None:
+            steps.append(token["field"])
+        elif token["index"] == _WILDCARD:
+            steps.append(_WILDCARD)
+        else:
+            steps.append(int(token["index"]))
+        pos = token.end()
+    return CompiledPath(expression, tuple(steps))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_regex(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def format_path(steps: tuple[PathStep, ...]) -> str:
+    return "".join(f"[{step}]" if isinstance(step, int) else f".{step}" for step in steps).lstrip(".")
+
+
+def set_path_value(node: Any, steps: tuple[PathStep, ...], value: Any):
+    for step in steps[:-1]:
+        node = node[step]
+    node[steps[-1]] = value
+
+
+def constant_fn_factory(constant):
+    def constant_fn(x):
+        return constant
+
+    constant_fn.__name__ = f"constant_fn_{constant}"
+    return constant_fn
+
+
+def iter_visual_containers(layout: dict) -> Iterator[tuple[tuple[PathStep, ...], dict]]:
+    for section_idx, section in enumerate(layout.get("sections", [])):
+        for container_idx, visual_container in enumerate(section.get("visualContainers", [])):
+            yield ("sections", section_idx, "visualContainers", container_idx), visual_container
+
+
+class SubstitutionRule:
+    def __init__(
+        self,
+        name                        : str,
+        rel_jsonpath_to_key_field   : str,
+        rel_jsonpath_to_value_field : str,
+        key_regex_pattern           : str,
+        substitution_fn             : str | Callable[[dict], str]
+    ):
+        # convert to callable non callable sub_fn
+        if not callable(substitution_fn):
+            substitution_fn = constant_fn_factory(substitution_fn)
+
+        self.name            = name
+        self.key_path        = compile_jsonpath(rel_jsonpath_to_key_field)
+        self.value_path      = compile_jsonpath(rel_jsonpath_to_value_field)
+        self.key_regex       = compile_regex(key_regex_pattern)
+        self.substitution_fn = substitution_fn
+
+    def matches_key(self, visual_container: dict) -> bool:
+        key_matches = self.key_path.find(visual_container)
+        if len(key_matches) == 0:
+            return False
+        key_str = key_matches[0][1]
+        return isinstance(key_str, str) and self.key_regex.match(key_str) is not None
+
+    def apply(self, visual_container_path: tuple[PathStep, ...], visual_container: dict) -> bool:
+        # filter visual container with no matching key
+        key_matches = self.key_path.find(visual_container)
+        if len(key_matches) == 0:
+            return False
+        key_path, key_str = key_matches[0]
+        key_regex_match = self.key_regex.match(key_str) if isinstance(key_str, str) else None
+        if key_regex_match is None:
+            return False
+        key_groups = key_regex_match.groupdict()
+
+        # processing value path
+        # - here we are not sure that visual container owns the full path to the visual. If it does not, then we only log an information
+        value_matches = self.value_path.find(visual_container)
+        if len(value_matches) == 0:
+            log.warning(f"- Substitution '{self.name}' skipped at path: {format_path(visual_container_path)}, key: {format_path(key_path)}/{key_str} (groups: {key_groups}): No value at relative jsonpath found: {self.value_path}")
+            return False
+
+        value_path, value_old_str = value_matches[0]
+        value_new_str = self.substitution_fn(key_groups)
+        set_path_value(visual_container, value_path, value_new_str)
+
+        # substitute only once
+        for other_value_path, _ in value_matches[1:]:
+            set_path_value(visual_container, other_value_path, "")
+
+        log.info(f"- Successful substitution '{self.name}' at path: {format_path(visual_container_path)}, key: {format_path(key_path)}/{key_str} (groups: {key_groups}), value path: {format_path(value_path)} / old value: {value_old_str}, new value: {value_new_str}")
+        return True
+
+    def __repr__(self):
+        return f"key path {self.key_path} / regex {self.key_regex.pattern} and value path {self.value_path}"
+
+
+def apply_substitution_rules(layout: dict, rules: list[SubstitutionRule]) -> list[int]:
+    log.info(f"Applying substitutions {[rule.name for rule in rules]}...")
+    counts = [0] * len(rules)
+    for visual_container_path, visual_container in iter_visual_containers(layout):
+        for rule_idx, rule in enumerate(rules):
+            if rule.apply(visual_container_path, visual_container):
+                counts[rule_idx] += 1
+
+    for rule, count in zip(rules, counts):
+        if count > 0:
+            log.info(f"Substitution '{rule.name}': replaced {count} values")
+        else:
+            log.warning(f"Nothing performed for substitution request '{rule.name}': {rule}")
+    return counts
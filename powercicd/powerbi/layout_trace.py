@@ -0,0 +1,74 @@
+import gzip
+import json
+import logging
+import os
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+def escape_json_pointer_token(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def diff_json(old: Any, new: Any, path: str = "") -> list[dict]:
+    # minimal JSON-patch (RFC 6902) style diff: only changed nodes are reported
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{escape_json_pointer_token(key)}"})
+        for key, value in new.items():
+            key_path = f"{path}/{escape_json_pointer_token(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": key_path, "value": value})
+            else:
+                ops.extend(diff_json(old[key], value, key_path))
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        common_length = min(len(old), len(new))
+        for i in range(common_length):
+            ops.extend(diff_json(old[i], new[i], f"{path}/{i}"))
+        for i in range(common_length, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        # remove from the end, so that the indexes stay valid when the patch is applied
+        for i in reversed(range(common_length, len(old))):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return ops
+
+    if type(old) is not type(new) or old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+
+class LayoutTrace:
+    def __init__(self, trace_dir: str, compress: bool = False):
+        self.trace_dir = trace_dir
+        self.compress  = compress
+        self._snapshot = None
+        self._step_idx = 0
+
+    @staticmethod
+    def _copy(layout: dict):
+        return json.loads(json.dumps(layout))
+
+    def record(self, layout: dict, step_name: str):
+        # the first recorded step is the baseline the following steps are compared to
+        if self._snapshot is None:
+            self._snapshot = self._copy(layout)
+            return
+
+        ops = diff_json(self._snapshot, layout)
+        self._snapshot = self._copy(layout)
+        self._step_idx += 1
+
+        file = f"{self.trace_dir}/{self._step_idx}_{step_name}.patch.json"
+        if self.compress:
+            file += ".gz"
+        log.info(f"Writing {len(ops)} changes of layout transformation step '{step_name}' to '{file}'...")
+        os.makedirs(self.trace_dir, exist_ok=True)
+        opener = gzip.open if self.compress else open
+        with opener(file, 'wt', encoding='utf-8') as f:
+            json.dump(ops, f, ensure_ascii=False)
@@ -0,0 +1,238 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from powercicd.powerbi.powerbi_transport import PowerBiTransport, TransferProgress
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_RANGE_SIZE_BYTES    = 16 * 1024 * 1024
+DEFAULT_DOWNLOAD_WORKERS    = 4
+RANGE_MAX_ATTEMPTS          = 3
+STREAM_CHUNK_SIZE_BYTES     = 1024 * 1024
+HASH_BUFFER_SIZE            = 1024 * 1024
+GZIP_MAGIC                  = b"\x1f\x8b"
+PARTIAL_FILE_SUFFIX         = ".part"
+PARTIAL_STATE_SUFFIX        = ".part.json"
+MD5_HEADERS                 = ("x-ms-blob-content-md5", "Content-MD5")
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+|\*)")
+
+
+class DownloadIntegrityError(Exception):
+    pass
+
+
+def parse_content_range(content_range: str | None) -> tuple[int, int, int | None] | None:
+    match = _CONTENT_RANGE_RE.fullmatch((content_range or "").strip())
+    if match is None:
+        return None
+    total = None if match["total"] == "*" else int(match["total"])
+    return int(match["start"]), int(match["end"]), total
+
+
+def get_expected_md5(response: requests.Response, ranged: bool) -> str | None:
+    # the Content-MD5 of a partial response is the one of the range, not of the whole file
+    for header in MD5_HEADERS:
+        if ranged and header == "Content-MD5":
+            continue
+        if header in response.headers:
+            return base64.b64decode(response.headers[header]).hex()
+    return None
+
+
+def hash_file_md5(file_path: str) -> str:
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_download(file_path: str, expected_size: int | None, expected_md5: str | None, verify_zip: bool):
+    size = os.path.getsize(file_path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadIntegrityError(f"Downloaded '{file_path}' has {size} bytes, expected {expected_size}")
+    if expected_md5 is not None:
+        md5 = hash_file_md5(file_path)
+        if md5 != expected_md5:
+            raise DownloadIntegrityError(f"Downloaded '{file_path}' has the md5 {md5}, expected {expected_md5}")
+    if verify_zip and not zipfile.is_zipfile(file_path):
+        raise DownloadIntegrityError(f"Downloaded '{file_path}' is not a valid zip archive")
+    log.info(f"Verified '{file_path}': {size} bytes{', md5 ' + expected_md5 if expected_md5 else ''}")
+
+
+# ---- download of the whole body ----
+
+def write_response_body(response: requests.Response, part_path: str, progress: TransferProgress) -> str:
+    # the declared content-encoding is decoded by requests. A gzip body without content-encoding header is detected
+    # by its magic number and decompressed as well. Returns the md5 of the received bytes
+    decompressor = None
+    digest       = hashlib.md5()
+    with open(part_path, "wb") as f:
+        for chunk_idx, chunk in enumerate(response.iter_content(chunk_size=STREAM_CHUNK_SIZE_BYTES)):
+            progress.add(len(chunk))
+            digest.update(chunk)
+            if chunk_idx == 0 and chunk.startswith(GZIP_MAGIC):
+                log.info("Response body is gzip compressed: decompressing it")
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            f.write(decompressor.decompress(chunk) if decompressor is not None else chunk)
+        if decompressor is not None:
+            f.write(decompressor.flush())
+    return digest.hexdigest()
+
+
+# ---- ranged download ----
+
+class RangedDownloadState:
+    # ranges already written to the partial file, persisted next to it, so that a failed download can be resumed
+    def __init__(self, state_path: str, url: str, total: int, validator: str | None, range_size: int):
+        self.state_path = state_path
+        self.url        = url
+        self.total      = total
+        self.validator  = validator
+        self.range_size = range_size
+        self.done       : set[int] = set()
+        self._lock      = threading.Lock()
+
+    def _key(self) -> dict:
+        return {"url": self.url, "total": self.total, "validator": self.validator, "range_size": self.range_size}
+
+    def load(self) -> bool:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("key") != self._key():
+            log.info(f"Partial download '{self.state_path}' is outdated: restarting the download")
+            return False
+        self.done = set(state["done"])
+        return True
+
+    def mark_done(self, start: int):
+        with self._lock:
+            self.done.add(start)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": self._key(), "done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.state_path)
+
+
+def write_range(part_path: str, start: int, data: bytes):
+    with open(part_path, "r+b") as f:
+        f.seek(start)
+        f.write(data)
+
+
+def download_range(api: PowerBiTransport, url: str, part_path: str, start: int, end: int, authorize: bool, progress: TransferProgress):
+    for attempt in range(1, RANGE_MAX_ATTEMPTS + 1):
+        try:
+            response = api.get(url, authorize=authorize, headers={"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"})
+            content_range = parse_content_range(response.headers.get("Content-Range"))
+            if response.status_code != 206 or content_range is None or content_range[:2] != (start, end) or len(response.content) != end - start + 1:
+                raise DownloadIntegrityError(f"Unexpected response to the range {start}-{end}: status {response.status_code}, Content-Range {response.headers.get('Content-Range')}, {len(response.content)} bytes")
+            write_range(part_path, start, response.content)
+            progress.add(len(response.content))
+            return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, DownloadIntegrityError) as e:
+            if attempt == RANGE_MAX_ATTEMPTS:
+                raise
+            log.warning(f"Download of the range {start}-{end} failed (attempt {attempt}/{RANGE_MAX_ATTEMPTS}): {e}")
+
+
+def download_ranges(
+    api        : PowerBiTransport,
+    url        : str,
+    part_path  : str,
+    first      : requests.Response,
+    total      : int,
+    range_size : int,
+    workers    : int,
+    authorize  : bool,
+    progress   : TransferProgress,
+):
+    validator = first.headers.get("ETag") or first.headers.get("Last-Modified")
+    state     = RangedDownloadState(f"{part_path[:-len(PARTIAL_FILE_SUFFIX)]}{PARTIAL_STATE_SUFFIX}", url, total, validator, range_size)
+    if not (state.load() and os.path.exists(part_path)):
+        state.done = set()
+        with open(part_path, "wb") as f:
+            f.truncate(total)
+    elif len(state.done) > 0:
+        log.info(f"Resuming the download: {len(state.done)} ranges already downloaded")
+
+    # the first range has been received with the probe
+    first_end = parse_content_range(first.headers["Content-Range"])[1]
+    if len(first.content) != first_end + 1:
+        raise DownloadIntegrityError(f"Received {len(first.content)} bytes for the range 0-{first_end}")
+    write_range(part_path, 0, first.content)
+    progress.add(len(first.content))
+    state.mark_done(0)
+
+    missing = [(start, min(start + range_size, total) - 1) for start in range(0, total, range_size) if start not in state.done]
+    progress.add(sum(min(start + range_size, total) - start for start in state.done if start != 0))
+    log.info(f"Downloading {len(missing)} ranges of {range_size} bytes with {workers} workers")
+
+    def download(start_end):
+        start, end = start_end
+        download_range(api, url, part_path, start, end, authorize, progress)
+        state.mark_done(start)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(download, missing))
+    return state.state_path
+
+
+def download_file(
+    api        : PowerBiTransport,
+    url        : str,
+    file_path  : str,
+    range_size : int  = DEFAULT_RANGE_SIZE_BYTES,
+    workers    : int  = DEFAULT_DOWNLOAD_WORKERS,
+    authorize  : bool = True,
+    verify_zip : bool = False,
+):
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    part_path  = f"{file_path}{PARTIAL_FILE_SUFFIX}"
+    state_path = None
+
+    # probe the range support with the first range
+    with api.get(url, authorize=authorize, stream=True, headers={"Range": f"bytes=0-{range_size - 1}", "Accept-Encoding": "identity"}) as first:
+        content_range = parse_content_range(first.headers.get("Content-Range"))
+        if first.status_code == 206 and content_range is not None and content_range[2] is not None:
+            total        = content_range[2]
+            expected_md5 = get_expected_md5(first, ranged=True)
+            progress     = TransferProgress(f"Download of '{file_path}'", total)
+            log.info(f"Downloading '{file_path}' ({total} bytes) in parallel ranges")
+            state_path   = download_ranges(api, url, part_path, first, total, range_size, workers, authorize, progress)
+        else:
+            # no range support: the whole body is streamed (the range request header is ignored by the server).
+            # With a content-encoding, the length and md5 headers are the ones of the encoded bytes: they are not checked
+            encoded        = "Content-Encoding" in first.headers
+            content_length = int(first.headers["Content-Length"]) if not encoded and "Content-Length" in first.headers else None
+            progress       = TransferProgress(f"Download of '{file_path}'", content_length or 0)
+            log.info(f"Downloading '{file_path}' (no range support)")
+            received_md5   = write_response_body(first, part_path, progress)
+            if content_length is not None and progress.done_bytes != content_length:
+                raise DownloadIntegrityError(f"Received {progress.done_bytes} bytes of '{file_path}', expected {content_length}")
+            expected_md5   = None if encoded else get_expected_md5(first, ranged=False)
+            if expected_md5 is not None and received_md5 != expected_md5:
+                raise DownloadIntegrityError(f"Received '{file_path}' with the md5 {received_md5}, expected {expected_md5}")
+            # already verified on the received bytes
+            total, expected_md5 = None, None
+    progress.finish()
+
+    verify_download(part_path, total, expected_md5, verify_zip)
+    os.replace(part_path, file_path)
+    if state_path is not None and os.path.exists(state_path):
+        os.remove(state_path)
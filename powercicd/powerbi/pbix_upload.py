@@ -0,0 +1,185 @@
+import base64
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+from powercicd.powerbi.powerbi_transport import PowerBiTransport, TransferProgress
+
+log = logging.getLogger(__name__)
+
+
+# the service does not accept the direct multipart import of files above 1 GB
+DEFAULT_LARGE_FILE_THRESHOLD_BYTES = 1024 * 1024 * 1024
+DEFAULT_BLOCK_SIZE_BYTES           = 32 * 1024 * 1024
+DEFAULT_UPLOAD_WORKERS             = 4
+STREAM_CHUNK_SIZE_BYTES            = 1024 * 1024
+
+
+class MultipartFileStream:
+    # multipart/form-data body streaming a file from disk: the file is never loaded in memory. The length is known
+    # upfront (no chunked transfer encoding) and the stream is seekable, so that the transport can rewind it on retry
+    def __init__(self, file_path: str, field_name: str = "file", progress: TransferProgress | None = None):
+        self.boundary = uuid.uuid4().hex
+        file_name     = os.path.basename(file_path).replace('"', "")
+        self.head     = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        self.tail      = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.file      = open(file_path, "rb")
+        self.file_size = os.fstat(self.file.fileno()).st_size
+        self.len       = len(self.head) + self.file_size + len(self.tail)
+        self.progress  = progress
+        self._pos      = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            pos += self.len
+        self._pos = max(0, min(pos, self.len))
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.len - self._pos
+        parts = []
+        while size > 0 and self._pos < self.len:
+            file_start = len(self.head)
+            file_end   = file_start + self.file_size
+            if self._pos < file_start:
+                part = self.head[self._pos:self._pos + size]
+            elif self._pos < file_end:
+                self.file.seek(self._pos - file_start)
+                part = self.file.read(min(size, file_end - self._pos, STREAM_CHUNK_SIZE_BYTES))
+                if self.progress is not None:
+                    self.progress.add(len(part))
+            else:
+                part = self.tail[self._pos - file_end:self._pos - file_end + size]
+            parts.append(part)
+            self._pos += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_imports_path(group_id: str) -> str:
+    return f"v1.0/myorg/groups/{group_id}/imports"
+
+
+def import_pbix_streamed(
+    api                  : PowerBiTransport,
+    group_id             : str,
+    dataset_display_name : str,
+    file_path            : str,
+    name_conflict        : str = "CreateOrOverwrite",
+) -> dict:
+    progress = TransferProgress(f"Upload of '{file_path}'", os.path.getsize(file_path))
+    with MultipartFileStream(file_path, progress=progress) as body:
+        log.info(f"Importing '{file_path}' ({body.file_size} bytes) as '{dataset_display_name}'")
+        response = api.post(
+            get_imports_path(group_id),
+            params={"datasetDisplayName": dataset_display_name, "nameConflict": name_conflict},
+            data=body,
+            headers={"Content-Type": body.content_type},
+        )
+    progress.finish()
+    return response.json()
+
+
+def get_block_id(block_idx: int) -> str:
+    # all the block ids of a blob must have the same length
+    return base64.b64encode(f"{block_idx:08d}".encode("ascii")).decode("ascii")
+
+
+def upload_block(api: PowerBiTransport, blob_url: str, file_path: str, block_idx: int, block_size: int, progress: TransferProgress) -> str:
+    with open(file_path, "rb") as f:
+        f.seek(block_idx * block_size)
+        data = f.read(block_size)
+    block_id = get_block_id(block_idx)
+    api.put(blob_url, authorize=False, params={"comp": "block", "blockid": block_id}, data=data)
+    progress.add(len(data))
+    return block_id
+
+
+def upload_blob_in_blocks(
+    api        : PowerBiTransport,
+    blob_url   : str,
+    file_path  : str,
+    block_size : int = DEFAULT_BLOCK_SIZE_BYTES,
+    workers    : int = DEFAULT_UPLOAD_WORKERS,
+):
+    file_size   = os.path.getsize(file_path)
+    block_count = max(1, (file_size + block_size - 1) // block_size)
+    progress    = TransferProgress(f"Upload of '{file_path}'", file_size)
+    log.info(f"Uploading '{file_path}' ({file_size} bytes) in {block_count} blocks with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        block_ids = list(executor.map(
+            lambda block_idx: upload_block(api, blob_url, file_path, block_idx, block_size, progress),
+            range(block_count),
+        ))
+    progress.finish()
+
+    # commit the blocks in the file order
+    block_list = "".join(f"<Latest>{escape(block_id)}</Latest>" for block_id in block_ids)
+    api.put(
+        blob_url,
+        authorize=False,
+        params={"comp": "blocklist"},
+        data=f'<?xml version="1.0" encoding="utf-8"?><BlockList>{block_list}</BlockList>'.encode("utf-8"),
+        headers={"Content-Type": "application/xml"},
+    )
+
+
+def import_pbix_from_temporary_upload(
+    api                  : PowerBiTransport,
+    group_id             : str,
+    dataset_display_name : str,
+    file_path            : str,
+    name_conflict        : str = "CreateOrOverwrite",
+    block_size           : int = DEFAULT_BLOCK_SIZE_BYTES,
+    workers              : int = DEFAULT_UPLOAD_WORKERS,
+) -> dict:
+    upload_location = api.post(f"{get_imports_path(group_id)}/createTemporaryUploadLocation").json()
+    blob_url        = upload_location["Url"]
+    upload_blob_in_blocks(api, blob_url, file_path, block_size, workers)
+
+    log.info(f"Importing '{file_path}' from the temporary upload location as '{dataset_display_name}'")
+    return api.post(
+        get_imports_path(group_id),
+        params={"datasetDisplayName": dataset_display_name, "nameConflict": name_conflict},
+        json={"fileUrl": blob_url},
+    ).json()
+
+
+def import_pbix(
+    api                        : PowerBiTransport,
+    group_id                   : str,
+    dataset_display_name       : str,
+    file_path                  : str,
+    name_conflict              : str = "CreateOrOverwrite",
+    large_file_threshold_bytes : int = DEFAULT_LARGE_FILE_THRESHOLD_BYTES,
+    block_size                 : int = DEFAULT_BLOCK_SIZE_BYTES,
+    workers                    : int = DEFAULT_UPLOAD_WORKERS,
+) -> dict:
+    if os.path.getsize(file_path) > large_file_threshold_bytes:
+        return import_pbix_from_temporary_upload(api, group_id, dataset_display_name, file_path, name_conflict, block_size, workers)
+    return import_pbix_streamed(api, group_id, dataset_display_name, file_path, name_conflict)
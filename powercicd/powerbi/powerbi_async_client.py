@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from typing import Any, Callable
+
+from powercicd.powerbi.deployment_fingerprint import DATASET_FINGERPRINT_PARAMETER
+from powercicd.powerbi.gateway_datasources import GatewayDatasourceIndex
+from powercicd.powerbi.config import DatasetRefreshSchedule, Datasource, Group, Report
+from powercicd.powerbi.powerbi_client import DEFAULT_CLEANUP_WORKERS, CleanupResult, PowerBiWebClient
+from powercicd.powerbi.refresh_waiter import DatasetKey, RefreshWaitResult
+
+log = logging.getLogger(__name__)
+
+
+class AsyncPowerBiClient:
+    # asyncio facade of PowerBiWebClient: each blocking API call runs in a worker thread and shares the pooled
+    # http transport of the client, while the waits (refresh polling) are non-blocking
+    def __init__(self, client: PowerBiWebClient):
+        self.client         = client
+        # shared by all the deployments running concurrently
+        self.refresh_waiter = client.new_refresh_waiter()
+
+    async def _call(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    # ---- groups, reports and datasets ----
+
+    async def get_group_by_name(self, group_name: str) -> Group:
+        return await self._call(self.client.get_group_by_name, group_name)
+
+    async def try_get_report_by_name(self, group_id: str, report_name: str) -> Report | None:
+        return await self._call(self.client.try_get_report_by_name, group_id, report_name)
+
+    async def take_over_report(self, group_id: str, report_id: str):
+        await self._call(self.client.take_over_report, group_id, report_id)
+
+    async def update_report_content(self, group_id: str, upload_report_id: str, final_report_id: str):
+        await self._call(self.client.update_report_content, group_id, upload_report_id, final_report_id)
+
+    async def rebind_report_to_dataset(self, group_id: str, report_id: str, dataset_id: str):
+        await self._call(self.client.rebind_report_to_dataset, group_id, report_id, dataset_id)
+
+    async def clone_report(self, group_id: str, report_id: str, final_report_name: str):
+        await self._call(self.client.clone_report, group_id, report_id, final_report_name)
+
+    async def cleanup_reports(self, group_id: str, cleanup_regex: str, exclude_report_names: list[str], workers: int = DEFAULT_CLEANUP_WORKERS, dry_run: bool = False) -> CleanupResult:
+        return await self._call(self.client.cleanup_reports, group_id, cleanup_regex, exclude_report_names, workers, dry_run)
+
+    async def get_dataset(self, group_id: str, dataset_id: str) -> dict:
+        return await self._call(self.client.get_dataset, group_id, dataset_id)
+
+    async def get_dataset_parameters(self, group_id: str, dataset_id: str) -> dict[str, str]:
+        return await self._call(self.client.get_dataset_parameters, group_id, dataset_id)
+
+    async def get_deployed_fingerprint(self, group_id: str, report_name: str) -> str | None:
+        report = await self.try_get_report_by_name(group_id, report_name)
+        if report is None:
+            return None
+        parameters = await self.get_dataset_parameters(group_id, report["DatasetId"])
+        return parameters.get(DATASET_FINGERPRINT_PARAMETER)
+
+    async def update_dataset_parameters(self, group_id: str, dataset_id: str, dataset_parameters: dict[str, str]):
+        await self._call(self.client.update_dataset_parameters, group_id, dataset_id, dataset_parameters)
+
+    async def set_dataset_refresh_schedule(self, group_id: str, dataset_id: str, refresh_schedule: DatasetRefreshSchedule):
+        await self._call(self.client.set_dataset_refresh_schedule, group_id, dataset_id, refresh_schedule)
+
+    # ---- imports ----
+
+    async def import_report(self, group_id: str, report_name: str, file_path: str):
+        await self._call(self.client.import_report, group_id, report_name, file_path)
+
+    # ---- refreshes ----
+
+    async def trigger_dataset_refresh(self, group_id: str, dataset_id: str):
+        await self._call(self.client.trigger_dataset_refresh, group_id, dataset_id)
+
+    async def wait_for_end_of_any_active_dataset_refresh(self, group_id: str, dataset_id: str) -> RefreshWaitResult:
+        return await self.refresh_waiter.wait(group_id, dataset_id)
+
+    async def wait_for_end_of_active_dataset_refreshes(self, datasets: list[DatasetKey]) -> dict[DatasetKey, RefreshWaitResult | BaseException]:
+        return await self.refresh_waiter.wait_all(datasets)
+
+    # ---- gateway binding ----
+
+    async def get_gateway_cluster_datasources(self, gateway_type: str | None = None, expand_users: bool = False) -> list[Datasource]:
+        return await self._call(self.client.get_gateway_cluster_datasources, gateway_type, expand_users)
+
+    async def get_gateway_datasource_index(self, gateway_type: str | None = None, refresh: bool = False) -> GatewayDatasourceIndex:
+        return await self._call(self.client.get_gateway_datasource_index, gateway_type, refresh)
+
+    async def get_dataset_datasources(self, group_id: str, dataset_id: str) -> list[Datasource]:
+        return await self._call(self.client.get_dataset_datasources, group_id, dataset_id)
+
+    async def bind_dataset_to_gateway(self, group_id: str, dataset_id: str, gateway_id: str, datasource_ids: list[str]):
+        await self._call(self.client.bind_dataset_to_gateway, group_id, dataset_id, gateway_id, datasource_ids)
+
+    # ---- deployment flow ----
+
+    async def deploy_report(
+        self,
+        group_id           : str,
+        upload_report_name : str,
+        final_report_name  : str,
+        file_path          : str,
+        dataset_parameters : dict[str, str] = None,
+        refresh_schedule   : DatasetRefreshSchedule | None = None,
+        cleanup_regex      : str | None = None,
+    ):
+        log.info(f"Deploying report '{upload_report_name}' from '{file_path}'")
+        report_before = await self.try_get_report_by_name(group_id, upload_report_name)
+
+        if report_before is not None:
+            log.warning(f"Report '{upload_report_name}' already exists in the group '{group_id}'. Report and underlying semantic model may be temporarily out-of-sync!!")
+            await self.take_over_report(group_id, report_before["Id"])
+
+        await self.import_report(group_id, upload_report_name, file_path)
+
+        report     = await self.try_get_report_by_name(group_id, upload_report_name)
+        report_id  = report["Id"]
+        dataset_id = report["DatasetId"]
+
+        await self.take_over_report(group_id, report_id)
+        await self.wait_for_end_of_any_active_dataset_refresh(group_id, dataset_id)
+        if dataset_parameters is not None:
+            if DATASET_FINGERPRINT_PARAMETER in dataset_parameters:
+                declared_parameters = await self.get_dataset_parameters(group_id, dataset_id)
+                if DATASET_FINGERPRINT_PARAMETER not in declared_parameters:
+                    log.warning(f"The semantic model of '{upload_report_name}' has no text parameter '{DATASET_FINGERPRINT_PARAMETER}': unchanged deployments can't be skipped")
+                    dataset_parameters = {key: value for key, value in dataset_parameters.items() if key != DATASET_FINGERPRINT_PARAMETER}
+            await self.update_dataset_parameters(group_id, dataset_id, dataset_parameters)
+
+        # bind datasource to relevant gateway datasources
+        gateway_index, dataset_datasources = await asyncio.gather(
+            self.get_gateway_datasource_index("TenantCloud"),
+            self.get_dataset_datasources(group_id, dataset_id),
+        )
+        datasource_ids_by_gateway_id, unmanaged_keys = gateway_index.get_datasource_ids_by_gateway_id(dataset_datasources)
+        if len(unmanaged_keys) > 0 and gateway_index.from_disk:
+            # the datasource may have been added to the gateway after the disk cache was written
+            gateway_index = await self.get_gateway_datasource_index("TenantCloud", refresh=True)
+            datasource_ids_by_gateway_id, unmanaged_keys = gateway_index.get_datasource_ids_by_gateway_id(dataset_datasources)
+        log.info(f"{unmanaged_keys=}, {datasource_ids_by_gateway_id=}")
+        for gateway_id, datasource_ids in datasource_ids_by_gateway_id.items():
+            await self.bind_dataset_to_gateway(group_id, dataset_id, gateway_id, datasource_ids)
+
+        # trigger dataset refresh
+        await self.wait_for_end_of_any_active_dataset_refresh(group_id, dataset_id)
+        await self.trigger_dataset_refresh(group_id, dataset_id)
+
+        # wait for the refresh of the new dataset and for any refresh of the final report dataset at once
+        final_report = await self.try_get_report_by_name(group_id, final_report_name)
+        datasets_to_wait = [(group_id, dataset_id)]
+        if final_report is not None:
+            datasets_to_wait.append((group_id, final_report["DatasetId"]))
+        for result in (await self.wait_for_end_of_active_dataset_refreshes(datasets_to_wait)).values():
+            if isinstance(result, BaseException):
+                raise result
+
+        # set refresh schedule
+        if refresh_schedule is not None:
+            await self.set_dataset_refresh_schedule(group_id, dataset_id, refresh_schedule)
+
+        # finalize the report
+        if final_report is not None:
+            final_report_id = final_report["Id"]
+            await self.take_over_report(group_id, final_report_id)
+            await self.update_report_content(group_id, report_id, final_report_id)
+            await self.rebind_report_to_dataset(group_id, final_report_id, dataset_id)
+        else:
+            await self.clone_report(group_id, report_id, final_report_name)
+
+        # cleanup
+        if cleanup_regex is not None:
+            await self.cleanup_reports(group_id, cleanup_regex, exclude_report_names=[final_report_name])
+
@@ -1,48 +1,101 @@
 # %%
-import gzip
+import asyncio
 import logging
 import re
+import threading
 import time
-from pathlib import Path
-from urllib.request import Request, urlopen
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
-import requests
 from azure.core.credentials import AccessToken
 from azure.identity import DefaultAzureCredential
-from requests.sessions import Session
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chromium.webdriver import ChromiumDriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
-from powercicd.powerbi.config import DatasetRefreshSchedule, Report, Group, Datasource
+from powercicd.powerbi.api_defaults import DEFAULT_CLEANUP_WORKERS
+from powercicd.powerbi.config import DatasetRefreshSchedule, Report, Group, Dataset, Datasource
+import powercicd.powerbi.gateway_datasources as gateway_datasources
+import powercicd.powerbi.pbix_download as pbix_download
+import powercicd.powerbi.pbix_upload as pbix_upload
+import powercicd.powerbi.refresh_waiter as refresh_waiter
+from powercicd.powerbi.gateway_datasources import GatewayDatasourceIndex
+from powercicd.powerbi.refresh_waiter import RefreshWaiter
+from powercicd.powerbi.powerbi_transport import DEFAULT_API_BASE_URL, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE, PowerBiTransport
 from powercicd.shared.logging_utils import log_call
+from powercicd.shared.ttl_cache import TtlCache
 from powercicd.shared.selenium_common import new_browser
 
 # %%
 log = logging.getLogger(__name__)
 
 
+DEFAULT_METADATA_TTL_SECONDS = 5 * 60
+REFRESH_HISTORY_TOP          = 1
+
+
+class CleanupResult(NamedTuple):
+    reports  : list[Report]
+    datasets : list[Dataset]
+    failed   : list[dict]
+
+
+def quote_odata_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
 # TODO: Migrate whole retrieve and deploy scripts to python by using example: https://github.com/Azure-Samples/powerbi-powershell/blob/master/manageRefresh.ps1
 
 
-def build_datasource_key(ds) -> str:
-    return "_".join([ds[key].strip(" /") for key in sorted(ds) if isinstance(ds[key], str)])
+def get_orphan_datasets(reports: list[Report], datasets: list[Dataset], deleted_report_ids: set[str]) -> list[Dataset]:
+    # only the datasets of the deleted reports: a dataset without listed report may be the one of a report being
+    # imported concurrently
+    deleted_dataset_ids   = set(r["DatasetId"] for r in reports if r["Id"] in deleted_report_ids)
+    remaining_dataset_ids = set(r["DatasetId"] for r in reports if r["Id"] not in deleted_report_ids)
+    return [d for d in datasets if d["Id"] in deleted_dataset_ids and d["Id"] not in remaining_dataset_ids]
 
 
 class PowerBiWebClient:
-    def __init__(self, tenant: str, keep_browser_open: bool):
+    def __init__(
+        self,
+        tenant            : str,
+        keep_browser_open : bool,
+        api_base_url      : str = DEFAULT_API_BASE_URL,
+        http_pool_size    : int = DEFAULT_POOL_SIZE,
+        http_max_retries  : int = DEFAULT_MAX_RETRIES,
+        metadata_ttl_seconds : float = DEFAULT_METADATA_TTL_SECONDS,
+    ):
         self.keep_browser_open : bool                   = keep_browser_open
         self.tenant            : str                    = tenant
         self.powerbi_url       : str                    = f"https://app.powerbi.com/home?ctid={self.tenant}&experience=power-bi"
         self._browser          : None | ChromiumDriver  = None
         self._azure_credential : DefaultAzureCredential = DefaultAzureCredential(exclude_interactive_browser_credential=False)
         self._token            : None | AccessToken     = None
-        self._session          : None | Session         = None
+        self.api               : PowerBiTransport       = PowerBiTransport(
+            token_provider = lambda: self.token_string,
+            api_base_url   = api_base_url,
+            pool_size      = http_pool_size,
+            max_retries    = http_max_retries,
+        )
+        # group, report and dataset listings, invalidated by the calls modifying them
+        self.metadata_cache    : TtlCache               = TtlCache(metadata_ttl_seconds)
 
-        self.active_refresh_timeout_seconds = 60 * 60 * 20
-        self.active_refresh_polling_seconds = 60
+        self.refresh_timeout_seconds       = refresh_waiter.DEFAULT_TIMEOUT_SECONDS
+        self.refresh_initial_delay_seconds = refresh_waiter.DEFAULT_INITIAL_DELAY_SECONDS
+        self.refresh_max_delay_seconds     = refresh_waiter.DEFAULT_MAX_DELAY_SECONDS
+
+        self.large_import_threshold_bytes  = pbix_upload.DEFAULT_LARGE_FILE_THRESHOLD_BYTES
+        self.upload_block_size_bytes       = pbix_upload.DEFAULT_BLOCK_SIZE_BYTES
+        self.upload_workers                = pbix_upload.DEFAULT_UPLOAD_WORKERS
+        self.download_workers              = pbix_download.DEFAULT_DOWNLOAD_WORKERS
+
+        # gateway datasources: fetched once per run, optionally cached on disk (ttl 0: no disk cache)
+        self.gateway_cache_dir             : str | None = None
+        self.gateway_cache_ttl_seconds     = gateway_datasources.DEFAULT_GATEWAY_CACHE_TTL_SECONDS
+        self._gateway_indexes              : dict[str | None, GatewayDatasourceIndex] = {}
+        self._gateway_lock                 = threading.Lock()
 
     @property 
     def browser(self) -> ChromiumDriver:
@@ -74,17 +127,6 @@ class PowerBiWebClient:
             self._token: AccessToken = self._azure_credential.get_token("https://analysis.windows.net/powerbi/api/.default")
         return self._token.token
 
-    @property
-    def session(self):
-        if self._has_token_expired():
-            self._session = requests.Session()
-            self._session.headers.update({
-                "Authorization": f"Bearer {self.token_string}",
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-            })
-        return self._session
-
     def login_in_api(self):
         dummy = self.token_string
         log.info("Logged in to Power BI API")
@@ -114,10 +156,32 @@ class PowerBiWebClient:
         if not self.is_logged_in_in_browser():
             raise ValueError("Login check failed even after manual login. Please check the opened browser window.")
 
+    def get_groups_by_name(self, group_name: str) -> list[Group]:
+        # server-side filtering: only the matching groups are downloaded
+        return self.metadata_cache.get_or_load(
+            ("groups", group_name),
+            lambda: self.api.get("v1.0/myorg/groups", params={"$filter": f"name eq {quote_odata_string(group_name)}"}).json()["value"],
+        )
+
+    def get_reports(self, group_id: str) -> list[Report]:
+        # the reports api does not support $filter: the listing of the group is cached instead
+        return self.metadata_cache.get_or_load(
+            ("reports", group_id),
+            lambda: self.api.get(f"v1.0/myorg/groups/{group_id}/reports").json()["value"],
+        )
+
+    def get_datasets(self, group_id: str) -> list[Dataset]:
+        return self.metadata_cache.get_or_load(
+            ("datasets", group_id),
+            lambda: self.api.get(f"v1.0/myorg/groups/{group_id}/datasets").json()["value"],
+        )
+
+    def invalidate_group_metadata(self, group_id: str):
+        self.metadata_cache.invalidate(("reports", group_id), ("datasets", group_id))
+
     @log_call()
     def try_get_group_by_name(self, group_name: str) -> Group | None:
-        groups: list[Group] = self.session.get("https://api.powerbi.com/v1.0/myorg/groups").json()["value"]
-        groups = [g for g in groups if g["Name"] == group_name]
+        groups = [g for g in self.get_groups_by_name(group_name) if g["Name"] == group_name]
         if len(groups) == 0:
             return None
         elif len(groups) > 1:
@@ -132,8 +196,7 @@ class PowerBiWebClient:
 
     @log_call()
     def try_get_report_by_name(self, group_id: str, report_name: str) -> Report | None:
-        reports: list[Report] = self.session.get(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports").json()["value"]
-        reports = [ri for ri in reports if ri["Name"] == report_name]
+        reports = [ri for ri in self.get_reports(group_id) if ri["Name"] == report_name]
         if len(reports) == 0:
             return None
         elif len(reports) > 1:
@@ -146,48 +209,54 @@ class PowerBiWebClient:
             raise ValueError(f"Report '{report_name}' not found in group '{group_id}'")
         return report
 
+    def get_active_dataset_refreshes(self, group_id: str, dataset_id: str) -> list[dict]:
+        # the refresh history is ordered by start time: a refresh in progress (status 'Unknown') is the latest one
+        refreshes = self.api.get(
+            f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshes",
+            params={"$top": REFRESH_HISTORY_TOP},
+        ).json()["value"]
+        return [r for r in refreshes if r["status"] == "Unknown"]
+
+    def new_refresh_waiter(self) -> RefreshWaiter:
+        return RefreshWaiter(
+            get_active_refreshes  = self.get_active_dataset_refreshes,
+            initial_delay_seconds = self.refresh_initial_delay_seconds,
+            max_delay_seconds     = self.refresh_max_delay_seconds,
+            timeout_seconds       = self.refresh_timeout_seconds,
+        )
+
     @log_call()
     def wait_for_end_of_any_active_dataset_refresh(self, group_id: str, dataset_id: str):
-        start_monotonic = time.monotonic()
-        while True:
-            if time.monotonic() - start_monotonic > self.active_refresh_timeout_seconds:
-                raise TimeoutError("Waiting for the end of any active dataset refresh took too long.")
-
-            refreshes = self.session.get(f"https://api.powerbi.com/v1.0/myorg/datasets/{dataset_id}/refreshes").json()["value"]
-            refreshes_in_status_unknown = [r for r in refreshes if r.status == "Unknown"]
-            if len(refreshes_in_status_unknown) == 0:
-                log.info("No active refreshes.")
-                break
-            log.info(f"{len(refreshes_in_status_unknown)} Active refreshes... sleep {self.active_refresh_polling_seconds} seconds")
-            time.sleep(self.active_refresh_polling_seconds)
+        asyncio.run(self.new_refresh_waiter().wait(group_id, dataset_id))
+
+    @log_call()
+    def trigger_dataset_refresh(self, group_id: str, dataset_id: str):
+        self.api.post(f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshes")
 
     @log_call()
     def get_dataset(self, group_id, dataset_id):
-        return self.session.get(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}").json()["value"]
+        return self.api.get(f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}").json()
+
+    @log_call()
+    def get_dataset_parameters(self, group_id: str, dataset_id: str) -> dict[str, str]:
+        parameters = self.api.get(f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/parameters").json()["value"]
+        return {p["name"]: p.get("currentValue") for p in parameters}
 
     @log_call()
     def retrieve_report(self, group_id: str, report_id: str, file_path: str):
         log.info(f"Downloading the report: '{report_id}' to '{file_path}'")
-        file_dir  = Path(file_path).parent
-        file_name = Path(file_path).name
-        file_dir.mkdir(parents=True, exist_ok=True)
-        request = Request(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{report_id}/Export", method="GET")
-        with (
-            urlopen(request) as response,
-            gzip.GzipFile(fileobj=response, mode='rb') as uncompressed,
-            open(file_path, "wb") as out_file
-        ):
-            while True:
-                chunk = uncompressed.read(1024 * 1024)
-                if not chunk:
-                    break
-                log.info(f"Writing {len(chunk)} bytes to '{file_path}'")
-                out_file.write(chunk)
+        pbix_download.download_file(
+            api        = self.api,
+            url        = f"v1.0/myorg/groups/{group_id}/reports/{report_id}/Export",
+            file_path  = file_path,
+            workers    = self.download_workers,
+            verify_zip = True,
+        )
 
     @log_call()
     def take_over_report(self, group_id: str, report_id: str):
         log.info(f"Taking over the report: '{report_id}'")
-        self.session.post(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{report_id}/Default.TakeOver")
+        self.api.post(f"v1.0/myorg/groups/{group_id}/reports/{report_id}/Default.TakeOver")
 
     @log_call()
     def update_dataset_parameters(self, group_id: str, dataset_id: str, dataset_parameters: dict[str, str]):
@@ -201,8 +270,8 @@ class PowerBiWebClient:
                 in dataset_parameters.items()
             ]
         }
-        self.session.post(
-            f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/Default.UpdateParameters",
+        self.api.post(
+            f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/Default.UpdateParameters",
             json=body
         )
 
@@ -213,28 +282,54 @@ class PowerBiWebClient:
         report_name: str,
         file_path: str,
     ):
-        with open(file_path, "rb") as f:
-            req = Request(
-                f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/imports?datasetDisplayName={report_name}&nameConflict=CreateOrOverwrite",
-                f,
-                headers=self.session.headers,
-                method="POST"
-            )
-            req.add_header("Content-Type", "multipart/form-data")
-            req.add_header("Content-Disposition", f"attachment; filename={file_path}")
-            urlopen(req)
+        # files above the threshold go through a temporary upload location, uploaded in parallel blocks
+        pbix_upload.import_pbix(
+            api                        = self.api,
+            group_id                   = group_id,
+            dataset_display_name       = report_name,
+            file_path                  = file_path,
+            large_file_threshold_bytes = self.large_import_threshold_bytes,
+            block_size                 = self.upload_block_size_bytes,
+            workers                    = self.upload_workers,
+        )
+        self.invalidate_group_metadata(group_id)
 
     @log_call()
-    def get_gateway_cluster_datasources(self, gateway_type: str | None = None) -> list[Datasource]:
-        all_datasources = self.session.get("https://api.powerbi.com/v2.0/myorg/me/gatewayClusterDatasources?$expand=users").json()["value"]
+    def get_gateway_cluster_datasources(self, gateway_type: str | None = None, expand_users: bool = False) -> list[Datasource]:
+        # the users of each datasource make the response much larger: they are only requested when needed
+        params = {"$expand": "users"} if expand_users else None
+        all_datasources = self.api.get("v2.0/myorg/me/gatewayClusterDatasources", params=params).json()["value"]
         if gateway_type is None:
             return all_datasources
         else:
             return [s for s in all_datasources if s["GatewayType"] == gateway_type]
 
+    def get_gateway_cache_path(self, gateway_type: str | None) -> str | None:
+        if self.gateway_cache_dir is None or self.gateway_cache_ttl_seconds <= 0:
+            return None
+        return f"{self.gateway_cache_dir}/{self.tenant}-{gateway_type or 'all'}.json"
+
+    def get_gateway_datasource_index(self, gateway_type: str | None = None, refresh: bool = False) -> GatewayDatasourceIndex:
+        # the lock is kept during the fetch, so that concurrent deployments wait for a single download
+        with self._gateway_lock:
+            index = self._gateway_indexes.get(gateway_type)
+            if index is not None and not refresh:
+                return index
+
+            cache_path = self.get_gateway_cache_path(gateway_type)
+            if cache_path is not None and not refresh:
+                index = GatewayDatasourceIndex.load(cache_path, self.gateway_cache_ttl_seconds)
+            if index is None or refresh:
+                index = GatewayDatasourceIndex(self.get_gateway_cluster_datasources(gateway_type))
+                if cache_path is not None:
+                    index.save(cache_path)
+            log.info(f"Indexed {len(index.datasources)} gateway datasources of type '{gateway_type}'")
+            self._gateway_indexes[gateway_type] = index
+            return index
+
     @log_call()
     def get_dataset_datasources(self, group_id: str, dataset_id: str) -> list[Datasource]:
-        return self.session.get(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/datasources").json()["value"]
+        return self.api.get(f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/datasources").json()["value"]
 
     @log_call()
     def bind_dataset_to_gateway(self, group_id: str, dataset_id: str, gateway_id: str, datasource_ids: list[str]):
@@ -242,8 +337,8 @@ class PowerBiWebClient:
             "gatewayObjectId": gateway_id,
             "datasourceObjectIds": datasource_ids
         }
-        self.session.post(
-            f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/Default.BindToGateway",
+        self.api.post(
+            f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/Default.BindToGateway",
             json=body
         )
 
@@ -252,8 +347,8 @@ class PowerBiWebClient:
         body = {
             "value": refresh_schedule.dict()
         }
-        self.session.patch(
-            f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshSchedule",
+        self.api.patch(
+            f"v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshSchedule",
             json=body
         )
 
@@ -267,8 +362,8 @@ class PowerBiWebClient:
             "sourceType": "ExistingReport",
         }
 
-        self.session.post(
-            f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{final_report_id}/Default.UpdateContent",
+        self.api.post(
+            f"v1.0/myorg/groups/{group_id}/reports/{final_report_id}/Default.UpdateContent",
             json=body
         )
 
@@ -277,20 +372,22 @@ class PowerBiWebClient:
         body = {
             "datasetId": dataset_id
         }
-        self.session.post(
-            f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{report_id}/Rebind",
+        self.api.post(
+            f"v1.0/myorg/groups/{group_id}/reports/{report_id}/Rebind",
             json=body
         )
+        self.invalidate_group_metadata(group_id)
 
     @log_call()
     def clone_report(self, group_id: str, report_id: str, final_report_name: str):
         body = {
             "name": final_report_name
         }
-        self.session.post(
-            f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{report_id}/Clone",
+        self.api.post(
+            f"v1.0/myorg/groups/{group_id}/reports/{report_id}/Clone",
             json=body
         )
+        self.invalidate_group_metadata(group_id)
 
     @log_call()
     def deploy_app(self, group_id: str, log_dir: str):
@@ -335,34 +432,62 @@ class PowerBiWebClient:
             raise
 
     @log_call()
-    def cleanup_reports(self, group_id: str, cleanup_regex: str, exclude_report_names: list[str]):
+    def cleanup_reports(
+        self,
+        group_id             : str,
+        cleanup_regex        : str,
+        exclude_report_names : list[str],
+        workers              : int  = DEFAULT_CLEANUP_WORKERS,
+        dry_run              : bool = False,
+    ) -> CleanupResult:
         exclude_report_names = set(exclude_report_names)
 
         re_cleanup = re.compile(cleanup_regex)
 
-        reports = self.session.get(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports").json()["value"]
+        # the deletions are decided on fresh listings, not on the cached ones
+        self.invalidate_group_metadata(group_id)
+        reports = self.get_reports(group_id)
+        datasets = self.get_datasets(group_id)
         reports_to_delete = [r for r in reports if re_cleanup.match(r["Name"]) and r["Name"] not in exclude_report_names]
-        for report in reports_to_delete:
-            report_id = report["Id"]
-            try:
-                log.info(f"Deleting report '{report['Name']}' with id '{report_id}'")
-                self.session.delete(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports/{report_id}")
-                log.info(f"Report deleted successfully.")
-            except:
-                log.exception(f"Failed to delete report '{report['Name']}'")
-
-        reports = self.session.get(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/reports").json()["value"]
-        reports_dataset_ids = set(r["DatasetId"] for r in reports)
-        datasets = self.session.get(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets").json()["value"]
-        datasets_to_delete = [d for d in datasets if d["Id"] not in reports_dataset_ids]
-        for dataset in datasets_to_delete:
-            dataset_id = dataset["Id"]
+        if dry_run:
+            deleted_report_ids = set(r["Id"] for r in reports_to_delete)
+            datasets_to_delete = get_orphan_datasets(reports, datasets, deleted_report_ids)
+            for report in reports_to_delete:
+                log.info(f"[dry-run] Would delete report '{report['Name']}' with id '{report['Id']}'")
+            for dataset in datasets_to_delete:
+                log.info(f"[dry-run] Would delete dataset '{dataset['Name']}' with id '{dataset['Id']}'")
+            return CleanupResult(reports_to_delete, datasets_to_delete, [])
+
+        # the deletes run in a bounded pool: the transport pauses all the workers when the service throttles them
+        failed = []
+        deleted_reports = self._delete_items(group_id, "reports", reports_to_delete, workers, failed)
+
+        # the remaining reports are known without listing them again
+        deleted_report_ids = set(r["Id"] for r in deleted_reports)
+        datasets_to_delete = get_orphan_datasets(reports, datasets, deleted_report_ids)
+        deleted_datasets = self._delete_items(group_id, "datasets", datasets_to_delete, workers, failed)
+
+        if len(reports_to_delete) > 0 or len(datasets_to_delete) > 0:
+            self.invalidate_group_metadata(group_id)
+        log.info(f"Cleanup of group '{group_id}': {len(deleted_reports)} reports and {len(deleted_datasets)} datasets deleted, {len(failed)} failures")
+        return CleanupResult(deleted_reports, deleted_datasets, failed)
+
+    def _delete_items(self, group_id: str, item_type: str, items: list[dict], workers: int, failed: list[dict]) -> list[dict]:
+        def delete(item: dict) -> bool:
             try:
-                log.info(f"Deleting dataset '{dataset['Name']}' with id '{dataset_id}'")
-                self.session.delete(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}")
-                log.info(f"Dataset deleted successfully.")
-            except:
-                log.exception(f"Failed to delete dataset '{dataset['Name']}'")
+                log.info(f"Deleting {item_type[:-1]} '{item['Name']}' with id '{item['Id']}'")
+                self.api.delete(f"v1.0/myorg/groups/{group_id}/{item_type}/{item['Id']}")
+                return True
+            except Exception:
+                log.exception(f"Failed to delete {item_type[:-1]} '{item['Name']}'")
+                return False
+
+        if len(items) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as executor:
+            succeeded = list(executor.map(delete, items))
+        failed.extend(item for item, ok in zip(items, succeeded) if not ok)
+        return [item for item, ok in zip(items, succeeded) if ok]
 
     @log_call()
     def deploy_report(
@@ -375,67 +500,14 @@ class PowerBiWebClient:
         refresh_schedule: DatasetRefreshSchedule | None = None,
         cleanup_regex: str | None = None,
     ):
-        report_before = self.try_get_report_by_name(group_id, upload_report_name)
-
-        if report_before is not None:
-            log.warning(f"Report '{upload_report_name}' already exists in the group '{group_id}'. Report and underlying semantic model may be temporarily out-of-sync!!")
-            self.take_over_report(group_id, report_before["Id"])
-
-        self.import_report(group_id, upload_report_name, file_path)
-
-        report       = self.try_get_report_by_name(group_id, upload_report_name)
-        report_id    = report["Id"]
-        dataset_id   = report["DatasetId"]
-        dataset      = self.get_dataset(group_id, dataset_id)
-
-        self.take_over_report(group_id, report_id)
-        self.wait_for_end_of_any_active_dataset_refresh(group_id, dataset_id)
-        if dataset_parameters is not None:
-            self.update_dataset_parameters(dataset, dataset_parameters)
-
-        # identify managed datasources to bind to the gateway cluster datasources
-        tenant_datasources               = self.get_gateway_cluster_datasources("TenantCloud")
-        dataset_datasources              = self.get_dataset_datasources(group_id, dataset_id)
-        tenant_datasources_by_key        = { build_datasource_key(ds) : ds for ds in tenant_datasources }
-        datasources_by_key               = { build_datasource_key(ds) : ds for ds in dataset_datasources }
-        unmanaged_datasource_keys        = sorted(set(datasources_by_key.keys()) - set(tenant_datasources_by_key.keys()))
-        managed_datasource_keys          = sorted(set(datasources_by_key.keys()) & set(tenant_datasources_by_key.keys()))
-        managed_datasource_by_gateway_id = {
-            tenant_datasources_by_key[key]["ClusterId"] : tenant_datasources_by_key[key]
-            for key
-            in managed_datasource_keys
-        }
-        log.info(f"{unmanaged_datasource_keys=}, {managed_datasource_keys=}")
-
-        # bind datasource to relevant gateway datasources
-        for gateway_id, dataset_datasources in managed_datasource_by_gateway_id.items():
-            tenant_datasource_ids = [ds["Id"] for ds in dataset_datasources]
-            self.bind_dataset_to_gateway(group_id, dataset_id, gateway_id, tenant_datasource_ids)
-
-        # trigger dataset refresh
-        self.wait_for_end_of_any_active_dataset_refresh(group_id, dataset_id)
-        self.session.post(f"https://api.powerbi.com/v1.0/myorg/groups/{group_id}/datasets/{dataset_id}/refreshes")
-        self.wait_for_end_of_any_active_dataset_refresh(group_id, dataset_id)
-
-        # set refresh schedule
-        if refresh_schedule is not None:
-            self.set_dataset_refresh_schedule(group_id, dataset_id, refresh_schedule)
-
-        # finalize the report
-        final_report = self.try_get_report_by_name(group_id, final_report_name)
-        if final_report is not None:
-            final_report_id = final_report["Id"]
-            final_report_dataset_id = final_report["DatasetId"]
-            self.take_over_report(group_id, final_report_id)
-            self.wait_for_end_of_any_active_dataset_refresh(group_id, final_report_dataset_id)
-            self.update_report_content(group_id, final_report_id, report_id)
-            self.rebind_report_to_dataset(group_id, final_report_id, dataset_id)
-        else:
-            self.clone_report(group_id, report_id, final_report_name)
-            final_report = self.try_get_report_by_name(group_id, final_report_name)
-            final_report_id = final_report["id"]
-            final_report_dataset_id = final_report["datasetId"]
-
-        # cleanup
-        if cleanup_regex is not None:
-            self.cleanup_reports(group_id, cleanup_regex, exclude_report_names=[final_report_name])
+        # single implementation of the deployment flow: the async one
+        from powercicd.powerbi.powerbi_async_client import AsyncPowerBiClient
+        asyncio.run(AsyncPowerBiClient(self).deploy_report(
+            group_id           = group_id,
+            upload_report_name = upload_report_name,
+            final_report_name  = final_report_name,
+            file_path          = file_path,
+            dataset_parameters = dataset_parameters,
+            refresh_schedule   = refresh_schedule,
+            cleanup_regex      = cleanup_regex,
+        ))
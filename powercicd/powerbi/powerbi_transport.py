@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from powercicd.powerbi.api_defaults import DEFAULT_API_BASE_URL, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_BACKOFF_FACTOR = 1.0
+DEFAULT_BACKOFF_MAX    = 120
+DEFAULT_TIMEOUT        = (30, 600)  # connect, read (seconds)
+RETRY_STATUS_CODES     = (429, 500, 502, 503, 504)
+STATUS_TOO_MANY_REQUESTS = 429
+PROGRESS_LOG_INTERVAL_SECONDS = 5
+
+
+class Throttle:
+    # pause shared by all the threads of a transport: once the service throttles a request, the other workers
+    # wait for the Retry-After delay as well, instead of hammering the service during the delay
+    def __init__(self, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.clock  = clock
+        self.sleep  = sleep
+        self._until = 0.0
+        self._lock  = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            until = self.clock() + seconds
+            if until > self._until:
+                log.warning(f"Throttled by the service: pausing all requests for {seconds:.1f} seconds")
+                self._until = until
+
+    def wait(self):
+        with self._lock:
+            delay = self._until - self.clock()
+        if delay > 0:
+            log.debug(f"Waiting {delay:.1f} seconds for the end of the throttling")
+            self.sleep(delay)
+
+
+class PowerBiRetry(Retry):
+    # a throttled request (429) has not been processed, so it can be retried whatever the method.
+    # 5xx responses are retried for idempotent methods only, so that e.g. an import is not posted twice
+    def __init__(self, *args, throttle: Throttle | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.throttle = throttle
+
+    def new(self, **kwargs) -> "PowerBiRetry":
+        retry = super().new(**kwargs)
+        retry.throttle = self.throttle
+        return retry
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if status_code == STATUS_TOO_MANY_REQUESTS and self.total is not False:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def sleep(self, response=None):
+        if self.throttle is not None and response is not None and response.status == STATUS_TOO_MANY_REQUESTS:
+            retry_after = self.get_retry_after(response)
+            if retry_after:
+                self.throttle.pause(retry_after)
+        super().sleep(response)
+
+
+class PowerBiTransport:
+    def __init__(
+        self,
+        token_provider : Callable[[], str],
+        api_base_url   : str                = DEFAULT_API_BASE_URL,
+        pool_size      : int                = DEFAULT_POOL_SIZE,
+        max_retries    : int                = DEFAULT_MAX_RETRIES,
+        backoff_factor : float              = DEFAULT_BACKOFF_FACTOR,
+        timeout        : float | tuple      = DEFAULT_TIMEOUT,
+    ):
+        self.token_provider = token_provider
+        self.api_base_url   = api_base_url.rstrip("/")
+        self.pool_size      = pool_size
+        self.timeout        = timeout
+        self._token         : str | None = None
+        self._token_lock    = threading.Lock()
+        self.throttle       = Throttle()
+
+        retry = PowerBiRetry(
+            total                      = max_retries,
+            backoff_factor             = backoff_factor,
+            backoff_max                = DEFAULT_BACKOFF_MAX,
+            backoff_jitter             = backoff_factor,
+            status_forcelist           = RETRY_STATUS_CODES,
+            respect_retry_after_header = True,
+            raise_on_status            = False,
+            throttle                   = self.throttle,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        # a single session for the whole run: the connections are kept alive and reused by all calls
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+    def url(self, path: str) -> str:
+        if path.startswith("https://") or path.startswith("http://"):
+            return path
+        return f"{self.api_base_url}/{path.lstrip('/')}"
+
+    def _authorize(self):
+        # the token is refreshed by swapping the header: the session and its connection pool are kept
+        with self._token_lock:
+            token = self.token_provider()
+            if token != self._token:
+                log.debug("Setting new access token on the http session")
+                self.session.headers["Authorization"] = f"Bearer {token}"
+                self._token = token
+
+    def request(self, method: str, path: str, authorize: bool = True, **kwargs) -> requests.Response:
+        if authorize:
+            self._authorize()
+        else:
+            # e.g. pre-signed (SAS) blob urls: the bearer token must not be sent
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Authorization": None}
+        kwargs.setdefault("timeout", self.timeout)
+        self.throttle.wait()
+        response = self.session.request(method, self.url(path), **kwargs)
+        if not response.ok:
+            log.error(f"{method} {response.url} failed with status {response.status_code}: {response.text[:1000]}")
+        response.raise_for_status()
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class TransferProgress:
+    def __init__(self, name: str, total_bytes: int):
+        self.name          = name
+        self.total_bytes   = total_bytes
+        self.done_bytes    = 0
+        self._start        = time.monotonic()
+        self._last_logged  = self._start
+        self._lock         = threading.Lock()
+
+    def add(self, byte_count: int):
+        with self._lock:
+            self.done_bytes += byte_count
+            now = time.monotonic()
+            if now - self._last_logged >= PROGRESS_LOG_INTERVAL_SECONDS:
+                self._last_logged = now
+                self._log(now)
+
+    def _log(self, now: float):
+        seconds = max(now - self._start, 1e-6)
+        percent = 100 * self.done_bytes / self.total_bytes if self.total_bytes > 0 else 100
+        log.info(f"{self.name}: {self.done_bytes / 2**20:.1f} / {self.total_bytes / 2**20:.1f} MiB ({percent:.0f}%), {self.done_bytes / 2**20 / seconds:.1f} MiB/s")
+
+    def finish(self):
+        with self._lock:
+            self._log(time.monotonic())
@@ -1,30 +1,41 @@
+import functools
 import json
 import os
-import re
 import shutil
-from typing import Callable
+import time
+from typing import Callable, get_args
 import zipfile
-from jsonpath_ng.ext import parse
 import logging
 
+from powercicd.powerbi.build_cache import PbixBuildCache
+from powercicd.powerbi.file_utils import iter_files_sorted
+from powercicd.powerbi.config import LayoutFormat
+from powercicd.powerbi.layout_shards import MANIFEST_FILENAME, SECTIONS_DIRNAME, is_sharded_layout, read_json, read_sharded_layout, write_sharded_layout
+from powercicd.powerbi.layout_substitution import SubstitutionRule, apply_substitution_rules, constant_fn_factory
+from powercicd.powerbi.layout_trace import LayoutTrace
+from powercicd.powerbi.zip_utils import repack_zip
+from powercicd.shared.parallel import new_process_pool
 from powercicd.shared.logging_utils import log_call
 
 log = logging.getLogger(__name__)
 
 
-def save_layout_transformation_step(layout, file):
-    log.info(f"Writing result to '{file}'...")
-    os.makedirs(os.path.dirname(file), exist_ok=True)
-    with open(file, 'w', encoding='utf-8') as f:
-        json.dump(layout, f, indent=2, ensure_ascii=False)
+ALT_TEXT_KEY_PATH            = "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value"
+REPORT_VERSION_KEY_REGEX     = r"^.*\[\[\[report_version\]\]\].*$"
+POWERAPPS_KEY_REGEX          = r"^.*\[\[\[powerapps\:(?P<app_name>.*)\]\]\].*$"
+REPORT_VERSION_PLACEHOLDER   = "REPORT_VERSION_REMOVED_BY_BUILD_SCRIPT"
+POWERAPPS_APP_ID_PLACEHOLDER = "POWERAPPS_APP_ID_REMOVED_BY_BUILD_SCRIPT"
 
+REPORT_DIR        = "Report"
+LAYOUT_ENTRY      = f"{REPORT_DIR}/Layout"
+LAYOUT_CODE_ENTRY = f"{REPORT_DIR}/Layout.json"
+COPY_BUFFER_SIZE  = 1024 * 1024
 
-def constant_fn_factory(constant):
-    def constant_fn(x):
-        return constant
+EMBEDDED_JSON_FIELDS = ("config", "filters", "query", "dataTransforms")
 
-    constant_fn.__name__ = f"constant_fn_{constant}"
-    return constant_fn
+# below this amount of visual containers, the embedded JSONs are processed serially: starting worker processes would cost more
+PARALLEL_MIN_VISUAL_CONTAINERS = 500
+PARALLEL_CHUNK_SIZE            = 250
 
 
 def replace_field_value(
@@ -34,187 +45,343 @@ def replace_field_value(
     key_regex_pattern: str,
     substitution_fn: str | Callable[[dict], str]
 ):
-    # convert to callable non callable sub_fn
-    if not callable(substitution_fn):
-        substitution_fn = constant_fn_factory(substitution_fn)
-
-    parser_visual_containers_expr = f"$.sections[*].visualContainers[*]"
-    parser_visual_containers      = parse(parser_visual_containers_expr)
-    parser_key_field              = parse(rel_jsonpath_to_key_field)
-    parser_value_field            = parse(rel_jsonpath_to_value_field)
-
-    count = 0
-    for visual_container_match in parser_visual_containers.find(layout):
-        visual_container_path = visual_container_match.full_path
-        visual_container      = visual_container_match.value
-
-        # filter visual container with no matching key
-        key_matches = parser_key_field.find(visual_container)
-        key_match   = key_matches[0] if len(key_matches) > 0 else None
-        if key_match is None:
-            continue
-        key_path        = key_match.full_path
-        key_str         = key_match.value
-        key_regex_match = re.match(key_regex_pattern, key_str)
-        if key_regex_match is None:
-            continue
-        key_groups = key_regex_match.groupdict()
-
-        # processing value path
-        # - here we are not sure that visual container owns the full path to the visual. If it does not, then we only log an information
-        value_matches = parser_value_field.find(visual_container)
-        value_match   = value_matches[0] if len(value_matches) > 0 else None
-        if value_match is None:
-            log.warning(f"- Substitution skipped at path: {visual_container_path}, key: {key_path}/{key_str} (groups: {key_groups}): No value at relative jsonpath found: {rel_jsonpath_to_value_field}")
-            continue
-
-        value_path    = value_match.full_path
-        value_old_str = value_match.value
-
-        value_new_str = substitution_fn(key_groups)
-        value_path.update(visual_container, value_new_str)
-
-        # substitute only once
-        for vm in value_matches[1:]:
-            value_path.update(visual_container, "")
-
-        log.info(f"- Successful substitution at path: {visual_container_path}, key: {key_path}/{key_str} (groups: {key_groups}), value path: {value_path} / old value: {value_old_str}, new value: {value_new_str}")
-        count += 1
-
-    if count > 0:
-        log.info(f"Replaced {count} values")
-    else:
-        log.warning(f"Nothing performed for substitution request: key path {rel_jsonpath_to_key_field} / regex {key_regex_pattern} and value path {rel_jsonpath_to_value_field}")
+    rule = SubstitutionRule("substitution", rel_jsonpath_to_key_field, rel_jsonpath_to_value_field, key_regex_pattern, substitution_fn)
+    apply_substitution_rules(layout, [rule])
+
+
+def build_src_layout_substitution_rules() -> list[SubstitutionRule]:
+    return [
+        SubstitutionRule(
+            "report_version",
+            ALT_TEXT_KEY_PATH,
+            "$.config.singleVisual.objects.general[0].properties.paragraphs[*].textRuns[*].value",
+            REPORT_VERSION_KEY_REGEX,
+            REPORT_VERSION_PLACEHOLDER
+        ),
+        SubstitutionRule(
+            "powerapps_app_id",
+            ALT_TEXT_KEY_PATH,
+            "$.config.singleVisual.objects.general[0].properties.appId.expr.Literal.Value",
+            POWERAPPS_KEY_REGEX,
+            POWERAPPS_APP_ID_PLACEHOLDER,
+        ),
+    ]
+
+
+def build_original_layout_substitution_rules(powerapps_id_by_name: dict, report_version: str) -> list[SubstitutionRule]:
+    def powerapps_id_by_name_fn(key_regex_match):
+        app_name = key_regex_match["app_name"]
+        if powerapps_id_by_name is None or app_name not in powerapps_id_by_name:
+            log.error(f"PowerApps app '{app_name}' not found in the project configuration but it is referenced in the layout. Please add it to the project configuration in block 'powerapps_id_by_name'")
+            return f"'/providers/Microsoft.PowerApps/apps/12345678-1234-1234-1234-999999999999'"
+        app_id = powerapps_id_by_name[app_name]
+        return f"'/providers/Microsoft.PowerApps/apps/{app_id}'"
+
+    return [
+        SubstitutionRule(
+            "report_version",
+            ALT_TEXT_KEY_PATH,
+            "$.config.singleVisual.objects.general[0].properties.paragraphs[0].textRuns[0].value",
+            REPORT_VERSION_KEY_REGEX,
+            report_version
+        ),
+        SubstitutionRule(
+            "powerapps_app_id",
+            ALT_TEXT_KEY_PATH,
+            "$.config.singleVisual.objects.general[0].properties.appId.expr.Literal.Value",
+            POWERAPPS_KEY_REGEX,
+            powerapps_id_by_name_fn
+        ),
+    ]
+
+
+def decode_embedded_json(value: str):
+    return json.loads(value)
+
+
+def encode_embedded_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def transform_fields_chunk(fields_chunk: list[dict], transform_fn: Callable) -> list[dict]:
+    return [{field: transform_fn(value) for field, value in fields.items()} for fields in fields_chunk]
+
+
+def transform_embedded_jsons(visual_containers_by_section: list[list[dict]], transform_fn: Callable, workers: int = 1):
+    visual_container_count = sum(len(visual_containers) for visual_containers in visual_containers_by_section)
+    if workers <= 1 or visual_container_count < PARALLEL_MIN_VISUAL_CONTAINERS:
+        for visual_containers in visual_containers_by_section:
+            for visual_container in visual_containers:
+                for field in EMBEDDED_JSON_FIELDS:
+                    if field in visual_container:
+                        visual_container[field] = transform_fn(visual_container[field])
+        return
+
+    # one chunk per section (large sections are split), only the embedded fields are sent to the worker processes
+    chunks = [
+        visual_containers[i:i + PARALLEL_CHUNK_SIZE]
+        for visual_containers in visual_containers_by_section
+        for i in range(0, len(visual_containers), PARALLEL_CHUNK_SIZE)
+    ]
+    fields_chunks = [
+        [{field: visual_container[field] for field in EMBEDDED_JSON_FIELDS if field in visual_container} for visual_container in chunk]
+        for chunk in chunks
+    ]
+    log.info(f"Processing {visual_container_count} visual containers in {len(chunks)} chunks with {workers} worker processes...")
+    with new_process_pool(workers) as executor:
+        results = executor.map(functools.partial(transform_fields_chunk, transform_fn=transform_fn), fields_chunks)
+        for chunk, fields_chunk in zip(chunks, results):
+            for visual_container, fields in zip(chunk, fields_chunk):
+                visual_container.update(fields)
+
+
+def decode_embedded_jsons(visual_containers_by_section: list[list[dict]], workers: int = 1):
+    transform_embedded_jsons(visual_containers_by_section, decode_embedded_json, workers)
+
+
+def encode_embedded_jsons(visual_containers_by_section: list[list[dict]], workers: int = 1):
+    transform_embedded_jsons(visual_containers_by_section, encode_embedded_json, workers)
+
+
+def get_visual_containers_by_section(layout: dict) -> list[list[dict]]:
+    return [section.get("visualContainers", []) for section in layout.get("sections", [])]
 
 
 def convert_original_to_src_layout(
-    layout_file_path: str, 
-    layout_code_path: str,
-    tmp_folder: str
-):
-    log.info(f"Reading layout file '{layout_file_path}' and decoding string JSONs...")
-    with open(layout_file_path, 'r', encoding='utf-16 le') as f:
-        layout = json.load(f)
-    save_layout_transformation_step(layout, f"{tmp_folder}/1_layout_after_read.json")
-    
+    layout       : dict,
+    layout_trace : LayoutTrace | None = None,
+    workers      : int = 1,
+) -> dict:
+    if layout_trace is not None:
+        layout_trace.record(layout, "read")
+
     log.info(f"Decoding json in strings (config, filters, query, dataTransforms)...")
-    parser_containers = parse("$.sections[*].visualContainers[*][config,filters,query,dataTransforms]")
-    for visual_container_match in parser_containers.find(layout):
-        visual_container_path = visual_container_match.full_path
-        visual_container = visual_container_match.value
-        new_value = json.loads(visual_container)
-        visual_container_path.update(layout, new_value)
-    save_layout_transformation_step(layout, f"{tmp_folder}/2_layout_after_decoding_string_jsons.json")
-    
-    # apply version substitution
-    log.info(f"Applying version substitution...")
-    replace_field_value(
-        layout,
-        "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value",
-        "$.config.singleVisual.objects.general[0].properties.paragraphs[*].textRuns[*].value",
-        r"^.*\[\[\[report_version\]\]\].*$",
-        "REPORT_VERSION_REMOVED_BY_BUILD_SCRIPT"
-    )
-    # apply powerapps app id substitution
-    log.info(f"Applying powerapps app id substitution...")
-    replace_field_value(
-        layout,
-        "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value",
-        "$.config.singleVisual.objects.general[0].properties.appId.expr.Literal.Value",
-        r"^.*\[\[\[powerapps\:(?P<app_name>.*)\]\]\].*$",
-        "POWERAPPS_APP_ID_REMOVED_BY_BUILD_SCRIPT",
-    )
-            
-    # write to code file
-    os.makedirs(os.path.dirname(layout_code_path), exist_ok=True)
-    with open(layout_code_path, 'w', encoding='utf-8') as f:
-        json.dump(layout, f, indent=2, ensure_ascii=False)
-
-    # delete original file
-    os.remove(layout_file_path)
+    decode_embedded_jsons(get_visual_containers_by_section(layout), workers)
+    if layout_trace is not None:
+        layout_trace.record(layout, "decoding_string_jsons")
+
+    # apply version and powerapps app id substitutions
+    apply_substitution_rules(layout, build_src_layout_substitution_rules())
+    if layout_trace is not None:
+        layout_trace.record(layout, "substitution")
+    return layout
+
+
+def is_substitution_target(visual_container: dict, rules: list[SubstitutionRule]) -> bool:
+    return any(rule.matches_key(visual_container) for rule in rules)
+
+
+def pre_encode_original_layout(layout: dict, workers: int = 1) -> list[tuple[int, int]]:
+    # encode the string JSONs of all visual containers but the ones targeted by a substitution rule. The result
+    # does not depend on the substitution values, so it can be cached and reused when only the values change.
+    # Returns the visual containers whose encoding is still pending.
+    log.info(f"Encoding string JSONs (config, filters, query, dataTransforms) of visual containers without substitution...")
+    rules = build_original_layout_substitution_rules({}, "")
+    pending_visual_containers    = []
+    visual_containers_to_encode  = []
+    for section_idx, visual_containers in enumerate(get_visual_containers_by_section(layout)):
+        section_visual_containers_to_encode = []
+        for container_idx, visual_container in enumerate(visual_containers):
+            if is_substitution_target(visual_container, rules):
+                pending_visual_containers.append((section_idx, container_idx))
+            else:
+                section_visual_containers_to_encode.append(visual_container)
+        visual_containers_to_encode.append(section_visual_containers_to_encode)
+    encode_embedded_jsons(visual_containers_to_encode, workers)
+    return pending_visual_containers
 
 
 def convert_src_code_to_original_layout(
+    layout                    : dict,
+    powerapps_id_by_name      : dict,
+    report_version            : str,
+    pending_visual_containers : list[tuple[int, int]] | None = None,
+    layout_trace              : LayoutTrace | None = None,
+    workers                   : int = 1,
+) -> dict:
+    if pending_visual_containers is None:
+        pending_visual_containers = pre_encode_original_layout(layout, workers)
+        if layout_trace is not None:
+            layout_trace.record(layout, "pre_encoding_string_jsons")
+
+    # apply version and powerapps app id substitutions
+    apply_substitution_rules(layout, build_original_layout_substitution_rules(powerapps_id_by_name, report_version))
+    if layout_trace is not None:
+        layout_trace.record(layout, "substitution")
+
+    log.info(f"Encoding string JSONs (config, filters, query, dataTransforms) of {len(pending_visual_containers)} substituted visual containers...")
+    encode_embedded_jsons([[
+        layout["sections"][section_idx]["visualContainers"][container_idx]
+        for section_idx, container_idx
+        in pending_visual_containers
+    ]])
+    if layout_trace is not None:
+        layout_trace.record(layout, "encoding_string_jsons")
+    return layout
+
+
+def encode_original_layout(layout: dict) -> bytes:
+    return json.dumps(layout, indent=None, ensure_ascii=False, separators=(',', ':')).encode('utf-16 le')
+
+
+def build_original_layout(
     code_file            : str,
-    layout_file          : str,
-    tmp_folder           : str,
     powerapps_id_by_name : dict,
     report_version       : str,
-):
-    log.info(f"Processing layout code file: {code_file}")
-    with open(code_file, 'r', encoding='utf-8') as f:
-        layout = json.load(f)
-
-    # apply version substitution
-    log.info(f"Applying version substitution...")
-    replace_field_value(
-        layout,
-        "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value",
-        "$.config.singleVisual.objects.general[0].properties.paragraphs[0].textRuns[0].value",
-        r"^.*\[\[\[report_version\]\]\].*$",
-        report_version
-    )
-
-    # apply powerapps app id substitution
-    log.info(f"Applying powerapps app id substitution...")
+    build_cache          : PbixBuildCache | None = None,
+    layout_trace         : LayoutTrace | None = None,
+    workers              : int = 1,
+) -> bytes:
+    cached_layout = None
+    layout_key    = None
+    if build_cache is not None:
+        layout_key    = build_cache.layout_key(build_cache.hash_file(code_file))
+        cached_layout = build_cache.get_encoded_layout(layout_key)
+
+    if cached_layout is not None:
+        log.info(f"Reusing encoded layout of '{code_file}' from build cache")
+        layout                    = cached_layout["layout"]
+        pending_visual_containers = cached_layout["pending_visual_containers"]
+        if layout_trace is not None:
+            layout_trace.record(layout, "read_from_build_cache")
+    else:
+        log.info(f"Reading layout code file '{code_file}'")
+        with open(code_file, 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        if layout_trace is not None:
+            layout_trace.record(layout, "read")
+        pending_visual_containers = pre_encode_original_layout(layout, workers)
+        if layout_trace is not None:
+            layout_trace.record(layout, "pre_encoding_string_jsons")
+        if build_cache is not None:
+            build_cache.put_encoded_layout(layout_key, {"layout": layout, "pending_visual_containers": pending_visual_containers})
+
+    convert_src_code_to_original_layout(layout, powerapps_id_by_name, report_version, pending_visual_containers, layout_trace)
+    return encode_original_layout(layout)
+
+
+def build_original_layout_from_shards(
+    report_folder        : str,
+    powerapps_id_by_name : dict,
+    report_version       : str,
+    build_cache          : PbixBuildCache | None = None,
+    layout_trace         : LayoutTrace | None = None,
+    workers              : int = 1,
+) -> bytes:
+    # each visual container shard is pre-encoded on its own, so that only the changed shards are decoded and encoded again
+    rules                       = build_original_layout_substitution_rules({}, "")
+    pending_visual_containers   = []
+    visual_containers_to_encode = {}
+    loaded_shards               = []
+    cache_hits                  = 0
+
+    def load_visual_container(visual_file: str, section_idx: int, container_idx: int) -> dict:
+        nonlocal cache_hits
+        shard_key = None
+        if build_cache is not None:
+            shard_key     = build_cache.layout_key(build_cache.hash_file(visual_file), kind="visual_container")
+            cached_shard  = build_cache.get_encoded_layout(shard_key)
+            if cached_shard is not None:
+                cache_hits += 1
+                if cached_shard["pending"]:
+                    pending_visual_containers.append((section_idx, container_idx))
+                return cached_shard["visual_container"]
+
+        visual_container = read_json(visual_file)
+        pending          = is_substitution_target(visual_container, rules)
+        if pending:
+            pending_visual_containers.append((section_idx, container_idx))
+        else:
+            visual_containers_to_encode.setdefault(section_idx, []).append(visual_container)
+        loaded_shards.append((shard_key, visual_container, pending))
+        return visual_container
+
+    layout = read_sharded_layout(report_folder, load_visual_container)
+    encode_embedded_jsons(list(visual_containers_to_encode.values()), workers)
+    if build_cache is not None:
+        for shard_key, visual_container, pending in loaded_shards:
+            build_cache.put_encoded_layout(shard_key, {"visual_container": visual_container, "pending": pending})
+    log.info(f"Encoded {len(loaded_shards)} visual containers, reused {cache_hits} from build cache")
+    if layout_trace is not None:
+        layout_trace.record(layout, "read_and_pre_encoding_string_jsons")
+
+    convert_src_code_to_original_layout(layout, powerapps_id_by_name, report_version, pending_visual_containers, layout_trace)
+    return encode_original_layout(layout)
+
+
+def write_src_layout(layout: dict, src_code_folder: str, layout_format: LayoutFormat):
+    if layout_format == "sharded":
+        write_sharded_layout(layout, f"{src_code_folder}/{REPORT_DIR}")
+    elif layout_format == "single":
+        code_file = f"{src_code_folder}/{LAYOUT_CODE_ENTRY}"
+        os.makedirs(os.path.dirname(code_file), exist_ok=True)
+        with open(code_file, 'w', encoding='utf-8') as f:
+            json.dump(layout, f, indent=2, ensure_ascii=False)
+    else:
+        raise ValueError(f"Unknown layout format '{layout_format}'. Supported formats: {get_args(LayoutFormat)}")
 
-    def powerapps_id_by_name_fn(key_regex_match):
-        app_name = key_regex_match["app_name"]
-        if app_name not in powerapps_id_by_name:
-            log.error(f"PowerApps app '{app_name}' not found in the project configuration but it is referenced in the layout. Please add it to the project configuration in block 'powerapps_id_by_name'")
-            return f"'/providers/Microsoft.PowerApps/apps/12345678-1234-1234-1234-999999999999'"
-        app_id = powerapps_id_by_name[app_name]
-        return f"'/providers/Microsoft.PowerApps/apps/{app_id}'"
-    
-    replace_field_value(
-        layout,
-        "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value",
-        "$.config.singleVisual.objects.general[0].properties.appId.expr.Literal.Value",
-        r"^.*\[\[\[powerapps\:(?P<app_name>.*)\]\]\].*$",
-        powerapps_id_by_name_fn
-    )
-
-    log.info(f"Encoding string JSONs (config, filters, query, dataTransforms)...")    
-    parser = parse("$.sections[*].visualContainers[*][config,filters,query,dataTransforms]")
-    for match in parser.find(layout):
-        full_path = match.full_path
-        value     = match.value
-        new_value = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
-        full_path.update(layout, new_value)
-    save_layout_transformation_step(layout, f"{tmp_folder}/1_layout_after_encoding_string_jsons.json")
-    
-    # write to layout file
-    os.makedirs(os.path.dirname(layout_file), exist_ok=True)    
-    with open(layout_file, 'w', encoding='utf-16 le') as f:
-        json.dump(layout, f, indent=None, ensure_ascii=False, separators=(',', ':'))
-
-    # delete code file
-    os.remove(code_file)
+
+def get_zip_entry_target_path(folder: str, entry_name: str) -> str:
+    # protect against entries escaping the target folder (zip slip)
+    target_path = os.path.normpath(os.path.join(folder, entry_name))
+    if os.path.isabs(entry_name) or os.path.commonpath([os.path.normpath(folder), target_path]) != os.path.normpath(folder):
+        raise ValueError(f"Zip entry '{entry_name}' points outside of the target folder '{folder}'")
+    return target_path
 
 
 @log_call()
 def convert_pbix_to_src_code(
-    pbix_file       : str,
-    src_code_folder : str,
-    tmp_folder      : str
+    pbix_file         : str,
+    src_code_folder   : str,
+    tmp_folder        : str,
+    layout_trace      : bool = False,
+    layout_trace_gzip : bool = False,
+    layout_format     : LayoutFormat = "single",
+    workers           : int = 1,
 ):
-    pbix_content_dir = f"{tmp_folder}/pbix_content"
-    log.info(f"Unzipping '{pbix_file}' to '{pbix_content_dir}'")
-    os.makedirs(pbix_content_dir, exist_ok=True)
+    trace = LayoutTrace(f"{tmp_folder}/layout_trace", layout_trace_gzip) if layout_trace else None
     with zipfile.ZipFile(pbix_file, 'r') as zip_ref:
-        zip_ref.extractall(pbix_content_dir)
+        # transform "original layout" to "src layout" in memory, before touching the src code folder
+        log.info(f"Reading '{LAYOUT_ENTRY}' from '{pbix_file}'")
+        layout = json.loads(zip_ref.read(LAYOUT_ENTRY).decode('utf-16 le'))
+        log.info(f"Converting '{LAYOUT_ENTRY}' to {layout_format} src layout")
+        convert_original_to_src_layout(layout, trace, workers)
 
-    # transform "original layout" to "src layout"
-    original_file = f"{pbix_content_dir}/Report/Layout"
-    code_file     = f"{pbix_content_dir}/Report/Layout.json"
-    log.info(f"Converting '{original_file}' to '{code_file}'")
-    convert_original_to_src_layout(original_file, code_file, tmp_folder)
-    
-    log.info(f"Copying content of '{pbix_content_dir}/' to '{src_code_folder}/'")
-    if os.path.exists(src_code_folder):
-        shutil.rmtree(src_code_folder)
-    shutil.copytree(pbix_content_dir, src_code_folder)
-    log.info(f"Copying done.")
+        if os.path.exists(src_code_folder):
+            shutil.rmtree(src_code_folder)
+
+        log.info(f"Extracting '{pbix_file}' to '{src_code_folder}/'")
+        for zip_info in zip_ref.infolist():
+            if zip_info.is_dir():
+                continue
+
+            if zip_info.filename == LAYOUT_ENTRY:
+                write_src_layout(layout, src_code_folder, layout_format)
+                continue
+
+            # stream untouched entries to their final location
+            target_path = get_zip_entry_target_path(src_code_folder, zip_info.filename)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with zip_ref.open(zip_info, 'r') as src, open(target_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    log.info(f"Extracting done.")
+
+
+def zip_src_code(src_code_folder: str, pbix_filepath: str, layout_source_entry: str, layout_bytes: bytes):
+    shards_prefix = f"{REPORT_DIR}/{SECTIONS_DIRNAME}/"
+
+    log.info(f"Zipping '{src_code_folder}' to '{pbix_filepath}'")
+    with zipfile.ZipFile(pbix_filepath, 'w', zipfile.ZIP_STORED) as zip_ref:
+        for abs_path, rel_path in iter_files_sorted(src_code_folder):
+            if layout_source_entry != LAYOUT_CODE_ENTRY and rel_path.startswith(shards_prefix):
+                continue
+            if rel_path == layout_source_entry:
+                layout_info = zipfile.ZipInfo(LAYOUT_ENTRY, date_time=time.localtime(os.path.getmtime(abs_path))[:6])
+                with zip_ref.open(layout_info, 'w') as f:
+                    f.write(layout_bytes)
+                continue
+            zip_ref.write(abs_path, rel_path)
+    log.info(f"Zipping done.")
 
 
 @log_call()
@@ -223,27 +390,47 @@ def convert_src_code_to_pbix(
     pbix_filepath        : str,
     tmp_folder           : str,
     powerapps_id_by_name : dict,
-    version              : str
+    version              : str,
+    build_cache          : PbixBuildCache | None = None,
+    layout_trace         : bool = False,
+    layout_trace_gzip    : bool = False,
+    workers              : int = 1,
 ):
-    pbix_content_dir = f"{tmp_folder}/pbix_content"
-    log.info(f"Copying content of '{src_code_folder}/' to '{pbix_content_dir}/'")
-    if os.path.exists(pbix_content_dir):
-        shutil.rmtree(pbix_content_dir)
-    shutil.copytree(src_code_folder, pbix_content_dir)
-    log.info(f"Copying done.")
-
-    # transform "src layout" to "original layout"
-    code_file     = f"{pbix_content_dir}/Report/Layout.json"
-    original_file = f"{pbix_content_dir}/Report/Layout"
-    log.info(f"Converting '{code_file}' to '{original_file}'")
-    convert_src_code_to_original_layout(code_file, original_file, tmp_folder, powerapps_id_by_name, version)
-
-    log.info(f"Zipping '{pbix_content_dir}' to '{pbix_filepath}'")
-    os.makedirs(os.path.dirname(pbix_filepath), exist_ok=True)
-    with zipfile.ZipFile(pbix_filepath, 'w', zipfile.ZIP_STORED) as zip_ref:
-        for root, dirs, files in os.walk(pbix_content_dir):
-            for file in files:
-                abs_path = f"{root}/{file}"
-                rel_path = os.path.relpath(abs_path, pbix_content_dir)
-                zip_ref.write(abs_path, rel_path)
-    log.info(f"Zipping done.")
\ No newline at end of file
+    trace = LayoutTrace(f"{tmp_folder}/layout_trace", layout_trace_gzip) if layout_trace else None
+    pbix_dir = os.path.dirname(pbix_filepath)
+    if pbix_dir:
+        os.makedirs(pbix_dir, exist_ok=True)
+
+    build_key = None
+    tree_hash = None
+    base_pbix = None
+    if build_cache is not None:
+        tree_hash   = build_cache.hash_src_tree(src_code_folder)
+        build_key   = build_cache.build_key(tree_hash, powerapps_id_by_name, version)
+        cached_pbix = build_cache.get_pbix(build_key)
+        if cached_pbix is not None:
+            log.info(f"Copying cached pbix '{cached_pbix}' to '{pbix_filepath}'")
+            shutil.copyfile(cached_pbix, pbix_filepath)
+            return
+        # a pbix built from the same src tree only differs by its layout
+        base_pbix = build_cache.get_pbix_for_tree(tree_hash)
+
+    # transform "src layout" to "original layout" in memory
+    report_folder = f"{src_code_folder}/{REPORT_DIR}"
+    if is_sharded_layout(report_folder):
+        layout_source_entry = f"{REPORT_DIR}/{MANIFEST_FILENAME}"
+        log.info(f"Converting sharded layout '{report_folder}/{SECTIONS_DIRNAME}' to '{LAYOUT_ENTRY}'")
+        layout_bytes = build_original_layout_from_shards(report_folder, powerapps_id_by_name, version, build_cache, trace, workers)
+    else:
+        layout_source_entry = LAYOUT_CODE_ENTRY
+        code_file = f"{src_code_folder}/{LAYOUT_CODE_ENTRY}"
+        log.info(f"Converting '{code_file}' to '{LAYOUT_ENTRY}'")
+        layout_bytes = build_original_layout(code_file, powerapps_id_by_name, version, build_cache, trace, workers)
+
+    if base_pbix is not None:
+        repack_zip(base_pbix, pbix_filepath, {LAYOUT_ENTRY: layout_bytes})
+    else:
+        zip_src_code(src_code_folder, pbix_filepath, layout_source_entry, layout_bytes)
+
+    if build_cache is not None:
+        build_cache.put_pbix(build_key, pbix_filepath, tree_hash)
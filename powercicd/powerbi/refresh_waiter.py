@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, NamedTuple
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_INITIAL_DELAY_SECONDS = 2
+DEFAULT_MAX_DELAY_SECONDS     = 60
+DEFAULT_BACKOFF_FACTOR        = 2
+DEFAULT_JITTER                = 0.25
+DEFAULT_TIMEOUT_SECONDS       = 60 * 60 * 20
+
+DatasetKey = tuple[str, str]  # group id, dataset id
+
+
+class RefreshWaitResult(NamedTuple):
+    group_id   : str
+    dataset_id : str
+    polls      : int
+    seconds    : float
+
+
+class _TrackedDataset:
+    def __init__(self, group_id: str, dataset_id: str, now: float, deadline: float, future: asyncio.Future):
+        self.group_id   = group_id
+        self.dataset_id = dataset_id
+        self.start      = now
+        self.next_poll  = now
+        self.deadline   = deadline
+        self.future     = future
+        self.polls      = 0
+
+
+class RefreshWaiter:
+    # single poller tracking the active refreshes of many datasets at once. Each dataset is polled with its own
+    # exponential backoff (with jitter), starting with a short delay, so that short refreshes are detected early
+    def __init__(
+        self,
+        get_active_refreshes  : Callable[[str, str], list[dict]],
+        initial_delay_seconds : float = DEFAULT_INITIAL_DELAY_SECONDS,
+        max_delay_seconds     : float = DEFAULT_MAX_DELAY_SECONDS,
+        backoff_factor        : float = DEFAULT_BACKOFF_FACTOR,
+        jitter                : float = DEFAULT_JITTER,
+        timeout_seconds       : float = DEFAULT_TIMEOUT_SECONDS,
+        clock                 : Callable[[], float] = time.monotonic,
+    ):
+        self.get_active_refreshes  = get_active_refreshes
+        self.initial_delay_seconds = initial_delay_seconds
+        self.max_delay_seconds     = max_delay_seconds
+        self.backoff_factor        = backoff_factor
+        self.jitter                = jitter
+        self.timeout_seconds       = timeout_seconds
+        self.clock                 = clock
+        self._tracked              : dict[DatasetKey, _TrackedDataset] = {}
+        self._poller               : asyncio.Task | None = None
+        self._wakeup               : asyncio.Event | None = None
+
+    def get_delay(self, polls: int) -> float:
+        delay = min(self.max_delay_seconds, self.initial_delay_seconds * self.backoff_factor ** (polls - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def wait(self, group_id: str, dataset_id: str) -> RefreshWaitResult:
+        key = (group_id, dataset_id)
+        tracked = self._tracked.get(key)
+        if tracked is None:
+            # several waiters of the same dataset share the same polling
+            now = self.clock()
+            tracked = _TrackedDataset(group_id, dataset_id, now, now + self.timeout_seconds, asyncio.get_running_loop().create_future())
+            self._tracked[key] = tracked
+            self._ensure_poller()
+        return await asyncio.shield(tracked.future)
+
+    async def wait_all(self, datasets: list[DatasetKey]) -> dict[DatasetKey, RefreshWaitResult | BaseException]:
+        results = await asyncio.gather(*(self.wait(group_id, dataset_id) for group_id, dataset_id in datasets), return_exceptions=True)
+        return dict(zip(datasets, results))
+
+    def _ensure_poller(self):
+        if self._poller is None or self._poller.done():
+            self._wakeup = asyncio.Event()
+            self._poller = asyncio.get_running_loop().create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def _run(self):
+        try:
+            while len(self._tracked) > 0:
+                now       = self.clock()
+                next_poll = min(tracked.next_poll for tracked in self._tracked.values())
+                if next_poll > now:
+                    # sleep until the next due poll, or until a new dataset is tracked
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=next_poll - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                due     = [tracked for tracked in self._tracked.values() if tracked.next_poll <= now]
+                results = await asyncio.gather(
+                    *(asyncio.to_thread(self.get_active_refreshes, tracked.group_id, tracked.dataset_id) for tracked in due),
+                    return_exceptions=True,
+                )
+                for tracked, result in zip(due, results):
+                    self._handle_poll_result(tracked, result)
+        except BaseException as e:
+            for tracked in self._tracked.values():
+                if tracked.future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    tracked.future.cancel()
+                else:
+                    tracked.future.set_exception(e)
+            self._tracked.clear()
+            raise
+
+    def _handle_poll_result(self, tracked: _TrackedDataset, result: list[dict] | BaseException):
+        now = self.clock()
+        tracked.polls += 1
+        key = (tracked.group_id, tracked.dataset_id)
+        if isinstance(result, BaseException):
+            del self._tracked[key]
+            tracked.future.set_exception(result)
+        elif len(result) == 0:
+            del self._tracked[key]
+            seconds = now - tracked.start
+            log.info(f"No active refreshes of dataset '{tracked.dataset_id}' (after {tracked.polls} polls, {seconds:.1f}s)")
+            tracked.future.set_result(RefreshWaitResult(tracked.group_id, tracked.dataset_id, tracked.polls, seconds))
+        elif now > tracked.deadline:
+            del self._tracked[key]
+            tracked.future.set_exception(TimeoutError(f"Waiting for the end of the active refreshes of dataset '{tracked.dataset_id}' took too long."))
+        else:
+            delay = self.get_delay(tracked.polls)
+            log.info(f"{len(result)} Active refreshes of dataset '{tracked.dataset_id}'... next poll in {delay:.1f} seconds")
+            tracked.next_poll = now + delay
@@ -0,0 +1,206 @@
+import logging
+import struct
+import time
+import zipfile
+import zlib
+from typing import BinaryIO
+
+log = logging.getLogger(__name__)
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# the repacked archive is written by this module, with the record layouts of APPNOTE.TXT (4.3.7, 4.3.12, 4.3.14 to 4.3.16):
+# zipfile only reads the source archive, through its public api, so that no private member of ZipFile is involved
+_LOCAL_HEADER_STRUCT        = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE     = b"PK\003\004"
+_LOCAL_HEADER_FNAME_LEN     = 10
+_LOCAL_HEADER_EXTRA_LEN     = 11
+_CENTRAL_DIR_STRUCT         = struct.Struct("<4s4B4HL2L5H2L")
+_CENTRAL_DIR_SIGNATURE      = b"PK\001\002"
+_END_RECORD_STRUCT          = struct.Struct("<4s4H2LH")
+_END_RECORD_SIGNATURE       = b"PK\005\006"
+_ZIP64_END_RECORD_STRUCT    = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_END_RECORD_SIGNATURE = b"PK\006\006"
+_ZIP64_LOCATOR_STRUCT       = struct.Struct("<4sLQL")
+_ZIP64_LOCATOR_SIGNATURE    = b"PK\006\007"
+_EXTRA_HEADER_STRUCT        = struct.Struct("<2H")
+_EXTRA_ID_ZIP64             = 1
+_FLAG_DATA_DESCRIPTOR       = 0x08
+_FLAG_UTF8                  = 0x800
+_VERSION_DEFAULT            = 20
+_VERSION_ZIP64              = 45
+_MAX_UINT16                 = 0xFFFF
+_MAX_UINT32                 = 0xFFFFFFFF
+
+
+def get_raw_data_offset(source_fp: BinaryIO, zip_info: zipfile.ZipInfo) -> int:
+    source_fp.seek(zip_info.header_offset)
+    header = source_fp.read(_LOCAL_HEADER_STRUCT.size)
+    if len(header) != _LOCAL_HEADER_STRUCT.size:
+        raise zipfile.BadZipFile(f"Truncated local header of entry '{zip_info.filename}'")
+    fields = _LOCAL_HEADER_STRUCT.unpack(header)
+    if fields[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header signature of entry '{zip_info.filename}'")
+    return zip_info.header_offset + _LOCAL_HEADER_STRUCT.size + fields[_LOCAL_HEADER_FNAME_LEN] + fields[_LOCAL_HEADER_EXTRA_LEN]
+
+
+def strip_zip64_extra(extra: bytes) -> bytes:
+    # the zip64 fields of the source entry are written again, if required
+    stripped = b""
+    offset   = 0
+    while offset + _EXTRA_HEADER_STRUCT.size <= len(extra):
+        extra_id, size = _EXTRA_HEADER_STRUCT.unpack_from(extra, offset)
+        end = offset + _EXTRA_HEADER_STRUCT.size + size
+        if extra_id != _EXTRA_ID_ZIP64:
+            stripped += extra[offset:end]
+        offset = end
+    return stripped
+
+
+def encode_filename(zip_info: zipfile.ZipInfo) -> tuple[bytes, int]:
+    try:
+        return zip_info.filename.encode("ascii"), zip_info.flag_bits & ~_FLAG_UTF8
+    except UnicodeEncodeError:
+        return zip_info.filename.encode("utf-8"), zip_info.flag_bits | _FLAG_UTF8
+
+
+def get_dos_date_time(date_time: tuple) -> tuple[int, int]:
+    year, month, day, hours, minutes, seconds = date_time
+    return (year - 1980) << 9 | month << 5 | day, hours << 11 | minutes << 5 | seconds // 2
+
+
+def zip64_extra(values: list[int]) -> bytes:
+    if len(values) == 0:
+        return b""
+    return _EXTRA_HEADER_STRUCT.pack(_EXTRA_ID_ZIP64, 8 * len(values)) + struct.pack(f"<{len(values)}Q", *values)
+
+
+class RawZipWriter:
+    # writes the entries from their compressed bytes, and the central directory at the end
+    def __init__(self, fp: BinaryIO):
+        self.fp      = fp
+        self.entries : list[zipfile.ZipInfo] = []
+
+    def write_entry(self, zip_info: zipfile.ZipInfo, compressed_chunks):
+        # the sizes and the crc of zip_info are the ones of the compressed chunks: no data descriptor is needed
+        zip64 = zip_info.file_size > zipfile.ZIP64_LIMIT or zip_info.compress_size > zipfile.ZIP64_LIMIT
+        zip_info.flag_bits       &= ~_FLAG_DATA_DESCRIPTOR
+        zip_info.extra            = strip_zip64_extra(zip_info.extra)
+        zip_info.header_offset    = self.fp.tell()
+        zip_info.extract_version  = max(zip_info.extract_version, _VERSION_ZIP64 if zip64 else _VERSION_DEFAULT)
+
+        filename, flag_bits = encode_filename(zip_info)
+        dos_date, dos_time  = get_dos_date_time(zip_info.date_time)
+        extra               = zip_info.extra + zip64_extra([zip_info.file_size, zip_info.compress_size] if zip64 else [])
+        self.fp.write(_LOCAL_HEADER_STRUCT.pack(
+            _LOCAL_HEADER_SIGNATURE, zip_info.extract_version, 0, flag_bits, zip_info.compress_type, dos_time, dos_date,
+            zip_info.CRC, _MAX_UINT32 if zip64 else zip_info.compress_size, _MAX_UINT32 if zip64 else zip_info.file_size,
+            len(filename), len(extra),
+        ))
+        self.fp.write(filename)
+        self.fp.write(extra)
+
+        written = 0
+        for chunk in compressed_chunks:
+            self.fp.write(chunk)
+            written += len(chunk)
+        if written != zip_info.compress_size:
+            raise zipfile.BadZipFile(f"Entry '{zip_info.filename}' has {written} compressed bytes, expected {zip_info.compress_size}")
+        self.entries.append(zip_info)
+
+    def write_central_directory(self):
+        start_dir = self.fp.tell()
+        for zip_info in self.entries:
+            # the zip64 extra holds, in this order, the fields overflowing the record
+            zip64_values = [
+                value
+                for value in (zip_info.file_size, zip_info.compress_size, zip_info.header_offset)
+                if value > zipfile.ZIP64_LIMIT
+            ]
+            filename, flag_bits = encode_filename(zip_info)
+            dos_date, dos_time  = get_dos_date_time(zip_info.date_time)
+            extra               = zip_info.extra + zip64_extra(zip64_values)
+            extract_version     = max(zip_info.extract_version, _VERSION_ZIP64 if zip64_values else _VERSION_DEFAULT)
+            self.fp.write(_CENTRAL_DIR_STRUCT.pack(
+                _CENTRAL_DIR_SIGNATURE, zip_info.create_version, zip_info.create_system, extract_version, 0, flag_bits,
+                zip_info.compress_type, dos_time, dos_date, zip_info.CRC,
+                _MAX_UINT32 if zip_info.compress_size > zipfile.ZIP64_LIMIT else zip_info.compress_size,
+                _MAX_UINT32 if zip_info.file_size > zipfile.ZIP64_LIMIT else zip_info.file_size,
+                len(filename), len(extra), len(zip_info.comment), 0, zip_info.internal_attr, zip_info.external_attr,
+                _MAX_UINT32 if zip_info.header_offset > zipfile.ZIP64_LIMIT else zip_info.header_offset,
+            ))
+            self.fp.write(filename)
+            self.fp.write(extra)
+            self.fp.write(zip_info.comment)
+        end_dir = self.fp.tell()
+
+        count    = len(self.entries)
+        size_dir = end_dir - start_dir
+        if count > _MAX_UINT16 or size_dir > zipfile.ZIP64_LIMIT or start_dir > zipfile.ZIP64_LIMIT:
+            self.fp.write(_ZIP64_END_RECORD_STRUCT.pack(
+                _ZIP64_END_RECORD_SIGNATURE, _ZIP64_END_RECORD_STRUCT.size - 12, _VERSION_ZIP64, _VERSION_ZIP64, 0, 0,
+                count, count, size_dir, start_dir,
+            ))
+            self.fp.write(_ZIP64_LOCATOR_STRUCT.pack(_ZIP64_LOCATOR_SIGNATURE, 0, end_dir, 1))
+            count, size_dir, start_dir = min(count, _MAX_UINT16), min(size_dir, _MAX_UINT32), min(start_dir, _MAX_UINT32)
+        self.fp.write(_END_RECORD_STRUCT.pack(_END_RECORD_SIGNATURE, 0, 0, count, count, size_dir, start_dir, 0))
+
+
+def iter_raw_data(source_fp: BinaryIO, zip_info: zipfile.ZipInfo):
+    source_fp.seek(get_raw_data_offset(source_fp, zip_info))
+    remaining = zip_info.compress_size
+    while remaining > 0:
+        chunk = source_fp.read(min(remaining, COPY_BUFFER_SIZE))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data of entry '{zip_info.filename}'")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def new_entry_info(filename: str, data: bytes, compress_type: int, date_time: tuple) -> tuple[zipfile.ZipInfo, bytes]:
+    zip_info = zipfile.ZipInfo(filename, date_time=date_time)
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+    else:
+        compress_type = zipfile.ZIP_STORED
+        compressed    = data
+    zip_info.compress_type = compress_type
+    zip_info.file_size     = len(data)
+    zip_info.compress_size = len(compressed)
+    zip_info.CRC           = zlib.crc32(data)
+    zip_info.external_attr = 0o600 << 16
+    return zip_info, compressed
+
+
+def copy_zip_info(zip_info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    target_info = zipfile.ZipInfo(zip_info.filename, date_time=zip_info.date_time)
+    for attr in ("compress_type", "comment", "extra", "create_system", "create_version", "extract_version", "flag_bits",
+                 "internal_attr", "external_attr", "CRC", "compress_size", "file_size"):
+        setattr(target_info, attr, getattr(zip_info, attr))
+    return target_info
+
+
+def repack_zip(source_path: str, target_path: str, replaced_entries: dict[str, bytes]):
+    # rewrite an archive where only the replaced entries are encoded again, all other entries are copied raw: nothing
+    # else is decompressed nor recompressed
+    log.info(f"Repacking '{source_path}' to '{target_path}', replacing {list(replaced_entries)}")
+    with zipfile.ZipFile(source_path, 'r') as source_zip, open(source_path, 'rb') as source_fp, open(target_path, 'wb') as target_fp:
+        writer       = RawZipWriter(target_fp)
+        source_names = set(source_zip.namelist())
+        for zip_info in source_zip.infolist():
+            if zip_info.filename in replaced_entries:
+                # deflated or stored, as the source entry (other methods are deflated)
+                target_info, compressed = new_entry_info(zip_info.filename, replaced_entries[zip_info.filename], zip_info.compress_type, zip_info.date_time)
+                target_info.external_attr = zip_info.external_attr
+                writer.write_entry(target_info, [compressed])
+            else:
+                writer.write_entry(copy_zip_info(zip_info), iter_raw_data(source_fp, zip_info))
+
+        for name, data in replaced_entries.items():
+            if name not in source_names:
+                target_info, compressed = new_entry_info(name, data, zipfile.ZIP_STORED, time.localtime()[:6])
+                writer.write_entry(target_info, [compressed])
+        writer.write_central_directory()
+
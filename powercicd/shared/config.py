@@ -1,15 +1,16 @@
-from typing import Literal, List
+from typing import Callable, Literal, List, Optional
 
 from pydantic import BaseModel, Field, PrivateAttr
 from typing_extensions import Annotated
 
 
 class ProjectVersion(BaseModel):
-    major              : Annotated[int, Field(description="The major version of the project")]
-    minor              : Annotated[int, Field(description="The minor version of the project")]
-    build_ground       : Annotated[int, Field(description="The ground number to subtract from the total amount of commits to calculate the build number")]
+    major                : Annotated[int, Field(description="The major version of the project")]
+    minor                : Annotated[int, Field(description="The minor version of the project")]
+    build_ground         : Annotated[int, Field(description="The ground number to subtract from the total amount of commits to calculate the build number")]
+    build_number_env_var : Annotated[Optional[str], Field(description="The environment variable providing the build number (e.g. the run number of the CI), used instead of the commit count when it is set")] = None
     # excluded fields
-    resulting_version  : Annotated[str, Field(exclude=True, description="The version of the project")] = None
+    resulting_version    : Annotated[str, Field(exclude=True, description="The version of the project")] = None
 
 
 class ComponentConfig(BaseModel):
@@ -28,15 +29,39 @@ class ProjectConfig(BaseModel):
     tenant              : Annotated[str, Field(description="The tenant of the project. Either the tenant ID or the tenant name (i.e. abc.onmicrosoft.com)")]
     version             : Annotated[ProjectVersion, Field(description="The version of the project")]
     # excluded fields
-    components          : Annotated[List[ComponentConfig], Field(default_factory=list, exclude=True)]
     project_root        : Annotated[str, Field(exclude=True, description="The root folder of the project")] = None
-    _components_by_name : dict[str, ComponentConfig] = PrivateAttr(None)
+    # the component configs are deserialized by the injected loader on first access: only their files are known upfront
+    _component_files    : dict[str, str] = PrivateAttr(default_factory=dict)
+    _component_loader   : Callable[[str], ComponentConfig] | None = PrivateAttr(None)
+    _components_by_name : dict[str, ComponentConfig] = PrivateAttr(default_factory=dict)
 
-    def get_component(self, name: str):
-        if self._components_by_name is None:
-            self._components_by_name = {component.name: component for component in self.components}
+    def set_component_files(self, component_files: dict[str, str], component_loader: Callable[[str], ComponentConfig]):
+        self._component_files    = dict(sorted(component_files.items()))
+        self._component_loader   = component_loader
+        self._components_by_name = {}
+
+    def add_component(self, component: ComponentConfig):
+        component.parent_project = self
+        self._components_by_name[component.name] = component
+
+    @property
+    def component_names(self) -> list[str]:
+        return sorted(set(self._component_files) | set(self._components_by_name))
 
+    @property
+    def components(self) -> list[ComponentConfig]:
+        # loads all the components
+        return [self.get_component(name) for name in self.component_names]
+
+    def get_component(self, name: str):
         component = self._components_by_name.get(name, None)
-        if component is None:
-            raise ValueError(f"Component '{name}' not found in the project configuration. Available components: {list(self._components_by_name.keys())}")
+        if component is not None:
+            return component
+
+        component_file = self._component_files.get(name, None)
+        if component_file is None:
+            raise ValueError(f"Component '{name}' not found in the project configuration. Available components: {self.component_names}")
+        component = self._component_loader(component_file)
+        component.name = name
+        self.add_component(component)
         return component
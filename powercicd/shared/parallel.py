@@ -0,0 +1,62 @@
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, NamedTuple
+
+log = logging.getLogger(__name__)
+
+
+class TaskResult(NamedTuple):
+    name    : str
+    seconds : float
+    error   : str | None
+
+
+def run_timed(name: str, task: Callable[[], Any]) -> TaskResult:
+    start = time.perf_counter()
+    try:
+        task()
+        return TaskResult(name, time.perf_counter() - start, None)
+    except Exception as e:
+        log.exception(f"Task '{name}' failed")
+        return TaskResult(name, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+def restore_std_streams():
+    # a worker forked during a command of the `pow serve` daemon inherits its redirection to the client socket. The
+    # writes of several processes would interleave in the socket: the workers write to the streams of the daemon instead
+    original_by_redirected = {id(sys.stdout): sys.__stdout__, id(sys.stderr): sys.__stderr__}
+    for handler in logging.root.handlers:
+        if isinstance(handler, logging.StreamHandler) and id(handler.stream) in original_by_redirected:
+            handler.setStream(original_by_redirected[id(handler.stream)])
+    sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+
+
+def new_process_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, initializer=restore_std_streams)
+
+
+def run_in_process_pool(tasks: dict[str, Callable[[], Any]], workers: int | None = None) -> list[TaskResult]:
+    # tasks must be picklable (i.e. functools.partial of module level functions) when running with more than one worker
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+
+    if workers == 1:
+        return [run_timed(name, task) for name, task in tasks.items()]
+
+    log.info(f"Running {len(tasks)} tasks with {workers} worker processes...")
+    with new_process_pool(workers) as executor:
+        futures = [executor.submit(run_timed, name, task) for name, task in tasks.items()]
+        return [future.result() for future in futures]
+
+
+def log_task_summary(results: list[TaskResult]):
+    log.info("Summary:")
+    for result in results:
+        if result.error is None:
+            log.info(f"- {result.name}: done in {result.seconds:.2f}s")
+        else:
+            log.error(f"- {result.name}: FAILED after {result.seconds:.2f}s: {result.error}")
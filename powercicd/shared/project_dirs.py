@@ -0,0 +1,42 @@
+import os
+from datetime import datetime
+
+from powercicd.powerbi.build_cache import PbixBuildCache
+
+
+def get_tmp_dir(project_root, suffix):
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    tmp_dir = f"{project_root}/temp/{timestamp}-{suffix}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+
+def get_build_cache_dir(project_root) -> str:
+    return f"{project_root}/temp/build_cache"
+
+
+def get_gateway_cache_dir(project_root) -> str:
+    return f"{project_root}/temp/gateway_datasources"
+
+
+def get_version_cache_dir(project_root) -> str:
+    return f"{project_root}/temp/version_cache"
+
+
+def get_config_cache_dir(project_root) -> str:
+    return f"{project_root}/temp/config_cache"
+
+
+def make_ignored_dir(path: str):
+    # cache dir in the project, possibly in the git work tree: it must not make the work tree dirty (see versioning)
+    os.makedirs(path, exist_ok=True)
+    gitignore_path = f"{path}/.gitignore"
+    if not os.path.exists(gitignore_path):
+        with open(gitignore_path, "w", encoding="utf-8") as f:
+            f.write("*\n")
+
+
+def get_build_cache(project_root, enabled: bool) -> PbixBuildCache | None:
+    if not enabled:
+        return None
+    return PbixBuildCache(get_build_cache_dir(project_root))
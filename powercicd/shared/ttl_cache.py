@@ -0,0 +1,43 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+log = logging.getLogger(__name__)
+
+
+class TtlCache:
+    def __init__(self, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock       = clock
+        self._entries    : dict[Hashable, tuple[float, Any]] = {}
+        self._generation = 0
+        self._lock       = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry      = self._entries.get(key)
+            generation = self._generation
+        now = self.clock()
+        if entry is not None and now - entry[0] < self.ttl_seconds:
+            log.debug(f"Metadata cache hit for {key}")
+            return entry[1]
+
+        log.debug(f"Metadata cache miss for {key}")
+        value = loader()
+        with self._lock:
+            # an invalidation during the load may have made the loaded value stale: don't store it
+            if generation == self._generation:
+                self._entries[key] = (now, value)
+        return value
+
+    def invalidate(self, *keys: Hashable):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
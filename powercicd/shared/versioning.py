@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import subprocess
+from typing import NamedTuple
+
+from powercicd.shared.project_dirs import make_ignored_dir
+
+log = logging.getLogger(__name__)
+
+
+VERSION_CACHE_FILENAME = "commit_counts.json"
+VERSION_CACHE_MAX_ENTRIES = 20
+
+
+class GitStatus(NamedTuple):
+    head_oid : str | None  # None: no commit yet
+    dirty    : bool
+
+
+def run_git(project_root: str, *args: str) -> subprocess.CompletedProcess:
+    # list arguments: no shell, so that the project root may contain spaces or quotes
+    cmd = ["git", "-C", project_root, *args]
+    log.info(f"Executing command: {cmd}")
+    return subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+
+
+def get_git_status(project_root: str) -> GitStatus | None:
+    # a single call returns the HEAD commit and the modified files. None: outside of a git work tree
+    try:
+        result = run_git(project_root, "status", "--porcelain=v2", "--branch")
+    except FileNotFoundError:
+        log.warning("git is not installed")
+        return None
+    if result.returncode != 0:
+        log.info(f"git status failed: '{result.stderr.strip()}'")
+        return None
+
+    head_oid = None
+    dirty    = False
+    for line in result.stdout.splitlines():
+        if line.startswith("# branch.oid "):
+            oid = line[len("# branch.oid "):].strip()
+            head_oid = None if oid == "(initial)" else oid
+        elif not line.startswith("#") and line.strip() != "":
+            dirty = True
+    return GitStatus(head_oid, dirty)
+
+
+class CommitCountCache:
+    # the commit count of a commit never changes: it is memoized by commit id, as `rev-list --count` walks the whole
+    # history. The modified flag can't be memoized the same way (e.g. by the mtime of the index), because editing a
+    # tracked file or adding an untracked one does not touch the index: it is always computed by `git status`
+    def __init__(self, cache_dir: str):
+        self.cache_dir  = cache_dir
+        self.cache_path = f"{cache_dir}/{VERSION_CACHE_FILENAME}"
+
+    def load(self) -> dict[str, int]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, head_oid: str) -> int | None:
+        return self.load().get(head_oid)
+
+    def put(self, head_oid: str, count: int):
+        counts = self.load()
+        counts.pop(head_oid, None)
+        counts[head_oid] = count
+        counts = dict(list(counts.items())[-VERSION_CACHE_MAX_ENTRIES:])
+        make_ignored_dir(self.cache_dir)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(counts, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+def count_commits(project_root: str, head_oid: str, cache: CommitCountCache | None) -> int:
+    count = cache.get(head_oid) if cache is not None else None
+    if count is not None:
+        log.info(f"Commit count of '{head_oid}' found in cache: {count}")
+        return count
+
+    result = run_git(project_root, "rev-list", "--count", head_oid)
+    if result.returncode != 0:
+        raise RuntimeError(f"git rev-list failed: '{result.stderr.strip()}'")
+    count = int(result.stdout.strip())
+    if cache is not None:
+        cache.put(head_oid, count)
+    return count
+
+
+def get_build_number_from_env(env_var: str | None) -> int | None:
+    if env_var is None or os.environ.get(env_var, "").strip() == "":
+        return None
+    try:
+        return int(os.environ[env_var].strip())
+    except ValueError:
+        raise ValueError(f"The environment variable '{env_var}' must contain an integer build number, got '{os.environ[env_var]}'")
+
+
+def compute_version(
+    project_root         : str,
+    major                : int,
+    minor                : int,
+    build_ground         : int,
+    build_number_env_var : str | None = None,
+    cache_dir            : str | None = None,
+) -> str:
+    status = get_git_status(project_root)
+
+    # Case 1: project folder is outside git work tree
+    if status is None:
+        log.info(f"Project folder is outside git work tree, then keep version '{major}.{minor}.{build_ground}' unchanged")
+        return f"{major}.{minor}.{build_ground}"
+
+    # Case 2: the build number is given by the CI
+    build_number = get_build_number_from_env(build_number_env_var)
+    if build_number is not None:
+        log.info(f"Build number {build_number} taken from the environment variable '{build_number_env_var}'")
+
+    # Case 3: no commits at all (not even HEAD)
+    elif status.head_oid is None:
+        log.info(f"No commits found in '{project_root}', then keep version '{major}.{minor}.{build_ground}' unchanged")
+        return f"{major}.{minor}.{build_ground}"
+
+    # Case 4: the build number is the number of commits since the ground
+    else:
+        cache = CommitCountCache(cache_dir) if cache_dir is not None else None
+        build_number = count_commits(project_root, status.head_oid, cache) - build_ground
+
+    modified_flag = "M" if status.dirty else ""
+    version = f"{major}.{minor}.{build_number}{modified_flag}"
+    log.info(f"Version: {version}")
+    return version
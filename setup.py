@@ -12,7 +12,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/jeromerg/powercicd",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks", "benchmarks.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -20,6 +20,8 @@ setuptools.setup(
     ],
     install_requires=[
         "requests",
+        # the retry of the Power BI transport uses the backoff_jitter and backoff_max of urllib3 2
+        "urllib3>=2",
         "selenium",
         "jsonpath-ng",
         "pydantic",
@@ -27,5 +29,8 @@ setuptools.setup(
         "pyyaml",
         "typer[all]"
     ],
+    entry_points={
+        "console_scripts": ["pow=powercicd.pow:main"],
+    },
     python_requires='>=3.6',
 )
\ No newline at end of file
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the hooks run `pow` many times: the cli must not load the cloud and browser stack at startup
+FORBIDDEN_MODULES     = ["requests", "urllib3", "selenium", "azure.core", "azure.identity", "jsonpath_ng", "asyncio", "powercicd.powerbi.powerbi_utils"]
+IMPORT_BUDGET_SECONDS = 1.0
+
+
+def get_import_times(module: str) -> dict[str, float]:
+    # cumulative import time in seconds by module, as reported by `python -X importtime`
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=f"{THIS_FILE_DIR}/..", capture_output=True, text=True, check=True,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        import_times[name.strip()] = int(cumulative_us) / 1e6
+    return import_times
+
+
+def test_cli_import_time():
+    import_times = get_import_times("powercicd.cli")
+    assert [module for module in FORBIDDEN_MODULES if module in import_times] == []
+    assert import_times["powercicd.cli"] < IMPORT_BUDGET_SECONDS
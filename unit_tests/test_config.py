@@ -0,0 +1,67 @@
+import os
+import shutil
+
+import pytest
+
+import powercicd.config as config
+from powercicd.config import get_component_config, get_project_config
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_PROJECT_DIR = f"{THIS_FILE_DIR}/../doc/examples/my_project"
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+def copy_example_project(project_dir: str, component_names: list[str]):
+    os.makedirs(project_dir)
+    shutil.copy(f"{EXAMPLE_PROJECT_DIR}/power-project-dev.yaml", project_dir)
+    for component_name in component_names:
+        os.makedirs(f"{project_dir}/{component_name}")
+        shutil.copy(f"{EXAMPLE_PROJECT_DIR}/my_report/power-component-dev.yaml", f"{project_dir}/{component_name}")
+
+
+def test_config_snapshot(tmp_dir, monkeypatch):
+    project_dir = f"{tmp_dir}/my_project"
+    copy_example_project(project_dir, ["my_report"])
+
+    project_config = get_project_config("dev", project_dir)
+    assert [c.name for c in project_config.components] == ["my_report"]
+
+    # the unchanged config files are not parsed again
+    deserialize_file = config.AllComponentsDeserializer.deserialize_file
+    monkeypatch.setattr(config, "load_project_config_file", lambda *args: pytest.fail("project config file parsed again"))
+    monkeypatch.setattr(config.AllComponentsDeserializer, "deserialize_file", lambda *args: pytest.fail("component config file parsed again"))
+    project_config = get_project_config("dev", project_dir)
+    assert project_config.components[0].parent_project is project_config
+    assert project_config.components[0].report_name == "my-report"
+    assert project_config.version.resulting_version is not None
+
+    # a changed component file invalidates the snapshot
+    with open(f"{project_dir}/my_report/power-component-dev.yaml", "a", encoding="utf-8") as f:
+        f.write("\nlayout_format: sharded\n")
+    monkeypatch.setattr(config.AllComponentsDeserializer, "deserialize_file", deserialize_file)
+    assert get_project_config("dev", project_dir).components[0].layout_format == "sharded"
+
+
+def test_lazy_component_loading(tmp_dir):
+    project_dir = f"{tmp_dir}/my_project"
+    copy_example_project(project_dir, ["report_a", "report_b"])
+    with open(f"{project_dir}/report_b/power-component-dev.yaml", "w", encoding="utf-8") as f:
+        f.write("type: invalid\n")
+
+    # only the requested component is deserialized
+    project_config = get_project_config("dev", project_dir, use_snapshot=False)
+    assert project_config.component_names == ["report_a", "report_b"]
+    assert project_config.get_component("report_a").parent_project is project_config
+    with pytest.raises(ValueError):
+        project_config.get_component("report_b")
+
+    component_config = get_component_config("dev", f"{project_dir}/report_a")
+    assert component_config.name == "report_a"
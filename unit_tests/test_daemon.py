@@ -0,0 +1,191 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+import powercicd.daemon as daemon
+from powercicd.pow import is_interactive_command
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_PROJECT_DIR = f"{THIS_FILE_DIR}/../doc/examples/my_project"
+
+# fake commands: the argv is echoed and its length returned as exit code
+SERVE_SCRIPT = """
+import functools
+import logging
+import os
+import sys
+import powercicd.daemon as daemon
+from powercicd.shared.parallel import run_in_process_pool
+
+logging.basicConfig(level=logging.INFO)
+
+def run_command(argv):
+    if argv == ["input"]:
+        input()
+    if argv == ["env"]:
+        print(os.environ.get("AZURE_CLIENT_ID"), os.environ.get("UNRELATED_SECRET"))
+    if argv == ["pool"]:
+        # the output of the worker processes must not be written to the client socket
+        run_in_process_pool({
+            f"task {i}": functools.partial(logging.getLogger("worker").warning, "worker output " * 1000)
+            for i in range(4)
+        }, workers=4)
+    print("running", *argv)
+    print("on stderr", file=sys.stderr)
+    return len(argv)
+
+daemon.serve(run_command, sys.argv[1], idle_timeout_seconds=60)
+"""
+
+# the real cli, where the browser is never logged in: the app deployment asks the user to login manually
+SERVE_CLI_SCRIPT = """
+import sys
+import powercicd.daemon as daemon
+from powercicd.cli import run_cli
+from powercicd.powerbi.powerbi_client import PowerBiWebClient
+
+PowerBiWebClient.is_logged_in_in_browser = lambda self: False
+daemon.serve(run_cli, sys.argv[1], idle_timeout_seconds=60)
+"""
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+@pytest.fixture
+def socket_path():
+    # the path of a unix socket is limited to ~100 chars: not in the tmp dir of the tests
+    socket_dir = tempfile.mkdtemp(prefix="pow")
+    yield f"{socket_dir}/pow.sock"
+    if os.path.exists(f"{socket_dir}/pow.sock"):
+        os.remove(f"{socket_dir}/pow.sock")
+    os.rmdir(socket_dir)
+
+
+def start_daemon(serve_script: str, socket_path: str) -> subprocess.Popen:
+    server = subprocess.Popen([sys.executable, "-c", serve_script, socket_path], cwd=os.path.dirname(THIS_FILE_DIR))
+    deadline = time.time() + 30
+    while not daemon.is_daemon_running(socket_path):
+        if time.time() > deadline or server.poll() is not None:
+            server.kill()
+            pytest.fail("The daemon did not start")
+        time.sleep(0.05)
+    return server
+
+
+@pytest.mark.skipif(not daemon.is_supported(), reason="unix domain sockets not supported")
+def test_forward_command(socket_path, capsys, monkeypatch):
+    assert daemon.forward_command(["export"], socket_path) is None
+
+    server = start_daemon(SERVE_SCRIPT, socket_path)
+    try:
+
+        assert daemon.forward_command(["powerbi", "deploy", "my_report"], socket_path) == 3
+        captured = capsys.readouterr()
+        assert captured.out == "running powerbi deploy my_report\n"
+        assert captured.err == "on stderr\n"
+
+        # only the environment read by the commands is forwarded
+        monkeypatch.setenv("AZURE_CLIENT_ID", "client-id")
+        monkeypatch.setenv("UNRELATED_SECRET", "secret")
+        assert daemon.forward_command(["env"], socket_path) == 1
+        assert capsys.readouterr().out == "client-id None\nrunning env\n"
+
+        assert daemon.forward_command(["pool"], socket_path) == 1
+        captured = capsys.readouterr()
+        assert captured.out == "running pool\n"
+        assert "worker output" not in captured.err
+
+        # the stdin is not forwarded: a command reading it is stopped instead of hanging, to run again in-process
+        assert daemon.forward_command(["input"], socket_path) is None
+        assert "runs again without it" in capsys.readouterr().err
+
+        assert daemon.stop_daemon(socket_path)
+        assert server.wait(timeout=30) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+    assert not os.path.exists(socket_path)
+    assert daemon.forward_command(["export"], socket_path) is None
+
+
+def test_warm_client_per_identity(monkeypatch):
+    import powercicd.cli as cli
+
+    monkeypatch.setattr(cli, "powerbi_clients", {})
+    monkeypatch.setenv("AZURE_CLIENT_ID", "first")
+    first = cli.get_powerbi_client("tenant", keep_browser_open=False)
+    assert cli.get_powerbi_client("tenant", keep_browser_open=False) is first
+
+    # another identity never reuses the credential and the token of the first one
+    monkeypatch.setenv("AZURE_CLIENT_ID", "second")
+    assert cli.get_powerbi_client("tenant", keep_browser_open=False) is not first
+
+
+def test_interactive_commands_not_forwarded():
+    assert is_interactive_command(["--stage", "dev", "powerbi", "login", "--keep-browser-open"])
+    assert not is_interactive_command(["--stage", "dev", "powerbi", "deploy", "login"])
+
+
+@pytest.mark.skipif(not daemon.is_supported(), reason="unix domain sockets not supported")
+def test_socket_dir_not_private(socket_path, capsys):
+    # e.g. created by another user in the shared tmp dir: neither the daemon nor the client use it
+    os.chmod(os.path.dirname(socket_path), 0o755)
+    with pytest.raises(daemon.UnsafeSocketError):
+        daemon.prepare_socket_path(socket_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        assert daemon.forward_command(["export"], socket_path) is None
+    assert "has the mode 755" in capsys.readouterr().err
+
+
+def test_cli_envvars_forwarded():
+    import typer.main
+    from powercicd.cli import main_cli
+
+    def iter_params(command):
+        yield from command.params
+        for sub_command in getattr(command, "commands", {}).values():
+            yield from iter_params(sub_command)
+
+    envvars = set(param.envvar for param in iter_params(typer.main.get_command(main_cli)) if param.envvar)
+    assert envvars - set(daemon.FORWARDED_ENV_VARS) == set()
+
+
+@pytest.mark.skipif(not daemon.is_supported(), reason="unix domain sockets not supported")
+def test_deploy_needing_browser_login_runs_in_process(tmp_dir, socket_path, capsys):
+    project_dir = f"{tmp_dir}/my_project"
+    os.makedirs(f"{project_dir}/my_report")
+    shutil.copy(f"{EXAMPLE_PROJECT_DIR}/power-project-dev.yaml", project_dir)
+    shutil.copy(f"{EXAMPLE_PROJECT_DIR}/my_report/power-component-dev.yaml", f"{project_dir}/my_report")
+
+    server = start_daemon(SERVE_CLI_SCRIPT, socket_path)
+    try:
+        # the manual login waits for the user on stdin: the daemon stops the command, `pow` runs it in-process
+        assert daemon.forward_command(["--stage", "dev", "--project-dir", project_dir, "powerbi", "deploy", "my_report"], socket_path) is None
+        captured = capsys.readouterr()
+        assert "Please login manually" in captured.out
+        assert "runs again without it" in captured.err
+        assert "Traceback" not in captured.err
+
+        # the daemon is still available for the next commands
+        assert daemon.is_daemon_running(socket_path)
+        assert daemon.stop_daemon(socket_path)
+        assert server.wait(timeout=30) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
@@ -0,0 +1,61 @@
+import pytest
+
+from powercicd.powerbi.layout_substitution import SubstitutionRule, apply_substitution_rules, compile_jsonpath
+
+
+def _visual(alt_text, values):
+    return {
+        "config": {
+            "singleVisual": {
+                "vcObjects": {"general": [{"properties": {"altText": {"expr": {"Literal": {"Value": alt_text}}}}}]},
+                "objects": {"general": [{"properties": {"paragraphs": [{"textRuns": [{"value": v} for v in values]}]}}]},
+            }
+        }
+    }
+
+
+def test_compile_jsonpath_find():
+    path = compile_jsonpath("$.a[*].b[1]")
+    assert compile_jsonpath("$.a[*].b[1]") is path
+    matches = path.find({"a": [{"b": [1, 2]}, {"b": [3]}, {"c": 4}]})
+    assert matches == [((("a", 0, "b", 1)), 2)]
+
+
+def test_compile_jsonpath_rejects_unsupported_syntax():
+    with pytest.raises(ValueError):
+        compile_jsonpath("$..value")
+
+
+def test_apply_substitution_rules_in_single_pass():
+    layout = {
+        "sections": [
+            {"visualContainers": [_visual("'[[[report_version]]]'", ["old", "other"]), _visual("'[[[app:x]]]'", ["keep"])]},
+            {"visualContainers": [_visual("no key", ["keep"])]},
+        ]
+    }
+    rules = [
+        SubstitutionRule(
+            "version",
+            "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value",
+            "$.config.singleVisual.objects.general[0].properties.paragraphs[*].textRuns[*].value",
+            r"^.*\[\[\[report_version\]\]\].*$",
+            "1.2.3",
+        ),
+        SubstitutionRule(
+            "app",
+            "$.config.singleVisual.vcObjects.general[0].properties.altText.expr.Literal.Value",
+            "$.config.singleVisual.objects.general[0].properties.paragraphs[0].textRuns[0].value",
+            r"^.*\[\[\[app:(?P<name>.*)\]\]\].*$",
+            lambda groups: groups["name"].upper(),
+        ),
+    ]
+
+    counts = apply_substitution_rules(layout, rules)
+
+    assert counts == [1, 1]
+    text_runs = [
+        [run["value"] for run in vc["config"]["singleVisual"]["objects"]["general"][0]["properties"]["paragraphs"][0]["textRuns"]]
+        for section in layout["sections"]
+        for vc in section["visualContainers"]
+    ]
+    assert text_runs == [["1.2.3", ""], ["X"], ["keep"]]
@@ -0,0 +1,20 @@
+import functools
+import operator
+
+from powercicd.shared.parallel import run_in_process_pool
+
+
+def fail(message: str):
+    raise ValueError(message)
+
+
+def test_run_in_process_pool():
+    tasks = {
+        "ok"     : functools.partial(operator.add, 1, 2),
+        "failed" : functools.partial(fail, "boom"),
+    }
+    for workers in [1, 2]:
+        results = run_in_process_pool(tasks, workers)
+        assert [result.name for result in results] == ["ok", "failed"]
+        assert results[0].error is None
+        assert results[1].error == "ValueError: boom"
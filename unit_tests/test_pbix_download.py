@@ -0,0 +1,127 @@
+import base64
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from powercicd.powerbi.pbix_download import DownloadIntegrityError, download_file
+from powercicd.powerbi.powerbi_transport import PowerBiTransport
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+def new_pbix_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as z:
+        z.writestr("DataModel", os.urandom(200_000))
+    return buffer.getvalue()
+
+
+class FakeExportHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    content          = b""
+    mode             = "ranges"   # ranges | gzip_header | gzip_sniffed
+    failing_ranges   = set()      # range starts answered with a server error
+    requests_log     = []
+
+    def do_GET(self):
+        cls   = type(self)
+        range_header = self.headers.get("Range")
+        cls.requests_log.append(range_header)
+        if cls.mode == "ranges" and range_header is not None:
+            start, end = [int(x) for x in range_header.removeprefix("bytes=").split("-")]
+            end = min(end, len(cls.content) - 1)
+            if start in cls.failing_ranges:
+                self._send(500, b"")
+                return
+            self._send(206, cls.content[start:end + 1], {
+                "Content-Range"         : f"bytes {start}-{end}/{len(cls.content)}",
+                "ETag"                  : '"v1"',
+                "x-ms-blob-content-md5" : base64.b64encode(hashlib.md5(cls.content).digest()).decode("ascii"),
+            })
+        elif cls.mode == "gzip_header":
+            self._send(200, gzip.compress(cls.content), {"Content-Encoding": "gzip"})
+        else:
+            self._send(200, gzip.compress(cls.content))
+
+    def _send(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    FakeExportHandler.content        = new_pbix_bytes()
+    FakeExportHandler.mode           = "ranges"
+    FakeExportHandler.failing_ranges = set()
+    FakeExportHandler.requests_log   = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeExportHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield PowerBiTransport(lambda: "token", api_base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+    server.shutdown()
+    server.server_close()
+
+
+def read_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def test_download_ranges_and_resume(api, tmp_dir):
+    file_path = f"{tmp_dir}/report.pbix"
+    range_size = 30_000
+    range_count = (len(FakeExportHandler.content) + range_size - 1) // range_size
+
+    # a failing range keeps the partial download
+    FakeExportHandler.failing_ranges = {90_000}
+    with pytest.raises(Exception):
+        download_file(api, "export", file_path, range_size=range_size, workers=3, verify_zip=True)
+    assert not os.path.exists(file_path)
+    assert os.path.exists(f"{file_path}.part")
+
+    # the download is resumed: only the probe and the missing range are requested
+    FakeExportHandler.failing_ranges = set()
+    FakeExportHandler.requests_log.clear()
+    download_file(api, "export", file_path, range_size=range_size, workers=3, verify_zip=True)
+    assert read_bytes(file_path) == FakeExportHandler.content
+    assert FakeExportHandler.requests_log == [f"bytes=0-{range_size - 1}", f"bytes=90000-{90_000 + range_size - 1}"]
+    assert not os.path.exists(f"{file_path}.part")
+    assert not os.path.exists(f"{file_path}.part.json")
+    assert range_count > 3
+
+
+@pytest.mark.parametrize("mode", ["gzip_header", "gzip_sniffed"])
+def test_download_without_range_support(api, tmp_dir, mode):
+    FakeExportHandler.mode = mode
+    file_path = f"{tmp_dir}/report.pbix"
+    download_file(api, "export", file_path, verify_zip=True)
+    assert read_bytes(file_path) == FakeExportHandler.content
+
+
+def test_download_integrity_check(api, tmp_dir):
+    FakeExportHandler.content = b"not a zip archive"
+    with pytest.raises(DownloadIntegrityError):
+        download_file(api, "export", f"{tmp_dir}/report.pbix", verify_zip=True)
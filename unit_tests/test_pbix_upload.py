@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from powercicd.powerbi.pbix_upload import import_pbix
+from powercicd.powerbi.powerbi_transport import PowerBiTransport
+
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+class FakeImportApiHandler(BaseHTTPRequestHandler):
+    # stand-in of the imports api and of the blob storage of the temporary upload locations
+    protocol_version = "HTTP/1.1"
+    state = {}
+
+    def _send_json(self, status: int, value: dict):
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        assert "chunked" not in self.headers.get("Transfer-Encoding", "")
+        return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def do_POST(self):
+        url   = urlparse(self.path)
+        body  = self._read_body()
+        state = self.state
+        assert self.headers["Authorization"] == "Bearer token"
+        if url.path.endswith("/imports/createTemporaryUploadLocation"):
+            self._send_json(200, {"Url": f"http://{self.headers['Host']}/blob/upload.pbix?sv=1&sig=secret"})
+        elif url.path.endswith("/imports"):
+            state["import_query"] = parse_qs(url.query)
+            if self.headers["Content-Type"].startswith("multipart/form-data"):
+                state["import_body"] = body
+            else:
+                file_url = json.loads(body)["fileUrl"]
+                state["import_file_url"] = file_url
+            self._send_json(202, {"id": "import-id"})
+        else:
+            self._send_json(404, {})
+
+    def do_PUT(self):
+        url   = urlparse(self.path)
+        query = parse_qs(url.query)
+        body  = self._read_body()
+        state = self.state
+        assert "Authorization" not in self.headers
+        assert query["sig"] == ["secret"]
+        with state["lock"]:
+            if query["comp"] == ["block"]:
+                state["blocks"][query["blockid"][0]] = body
+            else:
+                block_ids = [line.split("</Latest>")[0] for line in body.decode("utf-8").split("<Latest>")[1:]]
+                state["blob"] = b"".join(state["blocks"][block_id] for block_id in block_ids)
+        self._send_json(201, {})
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    FakeImportApiHandler.state = {"lock": threading.Lock(), "blocks": {}}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeImportApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pbix_file(tmp_dir):
+    file_path = f"{tmp_dir}/report.pbix"
+    with open(file_path, "wb") as f:
+        f.write(os.urandom(100_000))
+    return file_path
+
+
+def test_import_pbix_streamed(api_url, pbix_file):
+    api = PowerBiTransport(lambda: "token", api_base_url=api_url)
+    assert import_pbix(api, "group", "my report", pbix_file) == {"id": "import-id"}
+
+    state = FakeImportApiHandler.state
+    assert state["import_query"] == {"datasetDisplayName": ["my report"], "nameConflict": ["CreateOrOverwrite"]}
+    with open(pbix_file, "rb") as f:
+        content = f.read()
+    head, _, tail = state["import_body"].partition(b"\r\n\r\n")
+    assert b'filename="report.pbix"' in head
+    assert tail.startswith(content)
+    assert tail[len(content):].startswith(b"\r\n--")
+
+
+def test_import_pbix_from_temporary_upload(api_url, pbix_file):
+    api = PowerBiTransport(lambda: "token", api_base_url=api_url)
+    result = import_pbix(api, "group", "my report", pbix_file, large_file_threshold_bytes=10_000, block_size=7_000, workers=4)
+    assert result == {"id": "import-id"}
+
+    state = FakeImportApiHandler.state
+    assert len(state["blocks"]) == 15
+    with open(pbix_file, "rb") as f:
+        assert state["blob"] == f.read()
+    assert state["import_file_url"].endswith("/blob/upload.pbix?sv=1&sig=secret")
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import powercicd.powerbi.deploy_pipeline as deploy_pipeline
+from powercicd.powerbi.deploy_pipeline import BuiltReport
+
+from powercicd.powerbi.deployment_fingerprint import DATASET_FINGERPRINT_PARAMETER, compute_deployment_fingerprint
+from powercicd.powerbi.gateway_datasources import GatewayDatasourceIndex
+from powercicd.powerbi.powerbi_async_client import AsyncPowerBiClient
+from powercicd.powerbi.refresh_waiter import RefreshWaiter
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+class FakePowerBiClient:
+    def __init__(self):
+        self.lock       = threading.Lock()
+        self.calls      = []
+        self.reports    = {}
+        self.refreshing = {}
+
+    def new_refresh_waiter(self):
+        return RefreshWaiter(self.get_active_dataset_refreshes, initial_delay_seconds=0.001, timeout_seconds=10)
+
+    def record(self, *call):
+        with self.lock:
+            self.calls.append(call)
+        time.sleep(0.01)
+
+    def try_get_report_by_name(self, group_id, report_name):
+        self.record("try_get_report_by_name", report_name)
+        return self.reports.get(report_name)
+
+    def take_over_report(self, group_id, report_id):
+        self.record("take_over_report", report_id)
+
+    def import_report(self, group_id, report_name, file_path):
+        self.record("import_report", report_name)
+        self.reports[report_name] = {"Id": f"{report_name}-id", "DatasetId": f"{report_name}-dataset"}
+        self.refreshing[f"{report_name}-dataset"] = 2
+
+    def get_active_dataset_refreshes(self, group_id, dataset_id):
+        self.record("get_active_dataset_refreshes", dataset_id)
+        remaining = self.refreshing.get(dataset_id, 0)
+        self.refreshing[dataset_id] = max(0, remaining - 1)
+        return [{"status": "Unknown"}] * remaining
+
+    def update_dataset_parameters(self, group_id, dataset_id, dataset_parameters):
+        self.record("update_dataset_parameters", dataset_id, dataset_parameters)
+
+    def get_dataset_parameters(self, group_id, dataset_id):
+        self.record("get_dataset_parameters", dataset_id)
+        return {"DATASET_VERSION": "0.9.0"}
+
+    def get_gateway_datasource_index(self, gateway_type, refresh):
+        self.record("get_gateway_datasource_index")
+        return GatewayDatasourceIndex([{
+            "Id": "gw-ds-1", "ClusterId": "gw-1", "DatasourceType": "Sql", "ConnectionDetails": '{"server":"sql.example.com","database":"db"}',
+        }])
+
+    def get_dataset_datasources(self, group_id, dataset_id):
+        self.record("get_dataset_datasources", dataset_id)
+        return [{"datasourceType": "Sql", "connectionDetails": {"server": "SQL.example.com/", "database": "db"}, "datasourceId": "ds-1", "gatewayId": "gw-2"}]
+
+    def bind_dataset_to_gateway(self, group_id, dataset_id, gateway_id, datasource_ids):
+        self.record("bind_dataset_to_gateway", dataset_id, gateway_id, datasource_ids)
+
+    def trigger_dataset_refresh(self, group_id, dataset_id):
+        self.record("trigger_dataset_refresh", dataset_id)
+
+    def clone_report(self, group_id, report_id, final_report_name):
+        self.record("clone_report", report_id, final_report_name)
+
+
+def test_deploy_report_flow():
+    client = FakePowerBiClient()
+    asyncio.run(AsyncPowerBiClient(client).deploy_report(
+        group_id           = "group",
+        upload_report_name = "report 1.0.0",
+        final_report_name  = "report",
+        file_path          = "report.pbix",
+        dataset_parameters = {"DATASET_VERSION": "1.0.0"},
+    ))
+    calls = [call for call in client.calls if call[0] != "get_active_dataset_refreshes"]
+    assert ("update_dataset_parameters", "report 1.0.0-dataset", {"DATASET_VERSION": "1.0.0"}) in calls
+    assert ("trigger_dataset_refresh", "report 1.0.0-dataset") in calls
+    assert ("bind_dataset_to_gateway", "report 1.0.0-dataset", "gw-1", ["gw-ds-1"]) in calls
+    assert calls[-1] == ("clone_report", "report 1.0.0-id", "report")
+
+
+def test_deploy_report_without_fingerprint_parameter():
+    client = FakePowerBiClient()
+    async_client = AsyncPowerBiClient(client)
+    assert asyncio.run(async_client.get_deployed_fingerprint("group", "report")) is None
+
+    asyncio.run(async_client.deploy_report(
+        group_id           = "group",
+        upload_report_name = "report 1.0.0",
+        final_report_name  = "report",
+        file_path          = "report.pbix",
+        dataset_parameters = {"DATASET_VERSION": "1.0.0", DATASET_FINGERPRINT_PARAMETER: "abc"},
+    ))
+    # the model does not declare the fingerprint parameter: it is not set
+    assert ("update_dataset_parameters", "report 1.0.0-dataset", {"DATASET_VERSION": "1.0.0"}) in client.calls
+    assert asyncio.run(async_client.get_deployed_fingerprint("group", "report 1.0.0")) is None
+
+
+def test_deployment_fingerprint():
+    kwargs = dict(tree_hash="tree", powerapps_id_by_name=None, version="1.0.0", dataset_parameters={"A": "1"}, refresh_schedule=None)
+    fingerprint = compute_deployment_fingerprint(**kwargs)
+    assert compute_deployment_fingerprint(**{**kwargs, "dataset_parameters": {"A": "1", DATASET_FINGERPRINT_PARAMETER: fingerprint}}) == fingerprint
+    assert compute_deployment_fingerprint(**{**kwargs, "dataset_parameters": {"A": "2"}}) != fingerprint
+    assert compute_deployment_fingerprint(**{**kwargs, "version": "1.0.1"}) != fingerprint
+
+
+
+def test_deploy_reports_pipeline(monkeypatch):
+    # 8 components: "c2" fails to build, "c3" is up-to-date (same fingerprint), "c5" fails to deploy
+    component_configs = [SimpleNamespace(name=f"c{i}") for i in range(8)]
+    built          = []
+    deploy_started = []
+    release_deploy = None
+    build_error    = ValueError("build failed")
+    deploy_error   = ValueError("deploy failed")
+
+    async def build_component_report(pbi, project_config, component_config, **kwargs):
+        if component_config.name == "c2":
+            raise build_error
+        if component_config.name == "c3":
+            return None
+        built.append(component_config.name)
+        return BuiltReport(component_config, "group", f"{component_config.name} 1.0.0", f"{component_config.name}.pbix", {})
+
+    async def deploy_built_report(pbi, built_report):
+        deploy_started.append(built_report.component_config.name)
+        await release_deploy.wait()
+        # the deployments finish in the reverse order
+        await asyncio.sleep(0.01 * (8 - len(deploy_started)))
+        if built_report.component_config.name == "c5":
+            raise deploy_error
+
+    monkeypatch.setattr(deploy_pipeline, "build_component_report", build_component_report)
+    monkeypatch.setattr(deploy_pipeline, "deploy_built_report", deploy_built_report)
+
+    async def run():
+        nonlocal release_deploy
+        release_deploy = asyncio.Event()
+        pipeline = asyncio.create_task(deploy_pipeline.deploy_reports(
+            pbi               = FakePowerBiClient(),
+            project_config    = None,
+            component_configs = component_configs,
+            build_cache       = False,
+            concurrency       = 2,
+            prefetch          = 1,
+            layout_trace      = False,
+            layout_trace_gzip = False,
+            layout_workers    = 1,
+            force             = False,
+        ))
+        await asyncio.sleep(0.1)
+        # while the 2 deployments are blocked: 1 built report waits in the queue, 1 more waits to be put in it
+        assert deploy_started == ["c0", "c1"]
+        assert built == ["c0", "c1", "c4", "c5"]
+        release_deploy.set()
+        # both consumers receive an end marker: the pipeline completes
+        return await asyncio.wait_for(pipeline, timeout=10)
+
+    results = asyncio.run(run())
+    assert sorted(deploy_started) == ["c0", "c1", "c4", "c5", "c6", "c7"]
+    assert results == [None, None, build_error, None, None, deploy_error, None, None]
+
+
+@pytest.mark.parametrize("concurrency, prefetch", [(0, 1), (1, 0)])
+def test_deploy_reports_rejects_unbounded_pipeline(concurrency, prefetch):
+    with pytest.raises(ValueError):
+        asyncio.run(deploy_pipeline.deploy_reports(
+            pbi=FakePowerBiClient(), project_config=None, component_configs=[], build_cache=False, concurrency=concurrency,
+            prefetch=prefetch, layout_trace=False, layout_trace_gzip=False, layout_workers=1, force=False,
+        ))
+
+
+@pytest.mark.parametrize("build_cache", [True, False])
+def test_fingerprint_skip_honors_build_cache_flag(tmp_dir, build_cache):
+    os.makedirs(f"{tmp_dir}/my_report/src")
+    with open(f"{tmp_dir}/my_report/src/Version", "w") as f:
+        f.write("1.0")
+    project_config   = SimpleNamespace(project_root=tmp_dir, version=SimpleNamespace(resulting_version="1.0.0"))
+    component_config = SimpleNamespace(
+        name="my_report", group_name="group", report_name="report", component_root=f"{tmp_dir}/my_report",
+        dataset_parameters={}, powerapps_id_by_name=None, refresh_schedule=None,
+    )
+    fingerprints = []
+
+    class FakeAsyncClient:
+        async def get_group_by_name(self, group_name):
+            return {"Id": "group-id"}
+
+        async def get_deployed_fingerprint(self, group_id, report_name):
+            return fingerprints[0] if fingerprints else None
+
+    async def build():
+        return await deploy_pipeline.build_component_report(
+            pbi=FakeAsyncClient(), project_config=project_config, component_config=component_config, build_executor=None,
+            build_cache=build_cache, layout_trace=False, layout_trace_gzip=False, layout_workers=1, force=False,
+        )
+
+    # the fingerprint is computed before the build: the skip happens before the build executor is used
+    fingerprints.append(compute_deployment_fingerprint(
+        tree_hash=deploy_pipeline.hash_src_tree(f"{tmp_dir}/my_report/src"), powerapps_id_by_name=None, version="1.0.0",
+        dataset_parameters={"DATASET_VERSION": "1.0.0"}, refresh_schedule=None,
+    ))
+    assert asyncio.run(build()) is None
+    # the file hashes are only memoized in the build cache dir when the build cache is enabled
+    assert os.path.exists(f"{tmp_dir}/temp/build_cache/file_hashes.json") == build_cache
@@ -0,0 +1,158 @@
+import os
+import re
+import shutil
+import time
+
+import pytest
+from azure.core.credentials import AccessToken
+
+from powercicd.powerbi.powerbi_client import PowerBiWebClient
+from powercicd.shared.ttl_cache import TtlCache
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+class FakeResponse:
+    def __init__(self, value):
+        self.value = value
+
+    def json(self):
+        return {"value": self.value}
+
+
+class FakeTransport:
+    def __init__(self, reports):
+        self.calls   = []
+        self.reports = reports
+
+    def get(self, path, **kwargs):
+        self.calls.append(("GET", path, kwargs.get("params")))
+        if path.endswith("/reports"):
+            return FakeResponse(list(self.reports))
+        if path.endswith("/datasets"):
+            # ds-new: dataset of a report being imported concurrently, not listed yet
+            return FakeResponse([{"Id": "ds-old", "Name": "old"}, {"Id": "ds-final", "Name": "final"}, {"Id": "ds-new", "Name": "new"}])
+        if path.endswith("/gatewayClusterDatasources"):
+            return FakeResponse([{"Id": "gw-ds", "ClusterId": "gw", "GatewayType": "TenantCloud", "DatasourceType": "Sql", "ConnectionDetails": "{}"}])
+        return FakeResponse([{"Id": "group-id", "Name": "My 'group'"}])
+
+    def post(self, path, **kwargs):
+        self.calls.append(("POST", path, None))
+        return FakeResponse([])
+
+    def delete(self, path, **kwargs):
+        self.calls.append(("DELETE", path, None))
+        self.reports = [r for r in self.reports if not path.endswith(r["Id"])]
+        return FakeResponse([])
+
+
+def new_client(transport: FakeTransport) -> PowerBiWebClient:
+    client = PowerBiWebClient(tenant="tenant", keep_browser_open=False)
+    client._token = AccessToken("token", int(time.time()) + 3600)
+    client.api = transport
+    return client
+
+
+def test_metadata_cache():
+    transport = FakeTransport([
+        {"Id": "r-old", "Name": "report 0.9", "DatasetId": "ds-old"},
+        {"Id": "r-final", "Name": "report", "DatasetId": "ds-final"},
+    ])
+    client = new_client(transport)
+
+    assert client.get_group_by_name("My 'group'")["Id"] == "group-id"
+    assert client.get_group_by_name("My 'group'")["Id"] == "group-id"
+    assert client.try_get_report_by_name("group-id", "report")["Id"] == "r-final"
+    assert client.try_get_report_by_name("group-id", "report 0.9")["Id"] == "r-old"
+    assert client.try_get_report_by_name("group-id", "unknown") is None
+    assert transport.calls == [
+        ("GET", "v1.0/myorg/groups", {"$filter": "name eq 'My ''group'''"}),
+        ("GET", "v1.0/myorg/groups/group-id/reports", None),
+    ]
+
+    # the dry-run only lists what would be deleted, on fresh listings
+    transport.calls.clear()
+    result = client.cleanup_reports("group-id", r"report .+", exclude_report_names=["report"], dry_run=True)
+    assert [r["Id"] for r in result.reports] == ["r-old"]
+    assert [d["Id"] for d in result.datasets] == ["ds-old"]
+    assert transport.calls == [
+        ("GET", "v1.0/myorg/groups/group-id/reports", None),
+        ("GET", "v1.0/myorg/groups/group-id/datasets", None),
+    ]
+
+    # only the dataset of the deleted report is deleted, not the one without listed report
+    transport.calls.clear()
+    result = client.cleanup_reports("group-id", r"report .+", exclude_report_names=["report"])
+    assert result.failed == []
+    assert transport.calls == [
+        ("GET", "v1.0/myorg/groups/group-id/reports", None),
+        ("GET", "v1.0/myorg/groups/group-id/datasets", None),
+        ("DELETE", "v1.0/myorg/groups/group-id/reports/r-old", None),
+        ("DELETE", "v1.0/myorg/groups/group-id/datasets/ds-old", None),
+    ]
+    assert client.try_get_report_by_name("group-id", "report 0.9") is None
+
+
+def test_upload_report_regex():
+    from powercicd.cli import get_upload_report_regex
+
+    assert re.match(get_upload_report_regex("Sales"), "Sales 1.2.3")
+    assert re.match(get_upload_report_regex("Sales"), "Sales 1.2.34M")
+    assert not re.match(get_upload_report_regex("Sales"), "Sales Dashboard")
+    assert not re.match(get_upload_report_regex("Sales"), "Sales 1.2.3 copy")
+    assert not re.match(get_upload_report_regex("S.les"), "Sales 1.2.3")
+
+
+def test_ttl_cache_expiry_and_invalidation():
+    now = 0
+    cache = TtlCache(10, clock=lambda: now)
+    loads = []
+
+    def loader():
+        loads.append(now)
+        return len(loads)
+
+    assert cache.get_or_load("key", loader) == 1
+    now = 5
+    assert cache.get_or_load("key", loader) == 1
+    now = 11
+    assert cache.get_or_load("key", loader) == 2
+    cache.invalidate("key")
+    assert cache.get_or_load("key", loader) == 3
+
+    # a value loaded while an invalidation happens is not stored
+    def invalidating_loader():
+        cache.invalidate("key")
+        return "stale"
+
+    cache.invalidate("key")
+    assert cache.get_or_load("key", invalidating_loader) == "stale"
+    assert cache.get_or_load("key", loader) == 4
+
+
+def test_gateway_datasource_index_fetched_once(tmp_dir):
+    transport = FakeTransport([])
+    client = new_client(transport)
+    client.gateway_cache_dir = tmp_dir
+    client.gateway_cache_ttl_seconds = 60
+
+    index = client.get_gateway_datasource_index("TenantCloud")
+    assert client.get_gateway_datasource_index("TenantCloud") is index
+    assert transport.calls == [("GET", "v2.0/myorg/me/gatewayClusterDatasources", None)]
+
+    # a later run reuses the disk cache
+    other_transport = FakeTransport([])
+    other_client = new_client(other_transport)
+    other_client.gateway_cache_dir = tmp_dir
+    other_client.gateway_cache_ttl_seconds = 60
+    assert other_client.get_gateway_datasource_index("TenantCloud").from_disk
+    assert other_transport.calls == []
@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from powercicd.powerbi.powerbi_transport import PowerBiTransport, Throttle
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # (method, path) -> list of the statuses to answer, the last one is repeated
+    statuses = {}
+    requests_log = []
+
+    def _answer(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.requests_log.append((self.command, self.path, self.headers.get("Authorization")))
+
+        statuses = self.statuses[(self.command, self.path)]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        body = json.dumps({"value": [status]}).encode("utf-8")
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET  = _answer
+    do_POST = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    FakeApiHandler.statuses = {}
+    FakeApiHandler.requests_log = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_transport_retries_and_swaps_token(api_url):
+    FakeApiHandler.statuses = {
+        ("GET", "/v1.0/myorg/groups")       : [429, 503, 200],
+        ("POST", "/v1.0/myorg/imports")     : [429, 200],
+        ("POST", "/v1.0/myorg/refreshes")   : [503],
+    }
+    tokens = iter(["token-1", "token-2", "token-3"])
+    transport = PowerBiTransport(lambda: next(tokens), api_base_url=api_url, backoff_factor=0)
+
+    # throttling and server errors are retried for GET
+    assert transport.get("v1.0/myorg/groups").json() == {"value": [200]}
+    # throttling is retried for POST
+    assert transport.post("v1.0/myorg/imports", json={}).json() == {"value": [200]}
+    # server errors are not retried for POST
+    with pytest.raises(requests.HTTPError):
+        transport.post("v1.0/myorg/refreshes", json={})
+
+    assert [(method, path) for method, path, _ in FakeApiHandler.requests_log] == [
+        ("GET", "/v1.0/myorg/groups"),
+        ("GET", "/v1.0/myorg/groups"),
+        ("GET", "/v1.0/myorg/groups"),
+        ("POST", "/v1.0/myorg/imports"),
+        ("POST", "/v1.0/myorg/imports"),
+        ("POST", "/v1.0/myorg/refreshes"),
+    ]
+    # the new token of each call is set on the same session
+    assert [auth for _, _, auth in FakeApiHandler.requests_log] == [
+        "Bearer token-1", "Bearer token-1", "Bearer token-1",
+        "Bearer token-2", "Bearer token-2",
+        "Bearer token-3",
+    ]
+
+
+def test_throttle_pauses_all_requests():
+    now, sleeps = 100.0, []
+    throttle = Throttle(clock=lambda: now, sleep=sleeps.append)
+    throttle.wait()
+    throttle.pause(30)
+    throttle.pause(10)  # a shorter pause does not shorten the running one
+    now = 110.0
+    throttle.wait()
+    assert sleeps == [20.0]
@@ -1,3 +1,4 @@
+import gzip
 import json
 import os
 import shutil
@@ -5,7 +6,9 @@ import zipfile
 
 import pytest
 
-from powercicd.powerbi.powerbi_utils import convert_pbix_to_src_code, convert_src_code_to_pbix
+from powercicd.powerbi.build_cache import PbixBuildCache
+import powercicd.powerbi.powerbi_utils as powerbi_utils
+from powercicd.powerbi.powerbi_utils import convert_pbix_to_src_code, convert_src_code_to_pbix, convert_src_code_to_original_layout, encode_original_layout
 from jsonpath_ng.ext import parse
 
 THIS_FILE_DIR = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
@@ -65,3 +68,117 @@ def test_convert_src_code_to_pbix(tmp_dir):
 
     assert "the build will replace this content by the report version" in content
     assert "'/providers/Microsoft.PowerApps/apps/b944ef36-81f7-482c-a6d6-f29c9f89eabc'" in content
+
+
+def test_convert_src_code_to_pbix_with_build_cache(tmp_dir):
+    src_folder  = f"{THIS_FILE_DIR}/test_samples/test_report"
+    build_cache = PbixBuildCache(f"{tmp_dir}/build_cache")
+    powerapps_id_by_name = {
+        "my_powerapps_app": "b944ef36-81f7-482c-a6d6-f29c9f89eabc"
+    }
+
+    def build_layout(pbix_file, version):
+        convert_src_code_to_pbix(src_folder, pbix_file, f"{tmp_dir}/tmp_dir", powerapps_id_by_name, version, build_cache)
+        with zipfile.ZipFile(pbix_file, 'r') as zip_ref:
+            return zip_ref.read("Report/Layout")
+
+    uncached_layout = build_layout(f"{tmp_dir}/uncached.pbix", "1.0.1")
+    assert len(os.listdir(f"{tmp_dir}/build_cache/pbix")) == 1
+    assert len(os.listdir(f"{tmp_dir}/build_cache/layout")) == 1
+
+    # same inputs: the pbix is served from the cache
+    assert build_layout(f"{tmp_dir}/cached.pbix", "1.0.1") == uncached_layout
+    assert len(os.listdir(f"{tmp_dir}/build_cache/pbix")) == 1
+
+    # version bump: the encoded layout is reused and only the substitution is applied again
+    bumped_layout = build_layout(f"{tmp_dir}/bumped.pbix", "1.0.2")
+    assert "1.0.2" in bumped_layout.decode('utf-16 le')
+    assert bumped_layout == uncached_layout.decode('utf-16 le').replace("1.0.1", "1.0.2").encode('utf-16 le')
+    assert len(os.listdir(f"{tmp_dir}/build_cache/pbix")) == 2
+    assert len(os.listdir(f"{tmp_dir}/build_cache/layout")) == 1
+
+
+def test_build_cache_eviction(tmp_dir):
+    build_cache = PbixBuildCache(f"{tmp_dir}/build_cache", max_size_bytes=150)
+    for i in range(3):
+        pbix_file = f"{tmp_dir}/{i}.pbix"
+        with open(pbix_file, 'wb') as f:
+            f.write(b"x" * 100)
+        os.utime(pbix_file)
+        build_cache.put_pbix(f"key{i}", pbix_file)
+    assert os.listdir(f"{tmp_dir}/build_cache/pbix") == ["key2.pbix"]
+
+
+def test_convert_pbix_to_src_code_with_layout_trace(tmp_dir):
+    pbix_file = f"{THIS_FILE_DIR}/test_samples/test_report.pbix"
+
+    convert_pbix_to_src_code(pbix_file, f"{tmp_dir}/src_dir", f"{tmp_dir}/no_trace")
+    assert not os.path.exists(f"{tmp_dir}/no_trace")
+
+    convert_pbix_to_src_code(pbix_file, f"{tmp_dir}/src_dir", f"{tmp_dir}/trace", layout_trace=True, layout_trace_gzip=True)
+    assert sorted(os.listdir(f"{tmp_dir}/trace/layout_trace")) == [
+        "1_decoding_string_jsons.patch.json.gz",
+        "2_substitution.patch.json.gz",
+    ]
+    with gzip.open(f"{tmp_dir}/trace/layout_trace/2_substitution.patch.json.gz", 'rt', encoding='utf-8') as f:
+        ops = json.load(f)
+    assert {op["value"] for op in ops} == {"REPORT_VERSION_REMOVED_BY_BUILD_SCRIPT", "POWERAPPS_APP_ID_REMOVED_BY_BUILD_SCRIPT"}
+    assert all(op["op"] == "replace" for op in ops)
+
+
+def test_sharded_layout_round_trip(tmp_dir):
+    pbix_file  = f"{THIS_FILE_DIR}/test_samples/test_report.pbix"
+    src_folder = f"{tmp_dir}/src_dir"
+    convert_pbix_to_src_code(pbix_file, src_folder, f"{tmp_dir}/tmp_dir", layout_format="sharded")
+
+    assert not os.path.exists(f"{src_folder}/Report/Layout.json")
+    assert os.path.exists(f"{src_folder}/Report/Layout.manifest.json")
+    section_dirs = os.listdir(f"{src_folder}/Report/sections")
+    assert len(section_dirs) == 1
+    assert len(os.listdir(f"{src_folder}/Report/sections/{section_dirs[0]}/visuals")) == 5
+
+    powerapps_id_by_name = {
+        "my_powerapps_app": "b944ef36-81f7-482c-a6d6-f29c9f89eabc"
+    }
+    build_cache = PbixBuildCache(f"{tmp_dir}/build_cache")
+    layouts = []
+    for src, pbix, cache in [
+        (f"{THIS_FILE_DIR}/test_samples/test_report", f"{tmp_dir}/single.pbix", None),
+        (src_folder, f"{tmp_dir}/sharded.pbix", build_cache),
+        (src_folder, f"{tmp_dir}/sharded_cached.pbix", build_cache),
+    ]:
+        convert_src_code_to_pbix(src, pbix, f"{tmp_dir}/tmp_dir", powerapps_id_by_name, "1.0.0", cache)
+        with zipfile.ZipFile(pbix, 'r') as zip_ref:
+            names = zip_ref.namelist()
+            assert not any(name.startswith("Report/sections/") or name.startswith("Report/Layout.") for name in names)
+            layouts.append(zip_ref.read("Report/Layout"))
+        # invalidate the pbix entries, so that the next build goes through the shard cache
+        shutil.rmtree(f"{tmp_dir}/build_cache/pbix", ignore_errors=True)
+
+    assert layouts[0] == layouts[1] == layouts[2]
+
+
+def test_parallel_embedded_json_processing_is_identical_to_serial(monkeypatch):
+    with open(f"{THIS_FILE_DIR}/test_samples/test_report/Report/Layout.json", 'r', encoding='utf-8') as f:
+        src_layout = json.load(f)
+    # 3 sections with 40 visual containers each
+    src_layout["sections"] = [
+        {**src_layout["sections"][0], "visualContainers": src_layout["sections"][0]["visualContainers"] * 8}
+        for _ in range(3)
+    ]
+
+    def encode(workers):
+        layout = json.loads(json.dumps(src_layout))
+        convert_src_code_to_original_layout(layout, {}, "1.0.0", workers=workers)
+        return encode_original_layout(layout)
+
+    serial_layout = encode(1)
+    monkeypatch.setattr(powerbi_utils, "PARALLEL_MIN_VISUAL_CONTAINERS", 1)
+    monkeypatch.setattr(powerbi_utils, "PARALLEL_CHUNK_SIZE", 16)
+    assert encode(2) == serial_layout
+
+    decoded_layout = json.loads(serial_layout.decode('utf-16 le'))
+    powerbi_utils.decode_embedded_jsons(powerbi_utils.get_visual_containers_by_section(decoded_layout), workers=2)
+    serially_decoded_layout = json.loads(serial_layout.decode('utf-16 le'))
+    powerbi_utils.decode_embedded_jsons(powerbi_utils.get_visual_containers_by_section(serially_decoded_layout), workers=1)
+    assert json.dumps(decoded_layout) == json.dumps(serially_decoded_layout)
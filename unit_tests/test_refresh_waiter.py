@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+import pytest
+
+from powercicd.powerbi.refresh_waiter import RefreshWaiter
+
+
+def test_refresh_waiter_tracks_many_datasets():
+    # number of polls returning an active refresh, per dataset
+    remaining_active_polls = {"ds-1": 0, "ds-2": 2, "ds-3": 4}
+    polls = {dataset_id: 0 for dataset_id in remaining_active_polls}
+    lock = threading.Lock()
+
+    def get_active_refreshes(group_id, dataset_id):
+        with lock:
+            polls[dataset_id] += 1
+            return [{"status": "Unknown"}] if polls[dataset_id] <= remaining_active_polls[dataset_id] else []
+
+    waiter = RefreshWaiter(get_active_refreshes, initial_delay_seconds=0.001, max_delay_seconds=0.004)
+
+    async def run():
+        # a second waiter of the same dataset shares its polling
+        return await asyncio.gather(
+            waiter.wait_all([("group", "ds-1"), ("group", "ds-2"), ("group", "ds-3")]),
+            waiter.wait("group", "ds-3"),
+        )
+
+    results, shared_result = asyncio.run(run())
+    assert {key: result.polls for key, result in results.items()} == {
+        ("group", "ds-1"): 1,
+        ("group", "ds-2"): 3,
+        ("group", "ds-3"): 5,
+    }
+    assert shared_result == results[("group", "ds-3")]
+    assert polls == {"ds-1": 1, "ds-2": 3, "ds-3": 5}
+
+
+def test_refresh_waiter_timeout_and_backoff():
+    waiter = RefreshWaiter(lambda group_id, dataset_id: [{"status": "Unknown"}], initial_delay_seconds=0.001, timeout_seconds=0.01)
+    with pytest.raises(TimeoutError):
+        asyncio.run(waiter.wait("group", "ds"))
+
+    waiter = RefreshWaiter(lambda group_id, dataset_id: [], initial_delay_seconds=2, max_delay_seconds=60, jitter=0)
+    assert [waiter.get_delay(polls) for polls in range(1, 8)] == [2, 4, 8, 16, 32, 60, 60]
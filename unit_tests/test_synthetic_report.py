@@ -0,0 +1,33 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from benchmarks.synthetic_report import generate_src_report
+from powercicd.powerbi.powerbi_utils import convert_pbix_to_src_code, convert_src_code_to_pbix
+
+THIS_FILE_DIR = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+def test_generate_src_report_is_convertible(tmp_dir):
+    src_folder = f"{tmp_dir}/src"
+    generate_src_report(src_folder, sections=3, visuals_per_section=7, datamodel_size_bytes=3000)
+
+    assert os.path.getsize(f"{src_folder}/DataModel") == 3000
+    with open(f"{src_folder}/Report/Layout.json", 'r', encoding='utf-8') as f:
+        layout = json.load(f)
+    assert [len(section["visualContainers"]) for section in layout["sections"]] == [7, 7, 7]
+
+    convert_src_code_to_pbix(src_folder, f"{tmp_dir}/report.pbix", f"{tmp_dir}/tmp", {"my_powerapps_app": "id"}, "1.0.0")
+    convert_pbix_to_src_code(f"{tmp_dir}/report.pbix", f"{tmp_dir}/src_roundtrip", f"{tmp_dir}/tmp")
+    assert os.path.exists(f"{tmp_dir}/src_roundtrip/Report/Layout.json")
@@ -0,0 +1,45 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from powercicd.shared.versioning import CommitCountCache, compute_version
+
+THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+def git(repo_dir, *args):
+    subprocess.run(["git", "-C", repo_dir, "-c", "user.name=test", "-c", "user.email=test@example.com", *args], check=True, capture_output=True)
+
+
+def test_compute_version(tmp_dir, monkeypatch):
+    repo_dir  = f"{tmp_dir}/my project"
+    cache_dir = f"{repo_dir}/temp/version_cache"
+    os.makedirs(repo_dir)
+    git(repo_dir, "init")
+    assert compute_version(repo_dir, 1, 2, 0, cache_dir=cache_dir) == "1.2.0"
+
+    for i in range(3):
+        git(repo_dir, "commit", "--allow-empty", "-m", f"commit {i}")
+    assert compute_version(repo_dir, 1, 2, 1, cache_dir=cache_dir) == "1.2.2"
+    # the commit count is memoized, and its cache does not make the work tree dirty
+    head_oid = subprocess.run(["git", "-C", repo_dir, "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    assert CommitCountCache(cache_dir).get(head_oid) == 3
+    assert compute_version(repo_dir, 1, 2, 1, cache_dir=cache_dir) == "1.2.2"
+
+    with open(f"{repo_dir}/file.txt", "w") as f:
+        f.write("modified")
+    assert compute_version(repo_dir, 1, 2, 1, cache_dir=cache_dir) == "1.2.2M"
+
+    monkeypatch.setenv("BUILD_NUMBER", "42")
+    assert compute_version(repo_dir, 1, 2, 1, build_number_env_var="BUILD_NUMBER", cache_dir=cache_dir) == "1.2.42M"
@@ -0,0 +1,88 @@
+import io
+import os
+import shutil
+import zipfile
+
+import pytest
+
+from powercicd.powerbi.zip_utils import repack_zip
+
+THIS_FILE_DIR = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
+
+
+@pytest.fixture
+def tmp_dir(request):
+    r = f"{THIS_FILE_DIR}/tmp/{request.node.name}"
+    if os.path.exists(r):
+        shutil.rmtree(r)
+    os.makedirs(r, exist_ok=True)
+    yield r
+
+
+class NonSeekableStream(io.RawIOBase):
+    def __init__(self, target):
+        self.target = target
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.target.write(b)
+
+
+def test_repack_zip_copies_untouched_entries_raw(tmp_dir):
+    source_path = f"{THIS_FILE_DIR}/test_samples/test_report.pbix"
+    target_path = f"{tmp_dir}/repacked.pbix"
+
+    repack_zip(source_path, target_path, {"Report/Layout": b"new layout", "Added": b"added"})
+
+    with zipfile.ZipFile(source_path) as source_zip, zipfile.ZipFile(target_path) as target_zip:
+        assert target_zip.testzip() is None
+        assert target_zip.namelist() == source_zip.namelist() + ["Added"]
+        assert target_zip.read("Report/Layout") == b"new layout"
+        assert target_zip.read("Added") == b"added"
+        for source_info in source_zip.infolist():
+            if source_info.filename == "Report/Layout":
+                continue
+            target_info = target_zip.getinfo(source_info.filename)
+            assert (target_info.compress_type, target_info.CRC, target_info.compress_size, target_info.date_time) == \
+                   (source_info.compress_type, source_info.CRC, source_info.compress_size, source_info.date_time)
+            assert target_zip.read(source_info.filename) == source_zip.read(source_info.filename)
+
+
+def test_repack_zip_with_data_descriptors(tmp_dir):
+    source_path = f"{tmp_dir}/streamed.zip"
+    target_path = f"{tmp_dir}/repacked.zip"
+    with open(source_path, 'wb') as f:
+        with zipfile.ZipFile(NonSeekableStream(f), 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("a", b"a" * 1000)
+            zip_ref.writestr("b", b"b" * 1000)
+
+    repack_zip(source_path, target_path, {"b": b"replaced"})
+
+    with zipfile.ZipFile(target_path) as target_zip:
+        assert target_zip.testzip() is None
+        assert target_zip.read("a") == b"a" * 1000
+        assert target_zip.read("b") == b"replaced"
+
+
+def test_repack_zip64_and_utf8_names(tmp_dir, monkeypatch):
+    source_path = f"{tmp_dir}/source.zip"
+    target_path = f"{tmp_dir}/repacked.zip"
+    with zipfile.ZipFile(source_path, 'w', zipfile.ZIP_STORED) as zip_ref:
+        zip_ref.writestr("Réport/Layout", b"layout" * 100)
+        zip_ref.writestr("DataModel", b"model" * 100)
+
+    # every size and offset above 100 bytes requires the zip64 records
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 100)
+    repack_zip(source_path, target_path, {"DataModel": b"new model" * 100})
+    monkeypatch.undo()
+
+    with zipfile.ZipFile(target_path) as target_zip:
+        assert target_zip.testzip() is None
+        assert target_zip.namelist() == ["Réport/Layout", "DataModel"]
+        assert target_zip.read("Réport/Layout") == b"layout" * 100
+        assert target_zip.read("DataModel") == b"new model" * 100
+        assert target_zip.getinfo("DataModel").header_offset > 100
+    with open(target_path, 'rb') as f:
+        assert b"PK\006\006" in f.read()